@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import fcntl
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, tuple_, and_
+from app import db
+from models import Product, Allocation, StockMovement
+from timeutils import utcnow
+
+# Rows committed less than this long ago are left for the next run, so a
+# slow transaction cannot commit behind the watermark
+EXPORT_SAFETY_LAG = timedelta(minutes=5)
+
+EXPORT_BATCH_SIZE = 5000
+
+FILE_EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+ExportSpec = namedtuple('ExportSpec', 'model time_column columns where')
+
+# Exported tables; rows are immutable once they match ``where``, so a
+# (time, id) watermark is enough to export each row exactly once
+EXPORTS = {
+    'allocations': ExportSpec(
+        Allocation, 'approved_at',
+        ('id', 'product_id', 'warehouse_id', 'user_id', 'work_number', 'quantity', 'status',
+         'allocated_at', 'approved_at'),
+        Allocation.status != 'pending',
+    ),
+    'stock_movements': ExportSpec(
+        StockMovement, 'created_at',
+        ('id', 'product_id', 'warehouse_id', 'user_id', 'movement_type', 'quantity',
+         'previous_quantity', 'new_quantity', 'created_at'),
+        None,
+    ),
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("Exportação analítica requer o pacote pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def export_dir():
+    return current_app.config.get('ANALYTICS_EXPORT_DIR') or os.path.join(current_app.instance_path, 'analytics')
+
+
+def _schema(pa, spec):
+    types = {
+        'work_number': pa.string(),
+        'status': pa.dictionary(pa.int8(), pa.string()),
+        'movement_type': pa.dictionary(pa.int8(), pa.string()),
+        'allocated_at': pa.timestamp('us', tz='UTC'),
+        'approved_at': pa.timestamp('us', tz='UTC'),
+        'created_at': pa.timestamp('us', tz='UTC'),
+        'id': pa.int64(),
+    }
+    fields = [pa.field(name, types.get(name, pa.int32())) for name in spec.columns]
+    fields.insert(2, pa.field('product_code', pa.string()))
+    return pa.schema(fields)
+
+
+def _read_state(directory):
+    try:
+        with open(os.path.join(directory, '_state.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_state(directory, state):
+    path = os.path.join(directory, '_state.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def export_all(fmt=None):
+    """Append rows committed since the last run to monthly partition files
+
+    Returns {table: rows exported}. Safe to run on a schedule: a lock file
+    keeps concurrent runs from exporting the same rows twice.
+    """
+    fmt = fmt or current_app.config.get('ANALYTICS_EXPORT_FORMAT', 'parquet')
+    if fmt not in FILE_EXTENSIONS:
+        raise ValueError(f'formato desconhecido: {fmt}')
+    pa = _pyarrow()
+
+    directory = export_dir()
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = _read_state(directory)
+        counts = {}
+        for table, spec in EXPORTS.items():
+            counts[table], state[table] = _export_table(pa, directory, table, spec, fmt, state.get(table))
+        state['last_run'] = utcnow().isoformat()
+        _write_state(directory, state)
+    return counts
+
+
+def _export_table(pa, directory, table, spec, fmt, watermark):
+    model = spec.model
+    time_column = getattr(model, spec.time_column)
+    columns = [getattr(model, name) for name in spec.columns]
+
+    stmt = select(*columns[:2], Product.code, *columns[2:]).join(Product, model.product_id == Product.id)
+    conditions = [time_column.isnot(None), time_column < utcnow() - EXPORT_SAFETY_LAG]
+    if spec.where is not None:
+        conditions.append(spec.where)
+    if watermark:
+        last_time = datetime.fromisoformat(watermark['time'])
+        conditions.append(tuple_(time_column, model.id) > tuple_(last_time, watermark['id']))
+    stmt = stmt.where(and_(*conditions)).order_by(time_column, model.id)
+
+    schema = _schema(pa, spec)
+    time_index = schema.names.index(spec.time_column)
+    run_id = utcnow().strftime('%Y%m%dT%H%M%S')
+    writers = {}
+    exported = 0
+    last_row = None
+
+    # yield_per streams rows through a server-side cursor where supported
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    completed = False
+    try:
+        for rows in result.partitions():
+            by_month = {}
+            for row in rows:
+                by_month.setdefault(row[time_index].strftime('%Y-%m'), []).append(row)
+            for month, month_rows in by_month.items():
+                writer = writers.get(month)
+                if writer is None:
+                    writer = writers[month] = _open_writer(pa, directory, table, month, run_id, schema, fmt)
+                batch = pa.RecordBatch.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(zip(*month_rows), schema)],
+                    schema=schema
+                )
+                writer[0].write_batch(batch)
+            exported += len(rows)
+            last_row = rows[-1]
+        completed = True
+    finally:
+        # Files only become visible once the whole table was read
+        for writer, tmp_path, path in writers.values():
+            writer.close()
+            if completed:
+                os.replace(tmp_path, path)
+            else:
+                os.remove(tmp_path)
+        db.session.rollback()
+
+    if last_row is None:
+        return 0, watermark
+    logging.info(f"Exportação analítica: {exported} linhas de {table}")
+    return exported, {'time': last_row[time_index].isoformat(), 'id': last_row[0]}
+
+
+def _open_writer(pa, directory, table, month, run_id, schema, fmt):
+    partition = os.path.join(directory, table, f'month={month}')
+    os.makedirs(partition, exist_ok=True)
+    path = os.path.join(partition, f'part-{run_id}.{FILE_EXTENSIONS[fmt]}')
+    tmp_path = path + '.tmp'
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(tmp_path, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(tmp_path, schema)
+    return writer, tmp_path, path
+
+
+def open_dataset(table, directory=None):
+    """Exported table as a pyarrow dataset; files are memory-mapped when scanned"""
+    _pyarrow()
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    base = os.path.join(directory or export_dir(), table)
+    files = {'parquet': [], 'ipc': []}
+    for root, _, names in os.walk(base):
+        for name in sorted(names):
+            if name.endswith('.parquet'):
+                files['parquet'].append(os.path.join(root, name))
+            elif name.endswith('.arrow'):
+                files['ipc'].append(os.path.join(root, name))
+
+    filesystem = fs.LocalFileSystem(use_mmap=True)
+    datasets = [
+        ds.dataset(paths, format=fmt, partitioning='hive', partition_base_dir=base, filesystem=filesystem)
+        for fmt, paths in files.items() if paths
+    ]
+    if not datasets:
+        return None
+    return datasets[0] if len(datasets) == 1 else ds.dataset(datasets)
+
+
+# Grouping keys accepted by consumption()
+CONSUMPTION_KEYS = ('month', 'product_code', 'work_number', 'warehouse_id')
+
+
+def consumption(by=('month', 'product_code'), start=None, end=None, directory=None):
+    """Approved quantities grouped by the given keys, from the exported files
+
+    ``start`` and ``end`` are inclusive months ('YYYY-MM'). Returns a list
+    of dicts sorted by the grouping keys; never touches the database.
+    """
+    if any(key not in CONSUMPTION_KEYS for key in by):
+        raise ValueError(f'agrupamento inválido: {by}')
+    dataset = open_dataset('allocations', directory)
+    if dataset is None:
+        return []
+
+    import pyarrow.dataset as ds
+    condition = ds.field('status') == 'approved'
+    if start:
+        condition &= ds.field('month') >= start
+    if end:
+        condition &= ds.field('month') <= end
+
+    table = dataset.to_table(columns=list(by) + ['quantity', 'id'], filter=condition)
+    table = table.group_by(list(by)).aggregate([('quantity', 'sum'), ('id', 'count')])
+    table = table.rename_columns(list(by) + ['quantity', 'allocations']).sort_by([(key, 'ascending') for key in by])
+    return table.to_pylist()
+
+
+def last_export_time():
+    """When export_all last finished, or None"""
+    value = _read_state(export_dir()).get('last_run')
+    return datetime.fromisoformat(value) if value else None
+
+
+def main():
+    from app import app
+
+    if len(sys.argv) < 2:
+        print("📊 Exportação analítica")
+        print("\nComandos disponíveis:")
+        print("  export [parquet|arrow]            - Exporta alocações e movimentações novas")
+        print("  consumption [chaves] [de] [até]   - Consumo aprovado, ex.: consumption month,work_number 2025-01 2025-06")
+        return
+
+    command = sys.argv[1].lower()
+    with app.app_context():
+        if command == "export":
+            counts = export_all(sys.argv[2] if len(sys.argv) > 2 else None)
+            for table, count in counts.items():
+                print(f"✅ {table}: {count} linhas exportadas")
+        elif command == "consumption":
+            by = tuple(sys.argv[2].split(',')) if len(sys.argv) > 2 else ('month', 'product_code')
+            rows = consumption(by, *sys.argv[3:5])
+            for row in rows:
+                print('\t'.join(str(row[key]) for key in by + ('quantity', 'allocations')))
+        else:
+            print(f"❌ Comando desconhecido: {command}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+from flask import request, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy import func
+from werkzeug.datastructures import MultiDict
+from app import app, db, cache
+from cache import product_tag
+from models import Product, Allocation, ChangeLogEntry
+from forms import ProductionRequestForm, AllocationForm, StockAdjustmentForm
+from picklist import build_pick_list, pick_list_args, PICK_LINE_FIELDS
+from stock import resolve_warehouse, place_hold, site_available, site_quantity, site_stock
+from serializers import requested_fields, product_rows
+from idempotency import find_key, claim_key, new_key, MAX_KEY_LENGTH
+from sync_tokens import settled_token, read_changes
+from timeutils import utcnow
+from utils import log_stock_movement
+from works import open_work
+
+# Columns sent to sync clients, in row order
+CATALOG_FIELDS = (
+    'id', 'code', 'name', 'supplier_reference', 'location', 'quantity', 'unit',
+    'supplier_name', 'photo_filename', 'updated_at'
+)
+
+SNAPSHOT_PAGE_SIZE = 500
+MAX_SNAPSHOT_PAGE_SIZE = 2000
+MAX_CHANGES = 1000
+MAX_BATCH_REQUESTS = 100
+
+# Product fields returned for a scanned code, besides the stock per site
+SCAN_FIELDS = ('id', 'code', 'name', 'location', 'unit', 'photo_filename')
+
+
+def _catalog_fields():
+    """CATALOG_FIELDS, or the subset named by ?fields=; the id always comes first"""
+    fields = requested_fields(CATALOG_FIELDS)
+    return ('id',) + tuple(field for field in fields if field != 'id')
+
+
+def _catalog_rows(query, fields):
+    return [
+        [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+        for row in product_rows(fields, query=query)
+    ]
+
+
+def _current_token():
+    return str(settled_token(db.session.connection()))
+
+
+def _parse_token(value):
+    try:
+        token = int(value)
+    except (TypeError, ValueError):
+        return None
+    return token if token >= 0 else None
+
+
+@app.route('/api/v1/catalog/snapshot')
+@login_required
+def api_catalog_snapshot():
+    """Full catalog in pages of compact rows, ordered by id"""
+    after = request.args.get('after', 0, type=int)
+    limit = min(request.args.get('limit', SNAPSHOT_PAGE_SIZE, type=int), MAX_SNAPSHOT_PAGE_SIZE)
+    try:
+        fields = _catalog_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Taken before reading and held back past transactions still in flight,
+    # so anything changed meanwhile is sent again as a delta
+    token = _current_token()
+    rows = _catalog_rows(
+        Product.active().filter(Product.id > after).order_by(Product.id).limit(limit), fields
+    )
+
+    return jsonify({
+        'fields': fields,
+        'rows': rows,
+        'next': rows[-1][0] if len(rows) == limit else None,
+        'token': token,
+    })
+
+
+@app.route('/api/v1/catalog/changes')
+@login_required
+def api_catalog_changes():
+    """Products inserted, updated or deleted since a change token"""
+    since = _parse_token(request.args.get('since'))
+    if since is None:
+        return jsonify({'error': 'Parâmetro since inválido.'}), 400
+    try:
+        fields = _catalog_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Tokens older than the retained change log need a new snapshot
+    oldest = db.session.query(func.min(ChangeLogEntry.id)).scalar()
+    if oldest is not None and since < oldest - 1:
+        return jsonify({'error': 'Token expirado. Baixe o catálogo completo novamente.'}), 410
+
+    # Recent changes come back again with the next token, see sync_tokens
+    entries, token, more = read_changes(db.session.connection(), since, MAX_CHANGES)
+    if not entries:
+        return jsonify({'fields': fields, 'upserts': [], 'deleted': [], 'token': str(since), 'more': False})
+
+    changed_ids = {entity_id for _, entity_id in entries}
+    # Archived products are sent as deleted
+    upserts = _catalog_rows(Product.active().filter(Product.id.in_(changed_ids)).order_by(Product.id), fields)
+    existing = {row[0] for row in upserts}
+
+    return jsonify({
+        'fields': fields,
+        'upserts': upserts,
+        'deleted': sorted(changed_ids - existing),
+        'token': str(token),
+        'more': more,
+    })
+
+
+@app.route('/api/v1/pick_list')
+@login_required
+def api_pick_list():
+    """Pick list grouped by work, lines as compact rows in walking order"""
+    if current_user.role != 'almoxarifado':
+        return jsonify({'error': 'Acesso negado.'}), 403
+
+    try:
+        params = pick_list_args(request.args)
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos.'}), 400
+
+    groups = build_pick_list(**params)
+    return jsonify({
+        'fields': PICK_LINE_FIELDS,
+        'works': [
+            {'work_number': group.work_number, 'total_quantity': group.total_quantity,
+             'lines': [list(line) for line in group.lines]}
+            for group in groups
+        ],
+    })
+
+
+@app.route('/api/v1/requests/batch', methods=['POST'])
+@login_required
+def api_batch_requests():
+    """Submit production requests queued offline, each with an idempotency key"""
+    if current_user.role != 'producao':
+        return jsonify({'error': 'Acesso negado.'}), 403
+
+    payload = request.get_json(silent=True) or {}
+    items = payload.get('requests')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Lista de solicitações vazia ou inválida.'}), 400
+    if len(items) > MAX_BATCH_REQUESTS:
+        return jsonify({'error': f'Máximo de {MAX_BATCH_REQUESTS} solicitações por lote.'}), 400
+
+    results = [_submit_offline_request(item) for item in items]
+    db.session.commit()
+    return jsonify({'results': results})
+
+
+def _submit_offline_request(item):
+    key = str(item.get('idempotency_key') or '').strip() if isinstance(item, dict) else ''
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return {'idempotency_key': key or None, 'status': 'error',
+                'errors': {'idempotency_key': [f'Chave de idempotência obrigatória (até {MAX_KEY_LENGTH} caracteres).']}}
+
+    existing = find_key(current_user.id, key)
+    if existing:
+        return {'idempotency_key': key, 'status': 'duplicate', 'allocation_id': existing.allocation_id}
+
+    formdata = MultiDict({
+        'product_search': str(item.get('product_search') or item.get('product_id') or ''),
+        'product_id': str(item.get('product_id') or ''),
+        'warehouse_id': str(item.get('warehouse_id') or ''),
+        'work_number': str(item.get('work_number') or ''),
+        'quantity': str(item.get('quantity') or ''),
+        'notes': str(item.get('notes') or ''),
+    })
+    form = ProductionRequestForm(formdata=formdata, meta={'csrf': False})
+    if not form.validate():
+        return {'idempotency_key': key, 'status': 'error', 'errors': form.errors}
+
+    product = Product.active().filter_by(id=int(form.product_id.data)).first() if form.product_id.data.isdigit() else None
+    if product is None:
+        return {'idempotency_key': key, 'status': 'error', 'errors': {'product_id': ['Produto não encontrado.']}}
+
+    record, replay = claim_key(current_user.id, key)
+    if replay:
+        return {'idempotency_key': key, 'status': 'duplicate', 'allocation_id': record.allocation_id}
+
+    warehouse = resolve_warehouse(form.warehouse_id.data)
+    work = open_work(form.work_number.data)
+    allocation = Allocation(
+        product_id=product.id,
+        user_id=current_user.id,
+        work=work,
+        work_number=work.number,
+        quantity=form.quantity.data,
+        notes=form.notes.data,
+        status='pending',
+        warehouse_id=warehouse.id
+    )
+    db.session.add(allocation)
+    record.allocation = allocation
+    reserved = place_hold(allocation, product, warehouse) is not None
+    db.session.flush()
+
+    return {'idempotency_key': key, 'status': 'created', 'allocation_id': allocation.id, 'reserved': reserved}
+
+
+def _scan_card(code):
+    """SCAN_FIELDS of the active product with exactly this code, or None
+
+    The code is matched as is, through the unique index on active codes;
+    the row is cached until the product changes.
+    """
+    def load_card():
+        rows = product_rows(SCAN_FIELDS, query=Product.active().filter(Product.code == code))
+        return dict(zip(SCAN_FIELDS, rows[0])) if rows else None
+
+    return cache.get_or_set('scan_product', {'code': code}, load_card,
+                            tags=lambda card: ['catalog'] + ([product_tag(card['id'])] if card else []))
+
+
+def _scan_result(card):
+    """Scanned product with its current stock, total and per site"""
+    stock = site_stock(card['id'])
+    return dict(
+        card,
+        quantity=sum(quantity for quantity, _ in stock.values()),
+        available=sum(available for _, available in stock.values()),
+        sites=[{'warehouse_id': site, 'quantity': quantity, 'available': available}
+               for site, (quantity, available) in sorted(stock.items())],
+    )
+
+
+def _scan_payload():
+    """JSON body of a scan operation and the code it carries, stripped of scanner whitespace"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        payload = {}
+    return payload, str(payload.get('code') or '').strip()
+
+
+def _scanned_product(code, lock=False):
+    query = Product.active().filter(Product.code == code)
+    if lock:
+        query = query.with_for_update()
+    return query.first() if code else None
+
+
+def _optional_int(value):
+    if value is None or str(value).strip() == '':
+        return None
+    return int(value)
+
+
+@app.route('/api/v1/scan/<path:code>')
+@login_required
+def api_scan(code):
+    """Product of a scanned barcode or QR code, with its stock per site"""
+    card = _scan_card(code.strip())
+    if card is None:
+        return jsonify({'error': 'Produto não encontrado.'}), 404
+    return jsonify(_scan_result(card))
+
+
+@app.route('/api/v1/scan/allocate', methods=['POST'])
+@login_required
+def api_scan_allocate():
+    """Allocate a scanned product to a work, as the allocation form does"""
+    if current_user.role != 'almoxarifado':
+        return jsonify({'error': 'Acesso negado.'}), 403
+
+    payload, code = _scan_payload()
+    product = _scanned_product(code)
+    if product is None:
+        return jsonify({'error': 'Produto não encontrado.'}), 404
+
+    formdata = MultiDict({
+        'product_search': code,
+        'product_id': str(product.id),
+        'warehouse_id': str(payload.get('warehouse_id') or ''),
+        'work_number': str(payload.get('work_number') or ''),
+        'quantity': str(payload.get('quantity') or ''),
+        'notes': str(payload.get('notes') or ''),
+        'idempotency_key': str(payload.get('idempotency_key') or ''),
+    })
+    form = AllocationForm(formdata=formdata, meta={'csrf': False})
+    if not form.validate():
+        return jsonify({'errors': form.errors}), 400
+
+    card = {field: getattr(product, field) for field in SCAN_FIELDS}
+    warehouse = resolve_warehouse(form.warehouse_id.data)
+    key, replay = claim_key(current_user.id, form.idempotency_key.data or new_key())
+    if replay:
+        db.session.rollback()
+        return jsonify({'status': 'duplicate', 'allocation_id': key.allocation_id, 'product': _scan_result(card)})
+
+    if site_available(product.id, warehouse.id) < form.quantity.data:
+        db.session.rollback()
+        return jsonify({'error': f'Quantidade insuficiente em estoque no almoxarifado {warehouse.code}.',
+                        'product': _scan_result(card)}), 409
+
+    work = open_work(form.work_number.data)
+    allocation = Allocation(
+        product_id=product.id,
+        user_id=current_user.id,
+        work=work,
+        work_number=work.number,
+        quantity=form.quantity.data,
+        notes=form.notes.data,
+        status='approved',
+        approved_by_id=current_user.id,
+        approved_at=utcnow(),
+        warehouse_id=warehouse.id
+    )
+    db.session.add(allocation)
+    key.allocation = allocation
+    log_stock_movement(product, current_user, 'allocation', form.quantity.data,
+                       f'Alocado para obra {work.number}', warehouse=warehouse, allocation=allocation)
+    db.session.commit()
+
+    return jsonify({'status': 'created', 'allocation_id': allocation.id, 'product': _scan_result(card)})
+
+
+@app.route('/api/v1/scan/adjust', methods=['POST'])
+@login_required
+def api_scan_adjust():
+    """Add or remove stock of a scanned product"""
+    if current_user.role != 'almoxarifado':
+        return jsonify({'error': 'Acesso negado.'}), 403
+
+    payload, code = _scan_payload()
+    product = _scanned_product(code)
+    if product is None:
+        return jsonify({'error': 'Produto não encontrado.'}), 404
+
+    formdata = MultiDict({
+        'warehouse_id': str(payload.get('warehouse_id') or ''),
+        'adjustment_type': str(payload.get('adjustment_type') or ''),
+        'quantity': str(payload.get('quantity') or ''),
+        'unit_cost': str(payload.get('unit_cost') or ''),
+        'notes': str(payload.get('notes') or ''),
+    })
+    form = StockAdjustmentForm(formdata=formdata, meta={'csrf': False})
+    if not form.validate():
+        return jsonify({'errors': form.errors}), 400
+
+    card = {field: getattr(product, field) for field in SCAN_FIELDS}
+    log_stock_movement(product, current_user, form.adjustment_type.data, form.quantity.data, form.notes.data,
+                       warehouse=resolve_warehouse(form.warehouse_id.data), unit_cost=form.unit_cost.data)
+    db.session.commit()
+
+    return jsonify({'status': 'adjusted', 'product': _scan_result(card)})
+
+
+@app.route('/api/v1/scan/count', methods=['POST'])
+@login_required
+def api_scan_count():
+    """Record the counted stock of a scanned product at one site
+
+    With ``expected`` (the stock shown to the counter) the count is refused
+    when the stock moved meanwhile, as in the cycle count page.
+    """
+    if current_user.role != 'almoxarifado':
+        return jsonify({'error': 'Acesso negado.'}), 403
+
+    payload, code = _scan_payload()
+    try:
+        counted = _optional_int(payload.get('counted'))
+        expected = _optional_int(payload.get('expected'))
+        warehouse = resolve_warehouse(_optional_int(payload.get('warehouse_id')))
+    except ValueError:
+        return jsonify({'error': 'Informe quantidades inteiras e não negativas.'}), 400
+    if counted is None or counted < 0:
+        return jsonify({'error': 'Informe quantidades inteiras e não negativas.'}), 400
+    if warehouse is None:
+        return jsonify({'error': 'Almoxarifado inválido.'}), 400
+
+    # Locked until the commit, so the count applies to the stock it was compared with
+    product = _scanned_product(code, lock=True)
+    if product is None:
+        return jsonify({'error': 'Produto não encontrado.'}), 404
+
+    card = {field: getattr(product, field) for field in SCAN_FIELDS}
+    current = site_quantity(product.id, warehouse.id)
+    if expected is not None and current != expected:
+        db.session.rollback()
+        return jsonify({'error': 'O estoque mudou durante a contagem. Confira e envie novamente.',
+                        'current': current, 'product': _scan_result(card)}), 409
+
+    adjusted = counted != current
+    if adjusted:
+        notes = str(payload.get('notes') or '').strip() or f'Contagem física - local {product.location}'
+        log_stock_movement(product, current_user, 'count', counted, notes, warehouse=warehouse)
+    db.session.commit()
+
+    return jsonify({'status': 'counted', 'adjusted': adjusted, 'previous': current, 'product': _scan_result(card)})
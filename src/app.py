@@ -6,6 +6,15 @@ from flask_login import LoginManager
 from flask_mail import Mail
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from db_routing import RoutingSession, postgres_engine_options, init_db_routing
+from cache import ResultCache
+from events import EventBroker
+from timeutils import localtime_filter
+from ratelimit import LoginRateLimiter
+from query_stats import init_query_stats
+from serializers import FastJSONProvider
+from compression import init_compression
+from assets import init_assets
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -14,12 +23,16 @@ class Base(DeclarativeBase):
     pass
 
 # Initialize extensions
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 login_manager = LoginManager()
 mail = Mail()
+cache = ResultCache()
+broker = EventBroker()
+login_limiter = LoginRateLimiter()
 
 def create_app():
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     
     # Configuration
     app.secret_key = os.environ.get("SESSION_SECRET") or "dev-secret-key-change-in-production"
@@ -29,10 +42,12 @@ def create_app():
     if database_url and database_url.startswith("postgres"):
         # Production - PostgreSQL
         app.config["SQLALCHEMY_DATABASE_URI"] = database_url
-        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-            "pool_recycle": 300,
-            "pool_pre_ping": True,
-        }
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = postgres_engine_options()
+        
+        # Optional read replica for read-only routes
+        replica_url = os.environ.get("DATABASE_REPLICA_URL")
+        if replica_url:
+            app.config["SQLALCHEMY_BINDS"] = {"replica": replica_url}
     else:
         # Development - SQLite
         app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///inventory.db"
@@ -40,10 +55,68 @@ def create_app():
             "pool_pre_ping": True,
         }
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+    # Schema migrations (see migrate.py): at startup "verify" refuses to
+    # start with any pending, "upgrade" applies them, "off" skips. Deploys
+    # run `python migrate.py upgrade` before starting Gunicorn and the
+    # development server (main.py) upgrades itself, so workers never migrate
+    app.config["MIGRATE_ON_BOOT"] = os.environ.get("MIGRATE_ON_BOOT", "verify")
+    # Backfills update this many rows per transaction and pause between batches;
+    # schema changes give up after waiting this long for a table lock
+    app.config["MIGRATION_BATCH_SIZE"] = int(os.environ.get("MIGRATION_BATCH_SIZE", "1000"))
+    app.config["MIGRATION_BATCH_PAUSE_MS"] = int(os.environ.get("MIGRATION_BATCH_PAUSE_MS", "50"))
+    app.config["MIGRATION_LOCK_TIMEOUT_MS"] = int(os.environ.get("MIGRATION_LOCK_TIMEOUT_MS", "5000"))
+
+    # Live updates of open pages: "auto" streams them (Server-Sent Events)
+    # where the serving profile allows and polls every LIVE_POLL_SECONDS
+    # otherwise; "stream", "poll" or "off" force a mode
+    app.config["LIVE_UPDATES"] = os.environ.get("LIVE_UPDATES", "auto")
+    app.config["LIVE_POLL_SECONDS"] = int(os.environ.get("LIVE_POLL_SECONDS", "30"))
+
+    # Password hashing policy, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000";
+    # existing hashes are upgraded on the next successful login
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    app.config["PASSWORD_SALT_LENGTH"] = int(os.environ.get("PASSWORD_SALT_LENGTH", "16"))
+    
+    # Pending requests hold stock for this long; the job worker releases
+    # expired holds every RESERVATION_SWEEP_SECONDS (0 disables it)
+    app.config["RESERVATION_TTL_HOURS"] = int(os.environ.get("RESERVATION_TTL_HOURS", "48"))
+    app.config["RESERVATION_SWEEP_SECONDS"] = int(os.environ.get("RESERVATION_SWEEP_SECONDS", "300"))
+    
+    # Idempotency keys of submitted requests are kept this long; a repeat
+    # of the same key within it returns the original request
+    app.config["IDEMPOTENCY_TTL_HOURS"] = int(os.environ.get("IDEMPOTENCY_TTL_HOURS", "24"))
+    
+    # Notification digests (see notifications.py): events are coalesced and
+    # delivered every NOTIFY_DIGEST_SECONDS (0 disables them); products at or
+    # below LOW_STOCK_THRESHOLD count as low stock
+    app.config["NOTIFY_DIGEST_SECONDS"] = int(os.environ.get("NOTIFY_DIGEST_SECONDS", "300"))
+    app.config["LOW_STOCK_THRESHOLD"] = int(os.environ.get("LOW_STOCK_THRESHOLD", "10"))
+    app.config["NOTIFICATION_RETENTION_DAYS"] = int(os.environ.get("NOTIFICATION_RETENTION_DAYS", "30"))
+    
+    # Stock valuation for allocation costs: "average" (moving average) or "fifo"
+    app.config["COST_VALUATION"] = os.environ.get("COST_VALUATION", "average")
+    
+    # Columnar export of allocations and movements (see analytics.py);
+    # defaults to instance/analytics in Parquet, "arrow" writes Arrow IPC files
+    app.config["ANALYTICS_EXPORT_DIR"] = os.environ.get("ANALYTICS_EXPORT_DIR")
+    app.config["ANALYTICS_EXPORT_FORMAT"] = os.environ.get("ANALYTICS_EXPORT_FORMAT", "parquet")
+    app.config["ANALYTICS_EXPORT_SECONDS"] = int(os.environ.get("ANALYTICS_EXPORT_SECONDS", "3600"))
+    
+    # Background jobs (see jobs.py); failed runs are retried after
+    # JOB_RETRY_SECONDS, doubling each attempt
+    app.config["JOB_POLL_SECONDS"] = int(os.environ.get("JOB_POLL_SECONDS", "5"))
+    app.config["JOB_RETRY_SECONDS"] = int(os.environ.get("JOB_RETRY_SECONDS", "60"))
+    app.config["JOB_TIMEOUT_SECONDS"] = int(os.environ.get("JOB_TIMEOUT_SECONDS", "3600"))
+    app.config["JOB_RETENTION_DAYS"] = int(os.environ.get("JOB_RETENTION_DAYS", "14"))
+    # /health reports the queue as stale when due jobs wait longer than this
+    app.config["JOB_STALE_SECONDS"] = int(os.environ.get("JOB_STALE_SECONDS", "900"))
+    app.config["CACHE_WARM_SECONDS"] = int(os.environ.get("CACHE_WARM_SECONDS", "60"))
     
     # Upload configuration
     app.config["UPLOAD_FOLDER"] = "static/uploads"
     app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
+    app.config["UPLOAD_MAX_AGE"] = int(os.environ.get("UPLOAD_MAX_AGE", str(365 * 24 * 3600)))
     
     # Mail configuration
     app.config["MAIL_SERVER"] = os.environ.get("MAIL_SERVER", "smtp.gmail.com")
@@ -53,13 +126,29 @@ def create_app():
     app.config["MAIL_PASSWORD"] = os.environ.get("MAIL_PASSWORD", "")
     app.config["MAIL_DEFAULT_SENDER"] = os.environ.get("MAIL_DEFAULT_SENDER", "noreply@empresa.com")
     
-    # Proxy fix for correct URL generation
-    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    # Number of reverse proxies in front of the app, whose X-Forwarded-*
+    # headers are trusted for the client IP, scheme and host. Left at 0 when
+    # clients connect directly, as they could otherwise pick their own IP
+    # and get past the per-IP login limit
+    app.config["TRUSTED_PROXIES"] = int(os.environ.get("TRUSTED_PROXIES", "0"))
+    if app.config["TRUSTED_PROXIES"]:
+        proxies = app.config["TRUSTED_PROXIES"]
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
     
     # Initialize extensions
     db.init_app(app)
+    init_db_routing(app, db)
+    init_query_stats(app)
     login_manager.init_app(app)
     mail.init_app(app)
+    cache.init_app(app)
+    broker.init_app(app)
+    login_limiter.init_app(app)
+    init_compression(app)
+    init_assets(app)
+    
+    # Timestamps are stored in UTC and shown in Brazil local time
+    app.add_template_filter(localtime_filter, "localtime")
     
     # Login manager configuration
     login_manager.login_view = "login"
@@ -83,10 +172,13 @@ app = create_app()
 @login_manager.user_loader
 def load_user(user_id):
     from models import User
-    return User.query.get(int(user_id))
+    # Identity-map lookup: later loads of this user in the request reuse it
+    user = db.session.get(User, int(user_id))
+    # Archiving a user ends their sessions
+    return user if user is not None and not user.is_deleted else None
 
-# Create tables
+# Check the schema; tables are created and changed only by migrations
 with app.app_context():
     import models
-    db.create_all()
-    logging.info("Database tables created")
+    from migrate import check_schema
+    check_schema(app)
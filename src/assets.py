@@ -0,0 +1,253 @@
+import os
+import re
+import sys
+import gzip
+import json
+import hashlib
+import mimetypes
+from urllib.request import urlopen
+from flask import current_app, request, send_from_directory, url_for
+from markupsafe import Markup, escape
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+# Bundles linked by asset_tags(), built from these static files in order
+BUNDLES = {
+    'vendor.css': ['vendor/bootstrap/bootstrap-agent-dark-theme.min.css', 'vendor/fontawesome/css/all.min.css'],
+    'app.css': ['css/style.css'],
+    'vendor.js': ['vendor/bootstrap/bootstrap.bundle.min.js'],
+    'app.js': ['js/autocomplete.js', 'js/live_updates.js', 'js/photo_modal.js', 'js/product_picker.js',
+               'js/inventory_filter.js', 'js/work_autocomplete.js', 'js/scan.js'],
+}
+
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0'
+
+# Files fetched by `assets.py vendor`; until they exist, pages link the CDN
+VENDOR = {
+    'vendor/bootstrap/bootstrap-agent-dark-theme.min.css': 'https://cdn.replit.com/agent/bootstrap-agent-dark-theme.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'vendor/fontawesome/css/all.min.css': f'{FONT_AWESOME}/css/all.min.css',
+}
+for _font in ('fa-brands-400', 'fa-regular-400', 'fa-solid-900', 'fa-v4compatibility'):
+    for _ext in ('woff2', 'ttf'):
+        VENDOR[f'vendor/fontawesome/webfonts/{_font}.{_ext}'] = f'{FONT_AWESOME}/webfonts/{_font}.{_ext}'
+
+# Built files never change under the same name
+DIST_MAX_AGE = 365 * 24 * 3600
+
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)(?!data:|https?:|/)([^\'")]+)\1\s*\)')
+
+
+def _read(path):
+    with open(os.path.join(STATIC_DIR, path), encoding='utf-8') as f:
+        return f.read()
+
+
+def _rebase_css_urls(css, source):
+    """Make relative url(...) references absolute, as the bundle lives elsewhere"""
+    base = os.path.dirname(source)
+
+    def absolute(match):
+        quote, target = match.groups()
+        return f'url({quote}/static/{os.path.normpath(os.path.join(base, target))}{quote})'
+    return _CSS_URL.sub(absolute, css)
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    # Not around ':' — 'a :hover' and 'a:hover' are different selectors
+    return re.sub(r'\s*([{};,>])\s*', r'\1', css).strip()
+
+
+def minify_js(js):
+    """rjsmin when installed; otherwise only indentation, blank and comment lines go"""
+    try:
+        import rjsmin
+    except ImportError:
+        pass
+    else:
+        return rjsmin.jsmin(js)
+
+    lines = []
+    in_comment = False
+    for line in js.splitlines():
+        stripped = line.strip()
+        if in_comment:
+            in_comment = '*/' not in stripped
+            continue
+        if stripped.startswith('/*'):
+            in_comment = '*/' not in stripped
+            continue
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return '\n'.join(lines)
+
+
+def bundle(name):
+    """Concatenated and minified contents of a bundle"""
+    parts = []
+    for source in BUNDLES[name]:
+        text = _read(source)
+        if name.endswith('.css'):
+            text = _rebase_css_urls(text, source)
+            parts.append(text if source.endswith('.min.css') else minify_css(text))
+        else:
+            parts.append(text if source.endswith('.min.js') else minify_js(text))
+    # A file not ending its last statement must not run into the next one
+    return (';\n' if name.endswith('.js') else '\n').join(parts)
+
+
+def _compress(path, data):
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    try:
+        import brotli
+    except ImportError:
+        return
+    with open(path + '.br', 'wb') as f:
+        f.write(brotli.compress(data, quality=11))
+
+
+def build(static_dir=STATIC_DIR):
+    """Write each bundle as <name>.<hash>.<ext> with .gz/.br copies, and the manifest
+
+    Bundles whose sources are missing (vendor files not fetched yet) are
+    skipped and keep linking their sources. Returns the new manifest.
+    """
+    dist = os.path.join(static_dir, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+    previous = _load_manifest(dist)
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        missing = [source for source in sources if not os.path.exists(os.path.join(static_dir, source))]
+        if missing:
+            print(f"⚠️  {name}: faltam {', '.join(missing)} (execute 'python assets.py vendor')")
+            continue
+        data = bundle(name).encode()
+        stem, ext = os.path.splitext(name)
+        filename = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        path = os.path.join(dist, filename)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+            _compress(path, data)
+        manifest[name] = filename
+
+    with open(os.path.join(dist, MANIFEST + '.tmp'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(dist, MANIFEST + '.tmp'), os.path.join(dist, MANIFEST))
+
+    # Pages cached before this build may still ask for the previous files
+    keep = set(manifest.values()) | set(previous.values())
+    for filename in os.listdir(dist):
+        if filename != MANIFEST and re.sub(r'\.(gz|br)$', '', filename) not in keep:
+            os.remove(os.path.join(dist, filename))
+    return manifest
+
+
+def vendor(static_dir=STATIC_DIR):
+    """Download the CDN files into static/vendor, for plants without internet access"""
+    for path, url in VENDOR.items():
+        target = os.path.join(static_dir, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with urlopen(url, timeout=30) as response:
+            data = response.read()
+        with open(target, 'wb') as f:
+            f.write(data)
+        print(f"✅ {path} ({len(data)} bytes)")
+
+
+def _load_manifest(dist):
+    try:
+        with open(os.path.join(dist, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+_manifest_cache = {}
+
+
+def _manifest():
+    # Reloaded when a build replaces it, without restarting the app
+    path = os.path.join(current_app.static_folder, DIST_DIR, MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return {}
+    if _manifest_cache.get('mtime') != mtime:
+        _manifest_cache.update(mtime=mtime, data=_load_manifest(os.path.dirname(path)))
+    return _manifest_cache['data']
+
+
+def asset_tags(name):
+    """<link>/<script> tags of a bundle: the built file, else its sources, else the CDN"""
+    built = None if current_app.config['ASSETS_DEBUG'] else _manifest().get(name)
+    if built:
+        urls = [url_for('dist_asset', filename=built)]
+    else:
+        urls = []
+        for source in BUNDLES[name]:
+            if os.path.exists(os.path.join(current_app.static_folder, source)):
+                urls.append(url_for('static', filename=source))
+            elif source in VENDOR:
+                urls.append(VENDOR[source])
+
+    if name.endswith('.css'):
+        tags = [f'<link href="{escape(url)}" rel="stylesheet">' for url in urls]
+    else:
+        tags = [f'<script src="{escape(url)}"></script>' for url in urls]
+    return Markup('\n    '.join(tags))
+
+
+def serve_dist(filename):
+    """Built assets, precompressed when the client accepts it, cached for good"""
+    directory = os.path.join(current_app.static_folder, DIST_DIR)
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(directory, filename + suffix)):
+            response = send_from_directory(directory, filename + suffix, mimetype=mimetype, max_age=DIST_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, mimetype=mimetype, max_age=DIST_MAX_AGE)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    """Serve built bundles from /static/dist and provide asset_tags() to templates
+
+    ASSETS_DEBUG=1 links the source files even when a build exists.
+    """
+    app.config.setdefault('ASSETS_DEBUG', os.environ.get('ASSETS_DEBUG') == '1')
+    app.add_url_rule(f'{app.static_url_path}/{DIST_DIR}/<path:filename>', 'dist_asset', serve_dist)
+    app.add_template_global(asset_tags)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("📦 Arquivos estáticos")
+        print("\nComandos disponíveis:")
+        print("  build    - Gera os pacotes minificados com hash em static/dist")
+        print("  vendor   - Baixa Bootstrap e Font Awesome para static/vendor")
+        return
+
+    command = sys.argv[1].lower()
+    if command == "build":
+        for name, filename in build().items():
+            print(f"✅ {name} → {DIST_DIR}/{filename}")
+    elif command == "vendor":
+        vendor()
+    else:
+        print(f"❌ Comando desconhecido: {command}")
+
+
+if __name__ == "__main__":
+    main()
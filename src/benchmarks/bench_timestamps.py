@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for timestamp defaults: per-call cost and bulk-insert throughput
+
+Usage: python benchmarks/bench_timestamps.py [rows]
+
+Needs pytz for the old default (the "bench" extra).
+"""
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, DateTime
+from timeutils import UTCDateTime, utcnow
+
+try:
+    import pytz
+except ImportError:
+    sys.exit("O benchmark requer o pacote pytz (pip install pytz, extra bench)")
+
+
+def legacy_brazil_now():
+    """Previous column default, kept here only for comparison"""
+    from datetime import datetime
+    utc = pytz.timezone('UTC')
+    brazil_tz = pytz.timezone('America/Sao_Paulo')
+    utc_time = datetime.now(utc)
+    return utc_time.astimezone(brazil_tz).replace(tzinfo=None)
+
+
+def bench_calls(number=100000):
+    print(f"Chamadas ({number}x):")
+    for name, func in (('brazil_now (pytz)', legacy_brazil_now), ('utcnow (zoneinfo)', utcnow)):
+        seconds = timeit.timeit(func, number=number)
+        print(f"  {name:<20} {seconds / number * 1e6:8.2f} µs/chamada")
+
+
+def bench_bulk_insert(rows):
+    print(f"Inserção em lote ({rows} linhas, SQLite em memória):")
+    for name, column_type, default in (
+        ('DateTime + brazil_now', DateTime, legacy_brazil_now),
+        ('UTCDateTime + utcnow', UTCDateTime, utcnow),
+    ):
+        engine = create_engine('sqlite://')
+        metadata = MetaData()
+        table = Table(
+            'stock_movements', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('notes', String(50)),
+            Column('created_at', column_type, default=default),
+        )
+        metadata.create_all(engine)
+
+        payload = [{'notes': f'mov {i}'} for i in range(rows)]
+        start = time.perf_counter()
+        with engine.begin() as connection:
+            connection.execute(table.insert(), payload)
+        elapsed = time.perf_counter() - start
+        print(f"  {name:<24} {rows / elapsed:10.0f} linhas/s")
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    bench_calls()
+    bench_bulk_insert(rows)
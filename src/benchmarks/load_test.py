@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Load test: concurrent clients a single container serves per serving profile
+
+Ramps up concurrent clients against the I/O-bound endpoints while a few
+live-update streams stay open, and reports throughput and latency per
+level. With --profiles, gunicorn is started once per worker class so the
+results can be compared side by side (run from src/).
+
+Usage:
+  python benchmarks/load_test.py --profiles sync,gthread,gevent
+  python benchmarks/load_test.py --url http://127.0.0.1:5000 --levels 1,16,64
+"""
+import os
+import re
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit, urlencode
+
+DEFAULT_PATHS = [
+    '/api/products/search?q=pa',
+    '/api/products/search?q=ca',
+    '/inventory',
+    '/works/manage',
+]
+
+# A level is "handled" while p95 stays under this and almost nothing fails
+MAX_P95_SECONDS = 1.0
+MAX_ERROR_RATE = 0.01
+
+
+def _connection(base):
+    parts = urlsplit(base)
+    return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+
+
+def login(base, username, password):
+    """Session cookie of a logged-in user, shared by all simulated clients"""
+    conn = _connection(base)
+    conn.request('GET', '/login')
+    response = conn.getresponse()
+    page = response.read().decode()
+    cookie = (response.getheader('Set-Cookie') or '').split(';')[0]
+    token = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', page)
+
+    body = urlencode({'username': username, 'password': password, 'csrf_token': token.group(1) if token else ''})
+    conn.request('POST', '/login', body, {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Cookie': cookie,
+    })
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    if response.status != 302:
+        raise SystemExit(f"Login falhou ({response.status})")
+    return (response.getheader('Set-Cookie') or cookie).split(';')[0]
+
+
+def hold_streams(base, cookie, count, stop):
+    """Keep live-update streams open, as browser tabs do"""
+    def stream():
+        try:
+            conn = _connection(base)
+            conn.timeout = None
+            conn.request('GET', '/events/stream', headers={'Cookie': cookie})
+            response = conn.getresponse()
+            while not stop.is_set():
+                if not response.fp.readline():
+                    break
+        except OSError:
+            pass
+
+    for _ in range(count):
+        threading.Thread(target=stream, daemon=True).start()
+
+
+def run_level(base, cookie, paths, clients, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(offset):
+        conn = _connection(base)
+        i = offset
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Cookie': cookie})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = _connection(base)
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    total = len(latencies) + errors[0]
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else float('inf')
+
+    return {
+        'clients': clients,
+        'rps': len(latencies) / duration,
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        'error_rate': errors[0] / total if total else 1.0,
+    }
+
+
+def run_ramp(base, args):
+    cookie = login(base, args.username, args.password)
+    stop = threading.Event()
+    hold_streams(base, cookie, args.streams, stop)
+    time.sleep(0.5)
+
+    results = []
+    print(f"  {'clientes':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>7}")
+    for clients in args.levels:
+        result = run_level(base, cookie, args.paths, clients, args.duration)
+        results.append(result)
+        print(f"  {clients:>8} {result['rps']:>8.0f} {result['p50'] * 1000:>8.1f} "
+              f"{result['p95'] * 1000:>8.1f} {result['p99'] * 1000:>8.1f} {result['error_rate']:>7.1%}")
+    stop.set()
+
+    handled = [r['clients'] for r in results if r['p95'] <= MAX_P95_SECONDS and r['error_rate'] <= MAX_ERROR_RATE]
+    return max(handled) if handled else 0
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(profile):
+    port = _free_port()
+    # Streams forced on, to measure what they cost each profile
+    env = dict(os.environ, WEB_WORKER_CLASS=profile, WEB_BIND=f'127.0.0.1:{port}', LIVE_UPDATES='stream',
+               JOB_WORKER='off')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'main:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return server, base
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit(f"gunicorn ({profile}) não iniciou")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='Servidor já em execução (ignora --profiles)')
+    parser.add_argument('--profiles', default='sync,gthread,gevent', type=lambda v: v.split(','))
+    parser.add_argument('--levels', default='1,8,32,64,128', type=lambda v: [int(n) for n in v.split(',')])
+    parser.add_argument('--duration', default=10, type=float, help='Segundos por nível')
+    parser.add_argument('--streams', default=4, type=int, help='Streams de atualização abertos durante o teste')
+    parser.add_argument('--paths', default=DEFAULT_PATHS, type=lambda v: v.split(','))
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    args = parser.parse_args()
+
+    if args.url:
+        print(f"{args.url}:")
+        print(f"  → até {run_ramp(args.url, args)} clientes simultâneos")
+        return
+
+    summary = {}
+    for profile in args.profiles:
+        print(f"Perfil {profile}:")
+        server, base = start_server(profile)
+        try:
+            summary[profile] = run_ramp(base, args)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"\nClientes simultâneos atendidos (p95 ≤ {MAX_P95_SECONDS:.0f}s, erros ≤ {MAX_ERROR_RATE:.0%}):")
+    for profile, clients in summary.items():
+        print(f"  {profile:<8} {clients}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,407 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import logging
+import threading
+import functools
+from collections import OrderedDict, defaultdict, Counter
+from datetime import timedelta
+from flask import g, has_app_context
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import select, insert, func
+from changes import on_commit
+from timeutils import utcnow
+
+_MISSING = object()
+
+# Product fields that affect search results and catalog listings (archiving included)
+SEARCH_FIELDS = frozenset({'code', 'name', 'supplier_reference', 'location', 'deleted_at'})
+
+# Product fields shown as stock figures
+STOCK_FIELDS = frozenset({'quantity', 'reserved_quantity'})
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def user_allocations_tag(user_id):
+    return f'allocations:user:{user_id}'
+
+
+def tags_for_changes(changes):
+    """Map committed model changes to the cache tags they invalidate"""
+    tags = set()
+    for change in changes:
+        if change.model == 'Product':
+            tags.add(product_tag(change.id))
+            if change.op != 'update' or change.changed & SEARCH_FIELDS:
+                tags.add('catalog')
+            if change.op != 'update' or change.changed & STOCK_FIELDS:
+                tags.add('stock')
+        elif change.model == 'Allocation':
+            tags.add('allocations')
+            tags.add(user_allocations_tag(change.attrs['user_id']))
+            if change.attrs['status'] == 'approved' or change.op == 'delete':
+                tags.add('works')
+        elif change.model == 'Work':
+            tags.add('works')
+        elif change.model == 'StockMovement':
+            tags.add(product_tag(change.attrs['product_id']))
+            tags.add('stock')
+    return tags
+
+
+def request_cached(function):
+    """Memoize a function for the rest of the request (app context), keyed by its arguments
+
+    For lookups several parts of a request repeat, such as the active
+    warehouses used by every form and stock helper.
+    """
+    @functools.wraps(function)
+    def wrapper(*args):
+        memo = g.setdefault('request_cache', {})
+        key = (function.__qualname__, args)
+        if key not in memo:
+            memo[key] = function(*args)
+        return memo[key]
+    return wrapper
+
+
+class LRUBackend:
+    """In-process LRU cache with per-entry TTL and tag index"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._tags = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value, tags = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags[tag].add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.pop(tag, set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def size(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class SharedBackend:
+    """Cache shared between workers, stored through a Redis-compatible client"""
+
+    def __init__(self, client, prefix='almox:cache:'):
+        self.client = client
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return _MISSING
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl, tags=()):
+        full_key = self.prefix + key
+        self.client.set(full_key, pickle.dumps(value), ex=ttl)
+        for tag in tags:
+            tag_key = self._tag_key(tag)
+            self.client.sadd(tag_key, full_key)
+            self.client.expire(tag_key, ttl)
+
+    def invalidate_tags(self, tags):
+        tag_keys = [self._tag_key(tag) for tag in tags]
+        keys = set()
+        for tag_key in tag_keys:
+            keys |= {k.decode() if isinstance(k, bytes) else k for k in self.client.smembers(tag_key)}
+        if keys or tag_keys:
+            self.client.delete(*keys, *tag_keys)
+        return len(keys)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+    def size(self):
+        return None
+
+    def _tag_key(self, tag):
+        return f'{self.prefix}tag:{tag}'
+
+
+class LocalSharedClient:
+    """Minimal in-memory stand-in for the Redis client used by SharedBackend"""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if self._expired(key):
+                return None
+            return self._data.get(key)
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = value
+            self._set_expiry(key, ex)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+
+    def sadd(self, key, *members):
+        with self._lock:
+            self._expired(key)
+            self._data.setdefault(key, set()).update(members)
+
+    def smembers(self, key):
+        with self._lock:
+            if self._expired(key):
+                return set()
+            return set(self._data.get(key, set()))
+
+    def expire(self, key, seconds):
+        with self._lock:
+            self._set_expiry(key, seconds)
+
+    def scan_iter(self, pattern):
+        prefix = pattern.rstrip('*')
+        with self._lock:
+            return [key for key in self._data if key.startswith(prefix)]
+
+    def _set_expiry(self, key, seconds):
+        if seconds:
+            self._expires[key] = time.monotonic() + seconds
+        else:
+            self._expires.pop(key, None)
+
+    def _expired(self, key):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at < time.monotonic():
+            self._data.pop(key, None)
+            del self._expires[key]
+            return True
+        return False
+
+
+class ResultCache:
+    """Caches query results for hot read endpoints, invalidated on commit
+
+    A per-process backend also hears of the other processes' commits (web
+    workers, the job worker): each commit's tags are logged in
+    cache_invalidations, which every process reads once per request before
+    using its cache.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.default_ttl = 60
+        self.hits = Counter()
+        self.misses = Counter()
+        self.invalidations = 0
+        self._seen = None
+        self._own = set()
+        self._sync_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("CACHE_BACKEND", os.environ.get("CACHE_BACKEND", "lru"))
+        app.config.setdefault("CACHE_REDIS_URL", os.environ.get("CACHE_REDIS_URL", ""))
+        app.config.setdefault("CACHE_MAX_ENTRIES", int(os.environ.get("CACHE_MAX_ENTRIES", "2048")))
+        app.config.setdefault("CACHE_DEFAULT_TTL", int(os.environ.get("CACHE_DEFAULT_TTL", "60")))
+
+        self.default_ttl = app.config["CACHE_DEFAULT_TTL"]
+        self.backend = self._create_backend(app.config)
+        app.extensions["result_cache"] = self
+        on_commit(self._invalidate_changes)
+
+    def _create_backend(self, config):
+        kind = config["CACHE_BACKEND"]
+        if kind == "redis":
+            try:
+                import redis
+            except ImportError:
+                logging.warning("CACHE_BACKEND=redis mas o pacote redis não está instalado; usando LRU local")
+            else:
+                return SharedBackend(redis.Redis.from_url(config["CACHE_REDIS_URL"]))
+        elif kind == "local-shared":
+            return SharedBackend(LocalSharedClient())
+        return LRUBackend(config["CACHE_MAX_ENTRIES"])
+
+    def make_key(self, name, params=None):
+        """Derive a cache key from the route name and its parameters"""
+        encoded = json.dumps(params or {}, sort_keys=True, default=str)
+        digest = hashlib.sha1(encoded.encode()).hexdigest()
+        return f"{name}:{digest}"
+
+    def get_or_set(self, name, params, producer, tags=(), ttl=None):
+        """Return the cached value for name/params, computing it on a miss
+
+        ``tags`` may be a callable receiving the computed value, so that
+        entries can be tagged with the rows they actually contain.
+        """
+        key = self.make_key(name, params)
+        self.sync()
+        value = self.backend.get(key)
+        if value is not _MISSING:
+            self.hits[name] += 1
+            return value
+
+        self.misses[name] += 1
+        value = producer()
+        entry_tags = tags(value) if callable(tags) else tags
+        self.backend.set(key, value, ttl or self.default_ttl, entry_tags)
+        return value
+
+    @property
+    def shared(self):
+        """Whether entries are visible to other processes, e.g. the job worker"""
+        return isinstance(self.backend, SharedBackend)
+
+    def invalidate(self, tags):
+        if tags:
+            self.invalidations += self.backend.invalidate_tags(tags)
+
+    def sync(self):
+        """Apply the tags other processes invalidated, once per request (local backends only)"""
+        if self.shared or not has_app_context() or g.get('cache_synced'):
+            return
+        g.cache_synced = True
+        from app import db
+        from models import CacheInvalidation
+
+        # Always the primary: the log must not lag behind the writes it reports
+        bind = {'bind': db.engine}
+        with self._sync_lock:
+            if self._seen is None:
+                # Nothing cached yet; earlier invalidations do not matter
+                self._seen = db.session.execute(
+                    select(func.coalesce(func.max(CacheInvalidation.id), 0)), bind_arguments=bind
+                ).scalar()
+                return
+            rows = db.session.execute(
+                select(CacheInvalidation.id, CacheInvalidation.tags)
+                .where(CacheInvalidation.id > self._seen).order_by(CacheInvalidation.id),
+                bind_arguments=bind
+            ).all()
+            tags = set()
+            for invalidation_id, invalidation_tags in rows:
+                if invalidation_id in self._own:
+                    self._own.discard(invalidation_id)
+                else:
+                    tags.update(invalidation_tags.split())
+                self._seen = invalidation_id
+        self.invalidate(tags)
+
+    def _broadcast(self, tags):
+        # Runs after the commit, so on a connection of its own
+        from app import db
+        from models import CacheInvalidation
+
+        try:
+            with db.engine.begin() as connection:
+                result = connection.execute(insert(CacheInvalidation).values(tags=' '.join(sorted(tags)),
+                                                                             created_at=utcnow()))
+            with self._sync_lock:
+                # Only a process reading the log skips its own rows; ids it
+                # already read past are never looked up again
+                if self._seen is not None:
+                    self._own = {own for own in self._own if own > self._seen}
+                    self._own.add(result.inserted_primary_key[0])
+        except Exception as e:
+            # The other processes' entries expire after CACHE_DEFAULT_TTL
+            logging.error(f"Erro ao registrar invalidação de cache: {e}")
+
+    def prune(self):
+        """Forget invalidations older than any entry could be"""
+        from app import db
+        from models import CacheInvalidation
+
+        cutoff = utcnow() - timedelta(seconds=max(self.default_ttl, 60) * 10)
+        CacheInvalidation.query.filter(CacheInvalidation.created_at < cutoff).delete(synchronize_session=False)
+
+    def clear(self):
+        self.backend.clear()
+
+    def metrics(self):
+        names = sorted(set(self.hits) | set(self.misses))
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.size(),
+            "evictions": self.backend.evictions,
+            "invalidations": self.invalidations,
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values()),
+            "routes": {
+                name: {"hits": self.hits[name], "misses": self.misses[name]}
+                for name in names
+            },
+        }
+
+    def _invalidate_changes(self, changes):
+        tags = tags_for_changes(changes)
+        self.invalidate(tags)
+        if tags and not self.shared:
+            self._broadcast(tags)
+
+
+class CachedPagination(Pagination):
+    """Pagination over a page of rows restored from the result cache"""
+
+    def _query_items(self):
+        return self._query_args["items"]
+
+    def _query_count(self):
+        return self._query_args["total"]
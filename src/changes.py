@@ -0,0 +1,91 @@
+from collections import namedtuple
+from sqlalchemy import event, inspect
+from db_routing import RoutingSession
+
+# A committed change to a tracked model, captured at flush time so that
+# listeners never need to touch expired instances after the commit
+Change = namedtuple('Change', ['model', 'id', 'op', 'attrs', 'changed'])
+
+# Attributes captured for each tracked model
+TRACKED_ATTRIBUTES = {
+    'Product': ('code', 'quantity'),
+    'Allocation': ('product_id', 'user_id', 'work_number', 'status', 'quantity'),
+    'StockMovement': ('product_id', 'movement_type', 'quantity'),
+    'StockLevel': ('product_id', 'warehouse_id', 'quantity'),
+    'Notification': ('user_id', 'title'),
+    'Work': ('number', 'status'),
+}
+
+_listeners = []
+
+_PENDING_KEY = 'pending_changes'
+
+
+def on_commit(listener):
+    """Register a callable receiving the list of changes after each commit"""
+    _listeners.append(listener)
+    return listener
+
+
+def _capture(instance, op):
+    model = type(instance).__name__
+    names = TRACKED_ATTRIBUTES.get(model)
+    if names is None:
+        return None
+
+    state = inspect(instance)
+    attrs = {name: getattr(instance, name) for name in names}
+    changed = frozenset(
+        attr.key for attr in state.attrs
+        if op == 'update' and attr.history.has_changes()
+    )
+    return Change(model, instance.id, op, attrs, changed)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _collect_updates_and_deletes(session, flush_context, instances):
+    # Attribute history is only available before the flush resets it
+    pending = session.info.setdefault(_PENDING_KEY, [])
+    for instance in session.dirty:
+        if session.is_modified(instance, include_collections=False):
+            change = _capture(instance, 'update')
+            if change:
+                pending.append(change)
+    for instance in session.deleted:
+        change = _capture(instance, 'delete')
+        if change:
+            pending.append(change)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_inserts(session, flush_context):
+    # Primary keys of new rows are only known once they have been flushed
+    pending = session.info.setdefault(_PENDING_KEY, [])
+    for instance in session.new:
+        change = _capture(instance, 'insert')
+        if change:
+            pending.append(change)
+
+
+def publish(changes):
+    """Send changes committed outside the ORM session to the listeners"""
+    for listener in _listeners:
+        listener(changes)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _dispatch(session):
+    # Releasing a savepoint also fires after_commit; wait for the real commit
+    if session.in_nested_transaction():
+        return
+    changes = session.info.pop(_PENDING_KEY, None)
+    if not changes:
+        return
+    publish(changes)
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    if previous_transaction.nested:
+        return
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,33 @@
+import os
+import gzip
+from flask import request
+
+# Dynamic responses worth compressing; static files are precompressed by assets.py
+COMPRESS_MIMETYPES = frozenset({'text/html', 'application/json'})
+
+
+def init_compression(app):
+    """Gzip HTML and JSON responses larger than COMPRESS_MIN_SIZE bytes"""
+    app.config.setdefault("COMPRESS_MIN_SIZE", int(os.environ.get("COMPRESS_MIN_SIZE", "1024")))
+    app.config.setdefault("COMPRESS_LEVEL", int(os.environ.get("COMPRESS_LEVEL", "6")))
+
+    @app.after_request
+    def _compress(response):
+        # Streams (live updates) and files are passed through untouched
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or response.mimetype not in COMPRESS_MIMETYPES
+                or 'Content-Encoding' in response.headers
+                or not request.accept_encodings['gzip']):
+            return response
+
+        data = response.get_data()
+        if len(data) < app.config["COMPRESS_MIN_SIZE"]:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=app.config["COMPRESS_LEVEL"], mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        # The body changed, so a strong validator no longer matches it byte for byte
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,34 @@
+import os
+import sys
+
+
+def async_worker_active():
+    """True when the process runs under gevent with the stdlib monkey-patched"""
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('socket')
+
+
+def offload(func, *args, **kwargs):
+    """Run blocking or CPU-bound work without stalling the event loop
+
+    Under gevent the call runs on the hub's native thread pool, so other
+    greenlets keep serving requests; otherwise it simply runs inline.
+    """
+    if async_worker_active():
+        from gevent import get_hub
+        return get_hub().threadpool.apply(func, args, kwargs)
+    return func(*args, **kwargs)
+
+
+def serving_profile():
+    """Gunicorn worker class in use: WEB_WORKER_CLASS, else gevent when installed, else gthread"""
+    worker_class = os.environ.get("WEB_WORKER_CLASS")
+    if worker_class:
+        return worker_class
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        return "gthread"
+    return "gevent"
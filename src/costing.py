@@ -0,0 +1,159 @@
+from decimal import Decimal, ROUND_HALF_UP
+from flask import current_app
+from sqlalchemy import func, select, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import Product, Allocation, CostLayer, WorkCostTotal
+from timeutils import utcnow
+
+VALUATION_METHODS = ('average', 'fifo')
+
+UNIT = Decimal('0.0001')
+CENTS = Decimal('0.01')
+
+
+def valuation_method():
+    method = current_app.config.get('COST_VALUATION', 'average')
+    if method not in VALUATION_METHODS:
+        raise ValueError(f'método de custeio desconhecido: {method}')
+    return method
+
+
+def _current_average(product_id, lock=False):
+    query = db.session.query(Product.unit_cost).filter_by(id=product_id)
+    if lock:
+        query = query.with_for_update()
+    return Decimal(query.scalar() or 0)
+
+
+def receive(product, quantity, unit_cost=None):
+    """Add received units as a cost layer and update the product's moving average
+
+    Units without a cost (e.g. found in a count) come in at the current
+    average, so they do not change it.
+    """
+    # The product row serializes receipts, which read and rewrite the average
+    average = _current_average(product.id, lock=True)
+    unit_cost = average if unit_cost is None else Decimal(unit_cost).quantize(UNIT)
+    on_hand = db.session.query(func.coalesce(func.sum(CostLayer.remaining), 0)).filter(
+        CostLayer.product_id == product.id
+    ).scalar()
+
+    if unit_cost != average:
+        product.unit_cost = ((average * on_hand + unit_cost * quantity) / (on_hand + quantity)).quantize(UNIT)
+    db.session.add(CostLayer(product_id=product.id, unit_cost=unit_cost, quantity=quantity, remaining=quantity))
+
+
+def consume(product, quantity):
+    """Take units out of the oldest cost layers; returns their cost
+
+    Layers are always consumed oldest first so they keep matching the stock
+    on hand. With FIFO valuation the units cost what those layers cost; with
+    average valuation they cost the current moving average.
+    """
+    # Every layer holds at least one unit, so at most ``quantity`` are needed
+    layers = CostLayer.query.filter(
+        CostLayer.product_id == product.id,
+        CostLayer.remaining > 0
+    ).order_by(CostLayer.id).limit(quantity).with_for_update().populate_existing().all()
+
+    average = _current_average(product.id)
+    layer_cost = Decimal(0)
+    left = quantity
+    for layer in layers:
+        part = min(layer.remaining, left)
+        layer.remaining -= part
+        layer_cost += part * Decimal(layer.unit_cost)
+        left -= part
+        if not left:
+            break
+    # Stock received before costs were tracked has no layer; value it at the average
+    layer_cost += left * average
+
+    cost = layer_cost if valuation_method() == 'fifo' else average * quantity
+    return cost.quantize(CENTS, ROUND_HALF_UP)
+
+
+def charge_allocation(allocation, cost):
+    """Store the cost of an approved allocation and add it to its work's monthly total"""
+    allocation.total_cost = cost
+    allocation.unit_cost = (cost / allocation.quantity).quantize(UNIT)
+    month = (allocation.approved_at or utcnow()).strftime('%Y-%m')
+    _add_work_total(allocation.work_number, month, cost, allocation.quantity)
+
+
+def _add_work_total(work_number, month, cost, quantity):
+    # Increment in place: the row lock only serializes approvals for the
+    # same work and month, and the total never needs a full recount
+    increment = update(WorkCostTotal).where(
+        WorkCostTotal.work_number == work_number,
+        WorkCostTotal.month == month
+    ).values(
+        total_cost=WorkCostTotal.total_cost + cost,
+        quantity=WorkCostTotal.quantity + quantity,
+        allocations=WorkCostTotal.allocations + 1
+    ).execution_options(synchronize_session=False)
+
+    if db.session.execute(increment).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(WorkCostTotal(work_number=work_number, month=month, total_cost=cost,
+                                         quantity=quantity, allocations=1))
+    except IntegrityError:
+        # Another approval created the row first
+        db.session.execute(increment)
+
+
+def _month(column):
+    """'YYYY-MM' of a UTC timestamp column, in SQL"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(func.timezone('UTC', column), 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
+
+
+def rebuild_work_costs():
+    """Recompute all monthly work totals from the approved allocations in one statement"""
+    month = _month(Allocation.approved_at)
+    totals = select(
+        Allocation.work_number,
+        month,
+        func.coalesce(func.sum(Allocation.total_cost), 0),
+        func.sum(Allocation.quantity),
+        func.count(Allocation.id)
+    ).where(
+        Allocation.status == 'approved',
+        Allocation.approved_at.isnot(None)
+    ).group_by(Allocation.work_number, month)
+
+    db.session.execute(delete(WorkCostTotal))
+    db.session.execute(insert(WorkCostTotal).from_select(
+        ['work_number', 'month', 'total_cost', 'quantity', 'allocations'], totals
+    ))
+    return db.session.query(func.count(WorkCostTotal.id)).scalar()
+
+
+def work_cost_subquery():
+    """Total cost per work over all months, for joining into work listings"""
+    return db.session.query(
+        WorkCostTotal.work_number,
+        func.sum(WorkCostTotal.total_cost).label('total_cost')
+    ).group_by(WorkCostTotal.work_number).subquery()
+
+
+def work_cost_months(work_number):
+    return WorkCostTotal.query.filter_by(work_number=work_number).order_by(WorkCostTotal.month).all()
+
+
+def monthly_costs(start=None, end=None):
+    """[(month, total cost, quantity)] over all works; months are inclusive 'YYYY-MM'"""
+    query = db.session.query(
+        WorkCostTotal.month,
+        func.sum(WorkCostTotal.total_cost),
+        func.sum(WorkCostTotal.quantity)
+    )
+    if start:
+        query = query.filter(WorkCostTotal.month >= start)
+    if end:
+        query = query.filter(WorkCostTotal.month <= end)
+    return query.group_by(WorkCostTotal.month).order_by(WorkCostTotal.month).all()
@@ -20,9 +20,10 @@ def show_current_database():
             print(f"📊 Banco atual: {url}")
 
 def create_tables():
-    """Cria todas as tabelas no banco atual"""
+    """Cria ou atualiza as tabelas do banco atual pelas migrações"""
+    from migrate import upgrade
     with app.app_context():
-        db.create_all()
+        upgrade(app)
         print("✅ Tabelas criadas no banco atual")
 
 def show_stats():
@@ -31,8 +32,8 @@ def show_stats():
     
     with app.app_context():
         try:
-            users_count = User.query.count()
-            products_count = Product.query.count()
+            users_count = User.active().count()
+            products_count = Product.active().count()
             allocations_count = Allocation.query.count()
             movements_count = StockMovement.query.count()
             
@@ -45,15 +46,62 @@ def show_stats():
         except Exception as e:
             print(f"❌ Erro ao obter estatísticas: {e}")
 
+def prune_change_log(days=30):
+    """Remove change log entries older than the sync retention window"""
+    from datetime import timedelta
+    from models import ChangeLogEntry
+    from timeutils import utcnow
+    
+    with app.app_context():
+        cutoff = utcnow() - timedelta(days=days)
+        removed = ChangeLogEntry.query.filter(ChangeLogEntry.created_at < cutoff).delete()
+        db.session.commit()
+        print(f"🧹 {removed} registros do log de alterações removidos")
+
+def split_stock(code, slots):
+    """Spread a hot product's stock over several rows per warehouse"""
+    from models import Product
+    from stock import set_stock_slots
+    
+    with app.app_context():
+        product = Product.active().filter_by(code=code).first()
+        if not product:
+            print(f"❌ Produto {code} não encontrado")
+            return
+        set_stock_slots(product, slots)
+        db.session.commit()
+        print(f"✅ Estoque de {code} dividido em {slots} contador(es) por almoxarifado")
+
+def expire_holds():
+    """Release stock held by pending requests past their expiry date"""
+    from stock import expire_holds as release_expired
+    
+    with app.app_context():
+        released = release_expired()
+        print(f"🔓 {released} reservas expiradas liberadas")
+
+def rebuild_costs():
+    """Recompute the per-work monthly cost totals from the allocations"""
+    from costing import rebuild_work_costs
+    
+    with app.app_context():
+        rows = rebuild_work_costs()
+        db.session.commit()
+        print(f"💰 {rows} totais de custo por obra e mês recalculados")
+
 def main():
     if len(sys.argv) < 2:
         print("🔧 Gerenciador de Banco de Dados")
         print("\nComandos disponíveis:")
         print("  status     - Mostra qual banco está sendo usado")
-        print("  create     - Cria todas as tabelas")
+        print("  create     - Cria ou atualiza as tabelas (migrações)")
         print("  stats      - Mostra estatísticas do banco")
         print("  migrate-to-sqlite    - Migra PostgreSQL → SQLite")
         print("  migrate-to-postgres  - Migra SQLite → PostgreSQL")
+        print("  prune-change-log [dias] - Remove alterações antigas do log de sincronização")
+        print("  expire-holds - Libera reservas de estoque expiradas")
+        print("  split-stock <código> <n> - Divide o estoque de um produto muito movimentado em n contadores")
+        print("  rebuild-costs - Recalcula os custos por obra e mês")
         print("\nExemplo: python database_manager.py status")
         return
     
@@ -71,6 +119,15 @@ def main():
     elif command == "migrate-to-postgres":
         from migrate_to_postgres import migrate_sqlite_to_postgres
         migrate_sqlite_to_postgres()
+    elif command == "prune-change-log":
+        days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+        prune_change_log(days)
+    elif command == "expire-holds":
+        expire_holds()
+    elif command == "split-stock" and len(sys.argv) > 3:
+        split_stock(sys.argv[2], int(sys.argv[3]))
+    elif command == "rebuild-costs":
+        rebuild_costs()
     else:
         print(f"❌ Comando desconhecido: {command}")
 
@@ -0,0 +1,127 @@
+import os
+import time
+from flask import g, request, session, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+from concurrency import serving_profile
+
+# Endpoints that only read data and may be served from the replica
+DEFAULT_READ_ONLY_ENDPOINTS = frozenset({
+    'inventory',
+    'search_products',
+    'manage_works',
+    'allocation_history',
+    'api_catalog_snapshot',
+    'api_catalog_changes',
+})
+
+STICKY_SESSION_KEY = '_db_primary_until'
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def postgres_engine_options():
+    """Build PostgreSQL engine options from environment variables"""
+    statement_timeout = _env_int("DB_STATEMENT_TIMEOUT_MS", 0)
+
+    if _env_bool("DB_PGBOUNCER"):
+        # PgBouncer already pools server connections; keeping a second pool
+        # here only pins idle server slots. Startup parameters such as
+        # "options" are rejected in transaction mode, so the statement
+        # timeout is applied per transaction (see init_db_routing).
+        return {"poolclass": NullPool}
+
+    profile = serving_profile()
+    if profile == "gevent":
+        # Hundreds of greenlets share the pool; only requests inside a
+        # query hold a connection, so a small pool with a short wait
+        # protects PostgreSQL's connection limit
+        pool_size, max_overflow, pool_timeout = 10, 10, 10
+    elif profile == "gthread":
+        # One connection per worker thread
+        pool_size, max_overflow, pool_timeout = max(_env_int("WEB_THREADS", 8), 2), 2, 30
+    else:
+        pool_size, max_overflow, pool_timeout = 2, 2, 30
+    options = {
+        "pool_size": _env_int("DB_POOL_SIZE", pool_size),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", max_overflow),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", pool_timeout),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 300),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING"),
+        "pool_use_lifo": True,
+    }
+    if statement_timeout:
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+    return options
+
+
+class RoutingSession(Session):
+    """Session that sends reads from read-only routes to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _replica_requested():
+            return self._db.engines["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _replica_requested():
+    return has_request_context() and g.get("db_use_replica", False)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_write(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def init_db_routing(app, db):
+    """Register replica routing, read-your-writes stickiness and timeouts"""
+    app.config.setdefault("DB_READ_ONLY_ENDPOINTS", set(DEFAULT_READ_ONLY_ENDPOINTS))
+    app.config.setdefault("DB_REPLICA_STICKY_SECONDS", _env_int("DB_REPLICA_STICKY_SECONDS", 5))
+    replica_enabled = "replica" in app.config.get("SQLALCHEMY_BINDS", {})
+
+    statement_timeout = _env_int("DB_STATEMENT_TIMEOUT_MS", 0)
+    if statement_timeout and _env_bool("DB_PGBOUNCER"):
+        with app.app_context():
+            for engine in db.engines.values():
+                _apply_transaction_timeout(engine, statement_timeout)
+
+    if not replica_enabled:
+        return
+
+    @app.before_request
+    def _choose_database():
+        # After a write the user keeps reading from the primary until the
+        # replica has had time to catch up
+        sticky = session.get(STICKY_SESSION_KEY, 0) > time.time()
+        g.db_use_replica = (
+            request.method in ("GET", "HEAD")
+            and request.endpoint in app.config["DB_READ_ONLY_ENDPOINTS"]
+            and not sticky
+        )
+
+    @app.after_request
+    def _stick_to_primary(response):
+        if g.get("db_wrote"):
+            session[STICKY_SESSION_KEY] = time.time() + app.config["DB_REPLICA_STICKY_SECONDS"]
+        return response
+
+
+def _apply_transaction_timeout(engine, timeout_ms):
+    if engine.dialect.name != "postgresql":
+        return
+
+    @event.listens_for(engine, "begin")
+    def _set_local_timeout(conn):
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from flask import current_app
+from changes import on_commit
+from concurrency import async_worker_active
+
+# Seconds between keep-alive comments on idle streams
+HEARTBEAT_SECONDS = 15
+
+# Streams are closed after this long so clients reconnect and workers can recycle
+MAX_STREAM_SECONDS = 300
+
+
+class Subscription:
+    """One connected client, fed by the broker through a bounded queue"""
+
+    def __init__(self, broker, role, user_id, maxsize=100):
+        self.broker = broker
+        self.role = role
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def wants(self, event):
+        roles = event.get('roles')
+        users = event.get('users')
+        if roles is None and users is None:
+            return True
+        return (roles is not None and self.role in roles) or \
+               (users is not None and self.user_id in users)
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Slow client: drop the oldest event rather than block publishers
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(event)
+
+    def stream(self):
+        """Yield Server-Sent Events frames until the stream lifetime expires"""
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        try:
+            yield 'retry: 5000\n\n'
+            while time.monotonic() < deadline:
+                try:
+                    event = self.queue.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+        finally:
+            self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """Fans published events out to the subscriptions of this process"""
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self.backend = LocalEventBackend(self)
+
+    def init_app(self, app):
+        app.config.setdefault("EVENTS_BACKEND", os.environ.get("EVENTS_BACKEND", "local"))
+        app.config.setdefault("EVENTS_REDIS_URL", os.environ.get("EVENTS_REDIS_URL", ""))
+
+        if app.config["EVENTS_BACKEND"] == "redis":
+            try:
+                import redis
+            except ImportError:
+                logging.warning("EVENTS_BACKEND=redis mas o pacote redis não está instalado; usando broker local")
+            else:
+                self.backend = RedisEventBackend(self, redis.Redis.from_url(app.config["EVENTS_REDIS_URL"]))
+
+        app.extensions["event_broker"] = self
+        app.context_processor(lambda: {"live_updates_mode": self.live_mode})
+        on_commit(self._publish_changes)
+
+    def live_mode(self):
+        """How open pages get updates: "stream", "poll" or "off" (LIVE_UPDATES)
+
+        "auto" streams only where it is cheap and complete: under gevent, as
+        each open stream holds a thread elsewhere, and with the Redis
+        backend, as the local broker reaches only its own process; the
+        other web workers and the job worker, which commits notification
+        digests and expired holds, would go unheard.
+        """
+        mode = current_app.config["LIVE_UPDATES"]
+        if mode != "auto":
+            return mode
+        if not async_worker_active() or not isinstance(self.backend, RedisEventBackend):
+            return "poll"
+        return "stream"
+
+    def subscribe(self, role, user_id):
+        subscription = Subscription(self, role, user_id)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def subscriber_count(self):
+        return len(self._subscriptions)
+
+    def publish(self, event_type, data, roles=None, users=None):
+        """Publish an event to every process through the configured backend"""
+        self.backend.publish({
+            'type': event_type,
+            'data': data,
+            'roles': list(roles) if roles is not None else None,
+            'users': list(users) if users is not None else None,
+        })
+
+    def dispatch(self, event):
+        """Deliver an event to the local subscriptions that want it"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.wants(event):
+                subscription.deliver(event)
+
+    def _publish_changes(self, changes):
+        for event_type, data, roles, users in events_for_changes(changes):
+            self.publish(event_type, data, roles=roles, users=users)
+
+
+class LocalEventBackend:
+    """Delivers events within the current process only"""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publish(self, event):
+        self.broker.dispatch(event)
+
+
+class RedisEventBackend:
+    """Relays events through Redis pub/sub so every worker sees them"""
+
+    channel = 'almox:events'
+
+    def __init__(self, broker, client):
+        self.broker = broker
+        self.client = client
+        self._listener = threading.Thread(target=self._listen, name='event-listener', daemon=True)
+        self._listener.start()
+
+    def publish(self, event):
+        self.client.publish(self.channel, json.dumps(event))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self.broker.dispatch(json.loads(message['data']))
+            except Exception as e:
+                logging.error(f"Erro no listener de eventos: {e}")
+                time.sleep(5)
+
+
+def events_for_changes(changes):
+    """Translate committed model changes into client events"""
+    for change in changes:
+        if change.model == 'Allocation':
+            attrs = change.attrs
+            data = {
+                'id': change.id,
+                'product_id': attrs['product_id'],
+                'work_number': attrs['work_number'],
+                'quantity': attrs['quantity'],
+                'status': attrs['status'],
+            }
+            if change.op == 'insert' and attrs['status'] == 'pending':
+                yield 'request.created', data, ['almoxarifado'], None
+            elif change.op == 'update' and 'status' in change.changed:
+                yield 'request.updated', data, ['almoxarifado'], [attrs['user_id']]
+        elif change.model == 'Notification' and change.op == 'insert':
+            data = {'id': change.id, 'title': change.attrs['title']}
+            yield 'notification.created', data, [], [change.attrs['user_id']]
+        elif change.model == 'Product' and change.op != 'delete':
+            if change.op == 'insert' or 'quantity' in change.changed:
+                data = {'id': change.id, 'code': change.attrs['code'], 'quantity': change.attrs['quantity']}
+                yield 'stock.changed', data, None, None
@@ -1,8 +1,28 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, PasswordField, SelectField, IntegerField, TextAreaField, BooleanField, HiddenField
-from wtforms.validators import DataRequired, Email, Length, NumberRange, ValidationError, EqualTo
-from models import User, Product
+from wtforms import StringField, PasswordField, SelectField, IntegerField, DecimalField, TextAreaField, BooleanField, HiddenField
+from wtforms.validators import DataRequired, Email, Length, NumberRange, ValidationError, EqualTo, Optional
+from models import User, Product, Warehouse, Work
+from stock import warehouse_choices
+from idempotency import new_key, MAX_KEY_LENGTH
+from notifications import SUBSCRIPTION_KINDS
+from utils import normalize_work_number
+
+class WarehouseChoicesMixin:
+    """Fill the warehouse_id select with the active warehouses; blank means the default site"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.warehouse_id.choices = warehouse_choices()
+
+class WorkNumberMixin:
+    """Normalize work_number and refuse closed works"""
+    def validate_work_number(self, field):
+        field.data = normalize_work_number(field.data)
+        if not field.data:
+            raise ValidationError('Número da obra inválido.')
+        work = Work.query.filter_by(number=field.data).first()
+        if work is not None and not work.is_open:
+            raise ValidationError(f'A obra {field.data} está encerrada.')
 
 class LoginForm(FlaskForm):
     username = StringField('Usuário', validators=[DataRequired(), Length(min=3, max=64)])
@@ -40,12 +60,14 @@ class EditEmployeeForm(FlaskForm):
 
 # SupplierForm removed - using text field instead
 
-class ProductForm(FlaskForm):
+class ProductForm(WarehouseChoicesMixin, FlaskForm):
     code = StringField('Código', validators=[DataRequired(), Length(max=50)])
     name = StringField('Nome do Produto', validators=[DataRequired(), Length(max=200)])
     supplier_reference = StringField('Referência do Fornecedor', validators=[Length(max=100)])
     location = StringField('Local', validators=[DataRequired(), Length(max=100)])
     quantity = IntegerField('Quantidade', validators=[DataRequired(), NumberRange(min=0)])
+    unit_cost = DecimalField('Custo Unitário (R$)', places=4, validators=[Optional(), NumberRange(min=0)])
+    warehouse_id = SelectField('Almoxarifado', coerce=int, validators=[Optional()])
     unit = SelectField('Unidade', choices=[
         ('unidade', 'Unidade'),
         ('metros', 'Metros'),
@@ -59,36 +81,81 @@ class ProductForm(FlaskForm):
 
 
     def validate_code(self, field):
-        # Check if code exists and if it's not the current product being edited
-        existing_product = Product.query.filter_by(code=field.data).first()
-        if existing_product and (not hasattr(self, 'product_id') or existing_product.id != self.product_id):
+        # An unchanged code of the product being edited needs no lookup
+        product = getattr(self, 'product', None)
+        if product is not None and field.data == product.code:
+            return
+        existing_product = Product.active().filter_by(code=field.data).first()
+        if existing_product and (product is None or existing_product.id != product.id):
             raise ValidationError('Este código já está sendo usado por outro produto.')
 
-class AllocationForm(FlaskForm):
+class AllocationForm(WorkNumberMixin, WarehouseChoicesMixin, FlaskForm):
     product_search = StringField('Buscar Produto', validators=[DataRequired()])
     product_id = HiddenField('Product ID', validators=[DataRequired()])
+    warehouse_id = SelectField('Almoxarifado', coerce=int, validators=[Optional()])
     work_number = StringField('Número da Obra', validators=[DataRequired(), Length(max=50)])
     quantity = IntegerField('Quantidade', validators=[DataRequired(), NumberRange(min=1)])
     notes = TextAreaField('Observações')
+    # New for every rendered form, so resubmitting it is recognized
+    idempotency_key = HiddenField(default=new_key, validators=[Length(max=MAX_KEY_LENGTH)])
 
-class StockAdjustmentForm(FlaskForm):
+class StockAdjustmentForm(WarehouseChoicesMixin, FlaskForm):
+    warehouse_id = SelectField('Almoxarifado', coerce=int, validators=[Optional()])
     adjustment_type = SelectField('Tipo de Ajuste', choices=[
         ('add', 'Adicionar Estoque'),
         ('remove', 'Remover Estoque')
     ], validators=[DataRequired()])
     quantity = IntegerField('Quantidade', validators=[DataRequired(), NumberRange(min=1)])
+    unit_cost = DecimalField('Custo Unitário (R$)', places=4, validators=[Optional(), NumberRange(min=0)])
     notes = TextAreaField('Observações', validators=[DataRequired()])
 
-class ProductionRequestForm(FlaskForm):
+class CycleCountForm(WarehouseChoicesMixin, FlaskForm):
+    location = HiddenField('Local', validators=[DataRequired(), Length(max=100)])
+    warehouse_id = SelectField('Almoxarifado', coerce=int, validators=[Optional()])
+    notes = TextAreaField('Observações')
+
+class ProductionRequestForm(WorkNumberMixin, WarehouseChoicesMixin, FlaskForm):
     product_search = StringField('Buscar Produto', validators=[DataRequired()])
     product_id = HiddenField('Product ID', validators=[DataRequired()])
+    warehouse_id = SelectField('Almoxarifado', coerce=int, validators=[Optional()])
     work_number = StringField('Número da Obra', validators=[DataRequired(), Length(max=50)])
     quantity = IntegerField('Quantidade', validators=[DataRequired(), NumberRange(min=1)])
     notes = TextAreaField('Observações/Justificativa')
+    # New for every rendered form, so resubmitting it is recognized
+    idempotency_key = HiddenField(default=new_key, validators=[Length(max=MAX_KEY_LENGTH)])
 
 class ApprovalForm(FlaskForm):
     action = SelectField('Ação', choices=[
         ('approved', 'Aprovar'),
         ('rejected', 'Rejeitar')
     ], validators=[DataRequired()])
-    approval_notes = TextAreaField('Observações da Aprovação')
\ No newline at end of file
+    approval_notes = TextAreaField('Observações da Aprovação')
+class WarehouseForm(FlaskForm):
+    # Stored upper case; the uniqueness check below sees the stored form
+    code = StringField('Código', validators=[DataRequired(), Length(max=20)],
+                       filters=[lambda value: value.strip().upper() if value else value])
+    name = StringField('Nome', validators=[DataRequired(), Length(max=100)])
+
+    def validate_code(self, field):
+        if Warehouse.query.filter_by(code=field.data).first():
+            raise ValidationError('Este código já está sendo usado por outro almoxarifado.')
+
+class SubscriptionForm(FlaskForm):
+    kind = SelectField('Acompanhar', choices=list(SUBSCRIPTION_KINDS.items()), validators=[DataRequired()])
+    target = StringField('Número da obra ou código do produto', validators=[Length(max=50)])
+    email = BooleanField('Receber também por email', default=True)
+
+    def validate_target(self, field):
+        field.data = (field.data or '').strip()
+        if self.kind.data == 'requests':
+            field.data = ''
+        elif not field.data:
+            raise ValidationError('Informe o número da obra ou o código do produto.')
+        elif self.kind.data == 'work':
+            field.data = normalize_work_number(field.data)
+        elif self.kind.data == 'low_stock':
+            product = Product.active().filter_by(code=field.data).first()
+            if product is None:
+                raise ValidationError('Produto não encontrado.')
+            # Stored by id, so the subscription survives a code change
+            field.data = str(product.id)
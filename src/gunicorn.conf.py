@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import threading
+import subprocess
+from concurrency import serving_profile
+
+
+# Serving profile, selected with WEB_WORKER_CLASS:
+#   gevent  - cooperative workers for many concurrent live-update streams and
+#             slow clients (default when the "async" extra is installed)
+#   gthread - a pool of threads per worker; each open stream holds one
+#             thread, not a whole worker
+#   sync    - the previous behaviour, one request per worker
+worker_class = serving_profile()
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("WEB_THREADS", "8"))
+worker_connections = int(os.environ.get("WEB_WORKER_CONNECTIONS", "1000"))
+
+bind = os.environ.get("WEB_BIND", "0.0.0.0:5000")
+reuse_port = True
+timeout = int(os.environ.get("WEB_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+# The database pool follows the profile (see db_routing.postgres_engine_options):
+# one connection per thread for gthread, a bounded shared pool for gevent.
+
+# The master also runs the background job worker (jobs.py), restarted if it
+# dies; JOB_WORKER=off when the worker runs as a process of its own
+job_worker = os.environ.get("JOB_WORKER", "on") != "off"
+
+
+def when_ready(server):
+    if not job_worker:
+        return
+
+    def supervise():
+        while not getattr(server, "job_worker_stopping", False):
+            server.job_worker = subprocess.Popen([sys.executable, "jobs.py", "worker"])
+            code = server.job_worker.wait()
+            if getattr(server, "job_worker_stopping", False):
+                return
+            server.log.warning(f"Worker de tarefas encerrou (código {code}); reiniciando em 5s")
+            time.sleep(5)
+
+    threading.Thread(target=supervise, name="job-worker", daemon=True).start()
+
+
+def on_exit(server):
+    server.job_worker_stopping = True
+    process = getattr(server, "job_worker", None)
+    if process is not None and process.poll() is None:
+        # SIGTERM lets the worker finish the job it is running
+        process.terminate()
+        try:
+            process.wait(graceful_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        if not os.environ.get("DATABASE_URL", "").startswith("postgres"):
+            server.log.warning("Perfil gevent com SQLite: cada consulta bloqueia todas as conexões do worker")
+        # Make psycopg2 yield to other greenlets while waiting on PostgreSQL
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning("psycogreen não instalado; consultas ao PostgreSQL bloquearão o worker gevent")
+        else:
+            patch_psycopg()
@@ -0,0 +1,122 @@
+import time
+import hashlib
+from functools import wraps
+from flask import g, request, session, make_response, render_template, current_app
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import func, select
+from app import db, cache
+from cache import product_tag
+
+# Rendered pages embed CSRF tokens, so a cached page is only reused within
+# this window even if the catalog did not change
+CSRF_BUCKET_SECONDS = 1800
+
+
+def catalog_version():
+    """Cheap catalog version: last product update, product count and last movement id"""
+    if 'catalog_version' not in g:
+        g.catalog_version = cache.get_or_set(
+            'catalog_version', None, _load_catalog_version,
+            tags=['catalog', 'stock'],
+            ttl=current_app.config.get('CATALOG_VERSION_TTL', 5)
+        )
+    return g.catalog_version
+
+
+def _load_catalog_version():
+    from models import Product, StockMovement
+
+    last_movement = select(func.max(StockMovement.id)).scalar_subquery()
+    updated_at, product_count, movement_id = db.session.query(
+        func.max(Product.updated_at), func.count(Product.id), last_movement
+    ).one()
+    return {
+        'updated_at': updated_at,
+        'token': f'{updated_at.isoformat() if updated_at else "0"}-{product_count}-{movement_id or 0}',
+    }
+
+
+def _page_etag(version):
+    # The page also depends on who is looking at it, on the query string and
+    # on the unread notification badge of the navigation bar
+    parts = [
+        version['token'],
+        request.full_path,
+        str(current_user.get_id()),
+        current_user.username,
+        current_user.role,
+        str(current_user.is_admin),
+        str(current_user.unread_notifications),
+        str(int(time.time() // CSRF_BUCKET_SECONDS)),
+    ]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def conditional_page(view):
+    """Answer 304 Not Modified for catalog pages that have not changed
+
+    Only If-None-Match is honoured: a Last-Modified date would cover the
+    catalog alone, not the user, the query string or the notification badge.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Pending flash messages are shown exactly once, so render normally
+        if session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        version = catalog_version()
+        etag = _page_etag(version)
+        not_modified = request.if_none_match.contains_weak(etag)
+
+        response = make_response('', 304) if not_modified else make_response(view(*args, **kwargs))
+        if response.status_code in (200, 304):
+            response.set_etag(etag, weak=True)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        return response
+    return wrapper
+
+
+def conditional_catalog_json(view):
+    """Browser-cacheable catalog data: reused for SEARCH_MAX_AGE, then revalidated
+
+    Unlike pages the response does not depend on the user, so the ETag is
+    the catalog version and the query string alone.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = catalog_version()
+        etag = hashlib.sha1(f"{version['token']}|{request.full_path}".encode()).hexdigest()
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+        if response.status_code in (200, 304):
+            response.set_etag(etag, weak=True)
+            response.cache_control.private = True
+            response.cache_control.max_age = current_app.config['SEARCH_MAX_AGE']
+        return response
+    return wrapper
+
+
+def render_product_row(product):
+    """Render an inventory table row, reusing the cached fragment for this product version"""
+    params = {
+        'id': product.id,
+        'updated_at': product.updated_at,
+        'quantity': product.quantity,
+        'reserved_quantity': product.reserved_quantity,
+        'role': current_user.role,
+    }
+    return cache.get_or_set(
+        'inventory_row', params,
+        lambda: Markup(render_template('partials/inventory_row.html', product=product)),
+        tags=[product_tag(product.id)]
+    )
+
+
+def init_http_cache(app):
+    app.config.setdefault('CATALOG_VERSION_TTL', 5)
+    app.config.setdefault('SEARCH_MAX_AGE', 10)
+    app.add_template_global(render_product_row)
@@ -0,0 +1,47 @@
+from uuid import uuid4
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import IdempotencyKey
+from timeutils import utcnow
+
+# Submissions carry a key generated once per form or queued request; the
+# first one stores it with the allocation it created, and repeats of the
+# same key (double clicks, retries after a timeout) get that allocation back
+MAX_KEY_LENGTH = 64
+
+
+def new_key():
+    return uuid4().hex
+
+
+def find_key(user_id, key):
+    return IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+
+
+def claim_key(user_id, key):
+    """Store the key in the caller's transaction, before anything it guards
+
+    Returns (record, replay): with replay False the caller goes ahead and
+    links its allocation to the record; with replay True the key was used
+    already and the record is the stored one. A concurrent submission of the
+    same key waits on the unique constraint and gets the replay once the
+    first one commits.
+    """
+    existing = find_key(user_id, key)
+    if existing:
+        return existing, True
+    record = IdempotencyKey(key=key, user_id=user_id)
+    try:
+        with db.session.begin_nested():
+            db.session.add(record)
+    except IntegrityError:
+        return find_key(user_id, key), True
+    return record, False
+
+
+def prune_keys(hours=None):
+    """Delete keys past IDEMPOTENCY_TTL_HOURS; returns how many"""
+    cutoff = utcnow() - timedelta(hours=hours or current_app.config['IDEMPOTENCY_TTL_HOURS'])
+    return IdempotencyKey.query.filter(IdempotencyKey.created_at < cutoff).delete(synchronize_session=False)
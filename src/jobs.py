@@ -0,0 +1,398 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import signal
+import socket
+import logging
+import traceback
+import importlib.util
+from collections import namedtuple
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+from app import db, cache
+from models import Job, User, ChangeLogEntry
+from timeutils import utcnow
+
+JobSpec = namedtuple('JobSpec', 'function max_attempts concurrency')
+
+# Registered job functions by name, see @job
+JOBS = {}
+
+# Arbitrary key of the PostgreSQL advisory lock that serializes claims
+CLAIM_LOCK_KEY = 72_810_039
+
+
+def job(name, max_attempts=3, concurrency=1):
+    """Register a function as a background job
+
+    The function receives the job payload as keyword arguments and runs in
+    an app context on the worker; whatever it leaves uncommitted is
+    committed together with the job's status. ``concurrency`` limits how
+    many runs of this job may execute at once over all workers.
+    """
+    def register(function):
+        JOBS[name] = JobSpec(function, max_attempts, concurrency)
+        return function
+    return register
+
+
+def enqueue(name, payload=None, run_at=None, unique_key=None):
+    """Queue a job in the caller's transaction; it runs once that commits"""
+    if name not in JOBS:
+        raise ValueError(f'tarefa desconhecida: {name}')
+    queued = Job(
+        name=name,
+        payload=json.dumps(payload) if payload else None,
+        unique_key=unique_key,
+        max_attempts=JOBS[name].max_attempts,
+        run_at=run_at or utcnow()
+    )
+    db.session.add(queued)
+    return queued
+
+
+def schedule():
+    """{job name: interval in seconds} of the periodic jobs enabled by the config"""
+    config = current_app.config
+    intervals = {
+        'expire_holds': config['RESERVATION_SWEEP_SECONDS'],
+        'clear_reset_tokens': 3600,
+        'prune_idempotency_keys': 3600,
+        'dispatch_notifications': config['NOTIFY_DIGEST_SECONDS'],
+        'prune_notifications': 86400,
+        'prune_change_log': 86400,
+        'prune_cache_invalidations': 3600 if not cache.shared else 0,
+        'prune_jobs': 86400,
+        'rebuild_work_costs': 86400,
+        'warm_cache': config['CACHE_WARM_SECONDS'] if cache.shared else 0,
+        'export_analytics': config['ANALYTICS_EXPORT_SECONDS'] if importlib.util.find_spec('pyarrow') else 0,
+    }
+    return {name: interval for name, interval in intervals.items() if interval > 0}
+
+
+def schedule_due():
+    """Queue the periodic jobs whose current interval has no run yet"""
+    now = time.time()
+    for name, interval in schedule().items():
+        # One run per interval slot; the unique key keeps several workers
+        # from queueing the same run
+        unique_key = f'{name}:{int(now // interval)}'
+        if Job.query.filter_by(unique_key=unique_key).first():
+            continue
+        try:
+            with db.session.begin_nested():
+                enqueue(name, unique_key=unique_key)
+        except IntegrityError:
+            pass
+    db.session.commit()
+
+
+def requeue_stale():
+    """Put back jobs whose worker died while running them"""
+    cutoff = utcnow() - timedelta(seconds=current_app.config['JOB_TIMEOUT_SECONDS'])
+    stale = Job.query.filter(Job.status == 'running', Job.started_at < cutoff).all()
+    for stale_job in stale:
+        _retry_or_fail(stale_job, 'Tempo limite excedido (worker interrompido?)')
+    if stale:
+        db.session.commit()
+    return len(stale)
+
+
+def claim(worker_id):
+    """Mark the next due job as running for this worker; returns it or None"""
+    if db.engine.dialect.name == 'postgresql':
+        # Held until the commit below: the running counts stay true until the
+        # claimed job is marked running, so no concurrency limit is overshot
+        db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': CLAIM_LOCK_KEY})
+    running = db.session.query(Job.name, func.count(Job.id)).filter(Job.status == 'running').group_by(Job.name).all()
+    busy = [name for name, count in running if name in JOBS and count >= JOBS[name].concurrency]
+
+    query = Job.query.filter(Job.status == 'queued', Job.run_at <= utcnow())
+    if busy:
+        query = query.filter(Job.name.notin_(busy))
+    # SKIP LOCKED passes over a row being updated elsewhere (e.g. a retry from
+    # the admin page); SQLite ignores it and relies on running a single worker
+    claimed = query.order_by(Job.run_at, Job.id).limit(1).with_for_update(skip_locked=True).first()
+    if claimed is None:
+        db.session.rollback()
+        return None
+
+    claimed.status = 'running'
+    claimed.attempts += 1
+    claimed.started_at = utcnow()
+    claimed.finished_at = None
+    claimed.worker = worker_id
+    db.session.commit()
+    return claimed
+
+
+def run_job(claimed):
+    """Execute a claimed job and record the outcome"""
+    job_id = claimed.id
+    spec = JOBS.get(claimed.name)
+    try:
+        if spec is None:
+            raise LookupError(f'tarefa desconhecida: {claimed.name}')
+        spec.function(**json.loads(claimed.payload or '{}'))
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Erro na tarefa {claimed.name} ({job_id}): {e}")
+        failed = db.session.get(Job, job_id)
+        error = traceback.format_exc(limit=5)
+        if spec is None:
+            failed.status = 'failed'
+            failed.finished_at = utcnow()
+            failed.last_error = error
+        else:
+            _retry_or_fail(failed, error)
+        db.session.commit()
+        return False
+
+    done = db.session.get(Job, job_id)
+    done.status = 'done'
+    done.finished_at = utcnow()
+    done.last_error = None
+    db.session.commit()
+    return True
+
+
+def _retry_or_fail(failed, error):
+    failed.last_error = error
+    if failed.attempts < failed.max_attempts:
+        # Exponential backoff: 1x, 2x, 4x... the base delay
+        delay = current_app.config['JOB_RETRY_SECONDS'] * 2 ** (failed.attempts - 1)
+        failed.status = 'queued'
+        failed.run_at = utcnow() + timedelta(seconds=delay)
+    else:
+        failed.status = 'failed'
+        failed.finished_at = utcnow()
+
+
+def retry(failed):
+    """Queue a failed job again with a fresh set of attempts"""
+    failed.status = 'queued'
+    failed.attempts = 0
+    failed.run_at = utcnow()
+    failed.finished_at = None
+
+
+def _single_worker_lock(app):
+    # SQLite has no SKIP LOCKED: only one worker may claim jobs
+    path = os.path.join(app.instance_path, 'jobs-worker.lock')
+    lock = open(path, 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+def run_worker(app, once=False):
+    """Claim and run jobs until stopped (SIGTERM/SIGINT finish the current job first)"""
+    with app.app_context():
+        sqlite = db.engine.dialect.name == 'sqlite'
+    lock = _single_worker_lock(app) if sqlite else None
+    if sqlite and lock is None:
+        print("❌ Já existe um worker de tarefas em execução (SQLite aceita apenas um)")
+        return
+
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    poll = app.config['JOB_POLL_SECONDS']
+    stopping = []
+    if not once:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stopping.append(True))
+
+    logging.info(f"Worker de tarefas {worker_id} iniciado")
+    while not stopping:
+        claimed = None
+        with app.app_context():
+            try:
+                schedule_due()
+                requeue_stale()
+                claimed = claim(worker_id)
+                if claimed:
+                    run_job(claimed)
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Erro no worker de tarefas: {e}")
+            finally:
+                db.session.remove()
+        if once and claimed is None:
+            break
+        if claimed is None:
+            time.sleep(poll)
+    logging.info(f"Worker de tarefas {worker_id} encerrado")
+
+
+def queue_health():
+    """Signs that no worker is running jobs, as messages; empty when all is well
+
+    Due jobs waiting longer than JOB_STALE_SECONDS, or no job started within
+    the shortest periodic interval plus that margin (the periodic jobs are
+    queued by the worker itself, so without one the queue stays empty).
+    """
+    stale_after = current_app.config['JOB_STALE_SECONDS']
+    now = utcnow()
+    problems = []
+
+    oldest_due = db.session.query(func.min(Job.run_at)).filter(Job.status == 'queued', Job.run_at <= now).scalar()
+    if oldest_due is not None and (now - oldest_due).total_seconds() > stale_after:
+        waiting = int((now - oldest_due).total_seconds() // 60)
+        problems.append(f'Há tarefas na fila esperando há {waiting} min; o worker de tarefas está parado?')
+
+    intervals = schedule()
+    if intervals:
+        last_start = db.session.query(func.max(Job.started_at)).scalar()
+        if last_start is None or (now - last_start).total_seconds() > min(intervals.values()) + stale_after:
+            problems.append('Nenhuma tarefa periódica foi iniciada recentemente; o worker de tarefas está parado?')
+    return problems
+
+
+def job_status():
+    """Counts by status, schedule with the last run of each job, and recent jobs"""
+    counts = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+    last_runs = {
+        name: (finished_at, attempts)
+        for name, finished_at, attempts in db.session.query(
+            Job.name, func.max(Job.finished_at), func.count(Job.id)
+        ).filter(Job.status == 'done').group_by(Job.name)
+    }
+    recent = Job.query.order_by(Job.id.desc()).limit(50).all()
+    return counts, last_runs, recent
+
+
+# Maintenance and reporting jobs
+
+@job('expire_holds')
+def _expire_holds():
+    from stock import expire_holds
+    released = expire_holds()
+    if released:
+        logging.info(f"{released} reservas de estoque expiradas liberadas")
+
+
+@job('send_reset_email', max_attempts=5)
+def _send_reset_email(user_id, token):
+    from utils import send_reset_email
+    user = db.session.get(User, user_id)
+    # A newer request replaced the token; its own job sends that one
+    if user is None or user.reset_token != token:
+        return
+    if not send_reset_email(user, token):
+        raise RuntimeError('falha ao enviar email de redefinição de senha')
+
+
+@job('clear_reset_tokens')
+def _clear_reset_tokens():
+    User.query.filter(User.reset_token_expires < utcnow()).update(
+        {'reset_token': None, 'reset_token_expires': None}, synchronize_session=False
+    )
+
+
+@job('prune_idempotency_keys')
+def _prune_idempotency_keys():
+    from idempotency import prune_keys
+    prune_keys()
+
+
+@job('dispatch_notifications')
+def _dispatch_notifications():
+    from notifications import dispatch
+    created = dispatch()
+    if created:
+        logging.info(f"{len(created)} notificações criadas")
+
+
+@job('send_notification_email', max_attempts=5)
+def _send_notification_email(notification_id):
+    from models import Notification
+    from utils import send_notification_email
+    notification = db.session.get(Notification, notification_id)
+    # Already seen in the app
+    if notification is None or notification.read_at is not None:
+        return
+    if not send_notification_email(notification.user, notification):
+        raise RuntimeError('falha ao enviar email de notificação')
+
+
+@job('prune_notifications')
+def _prune_notifications():
+    from notifications import prune_notifications
+    prune_notifications()
+
+
+@job('prune_change_log')
+def _prune_change_log(days=30):
+    cutoff = utcnow() - timedelta(days=days)
+    ChangeLogEntry.query.filter(ChangeLogEntry.created_at < cutoff).delete(synchronize_session=False)
+
+
+@job('prune_cache_invalidations')
+def _prune_cache_invalidations():
+    cache.prune()
+
+
+@job('prune_jobs')
+def _prune_jobs(days=None):
+    cutoff = utcnow() - timedelta(days=days or current_app.config['JOB_RETENTION_DAYS'])
+    Job.query.filter(Job.status.in_(['done', 'failed']), Job.finished_at < cutoff).delete(synchronize_session=False)
+
+
+@job('rebuild_work_costs')
+def _rebuild_work_costs():
+    from costing import rebuild_work_costs
+    rebuild_work_costs()
+
+
+@job('warm_cache')
+def _warm_cache():
+    import routes
+    routes.warm_cache()
+
+
+@job('export_analytics', max_attempts=2)
+def _export_analytics(fmt=None):
+    from analytics import export_all
+    export_all(fmt)
+
+
+def main():
+    from app import app
+
+    if len(sys.argv) < 2:
+        print("⏱️  Tarefas em segundo plano")
+        print("\nComandos disponíveis:")
+        print("  worker              - Executa as tarefas da fila e as periódicas")
+        print("  run-once            - Executa as tarefas pendentes e sai")
+        print("  enqueue <tarefa>    - Coloca uma tarefa na fila")
+        print("  list                - Lista as tarefas registradas e os intervalos")
+        return
+
+    command = sys.argv[1].lower()
+    if command == "worker":
+        run_worker(app)
+    elif command == "run-once":
+        run_worker(app, once=True)
+    elif command == "enqueue" and len(sys.argv) > 2:
+        with app.app_context():
+            queued = enqueue(sys.argv[2])
+            db.session.commit()
+            print(f"✅ Tarefa {queued.name} na fila (#{queued.id})")
+    elif command == "list":
+        with app.app_context():
+            intervals = schedule()
+            for name in sorted(JOBS):
+                interval = intervals.get(name)
+                print(f"  {name:<20} {f'a cada {interval}s' if interval else 'sob demanda'}")
+    else:
+        print(f"❌ Comando desconhecido: {command}")
+
+
+if __name__ == "__main__":
+    main()
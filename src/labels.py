@@ -0,0 +1,97 @@
+"""Barcode and QR labels for product codes
+
+Code 128 is drawn here as SVG; QR codes need the optional segno package.
+Labels carry the plain product code, which is what /api/v1/scan looks up.
+"""
+import functools
+import logging
+from markupsafe import Markup
+
+logger = logging.getLogger(__name__)
+
+# Labels on one printed sheet
+MAX_LABELS = 500
+
+LABEL_KINDS = {'barcode': 'Código de barras', 'qr': 'QR Code'}
+
+# Bar/space widths of the Code 128 symbols 0-105, then the stop symbol
+_CODE128_PATTERNS = (
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213', '122312', '132212', '221213',
+    '221312', '231212', '112232', '122132', '122231', '113222', '123122', '123221', '223211', '221132',
+    '221231', '213212', '223112', '312131', '311222', '321122', '321221', '312212', '322112', '322211',
+    '212123', '212321', '232121', '111323', '131123', '131321', '112313', '132113', '132311', '211313',
+    '231113', '231311', '112133', '112331', '132131', '113123', '113321', '133121', '313121', '211331',
+    '231131', '213113', '213311', '213131', '311123', '311321', '331121', '312113', '312311', '332111',
+    '314111', '221411', '431111', '111224', '111422', '121124', '121421', '141122', '141221', '112214',
+    '112412', '122114', '122411', '142112', '142211', '241211', '221114', '413111', '241112', '134111',
+    '111242', '121142', '121241', '114212', '124112', '124211', '411212', '421112', '421211', '212141',
+    '214121', '412121', '111143', '111341', '131141', '114113', '114311', '411113', '411311', '113141',
+    '114131', '311141', '411131', '211412', '211214', '211232', '2331112',
+)
+_START_B = 104
+_START_C = 105
+_STOP = 106
+# Blank modules required on each side of the bars
+_QUIET_ZONE = 10
+
+
+def code128_values(text):
+    """Symbol values of text in Code 128, check symbol and stop included
+
+    All-digit codes of even length use set C (two digits per symbol), the
+    rest set B, which covers printable ASCII.
+    """
+    if any(not 32 <= ord(char) <= 126 for char in text):
+        raise ValueError(f'caractere não suportado no código de barras: {text!r}')
+    if text.isdigit() and len(text) % 2 == 0:
+        values = [_START_C] + [int(text[i:i + 2]) for i in range(0, len(text), 2)]
+    else:
+        values = [_START_B] + [ord(char) - 32 for char in text]
+    check = (values[0] + sum(position * value for position, value in enumerate(values[1:], 1))) % 103
+    return values + [check, _STOP]
+
+
+@functools.lru_cache(maxsize=4096)
+def code128_svg(text, module=2, height=60):
+    """Code 128 symbol of text as inline SVG, ``module`` pixels per narrow bar"""
+    bars = []
+    x = _QUIET_ZONE
+    for value in code128_values(text):
+        for position, width in enumerate(_CODE128_PATTERNS[value]):
+            width = int(width)
+            # Patterns alternate bar and space, starting with a bar
+            if position % 2 == 0:
+                bars.append(f'M{x * module} 0h{width * module}v{height}h-{width * module}z')
+            x += width
+    total = (x + _QUIET_ZONE) * module
+    return Markup(
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {total} {height}" '
+        f'width="{total}" height="{height}" role="img" aria-label="{Markup.escape(text)}">'
+        f'<rect width="100%" height="100%" fill="#fff"/><path d="{"".join(bars)}" fill="#000"/></svg>'
+    )
+
+
+def _segno():
+    try:
+        import segno
+    except ImportError:
+        return None
+    return segno
+
+
+def qr_available():
+    return _segno() is not None
+
+
+@functools.lru_cache(maxsize=4096)
+def qr_svg(text, scale=3):
+    """QR code of text as inline SVG, or None without the segno package"""
+    segno = _segno()
+    if segno is None:
+        logger.warning("Etiquetas QR requerem o pacote segno (pip install segno)")
+        return None
+    return Markup(segno.make(text, error='m').svg_inline(scale=scale, border=2))
+
+
+def label_svg(text, kind):
+    return qr_svg(text) if kind == 'qr' else code128_svg(text)
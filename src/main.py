@@ -1,5 +1,13 @@
+import os
+
+if __name__ == "__main__":
+    # The development server applies pending migrations before serving;
+    # everything else only checks that none is pending (MIGRATE_ON_BOOT)
+    os.environ.setdefault("MIGRATE_ON_BOOT", "upgrade")
+
 from app import app
 import routes
+import api
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
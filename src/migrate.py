@@ -0,0 +1,386 @@
+"""Versioned schema migrations
+
+Each file in migrations/ is named NNNN_name.py and defines upgrade(op),
+which changes the schema through the Operations helpers below. Applied
+versions are recorded in schema_migrations; `python migrate.py upgrade`
+runs the missing ones in order at deploy time, and the app only checks at
+startup that none is pending (MIGRATE_ON_BOOT).
+
+Migrations must be safe to run again after stopping halfway: the helpers
+check the schema before changing it, and long backfills commit batch by
+batch. They describe the tables they touch themselves (Table, or
+sqlalchemy's table()/column()) instead of importing the models, which
+follow the latest schema rather than the one the migration was written for.
+"""
+import os
+import re
+import sys
+import time
+import fcntl
+import importlib.util
+from collections import namedtuple
+from contextlib import contextmanager
+from sqlalchemy import MetaData, Table, Column, Integer, String, inspect, select, text
+from timeutils import UTCDateTime, utcnow
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+_FILENAME = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+# Arbitrary key of the PostgreSQL advisory lock held while migrating
+ADVISORY_LOCK_KEY = 72_810_048
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', UTCDateTime, nullable=False),
+)
+
+Migration = namedtuple('Migration', 'version name path')
+
+
+def discover():
+    """The migrations in migrations/, by version"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _FILENAME.match(filename)
+        if match:
+            migrations.append(Migration(int(match[1]), match[2], os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def _load(migration):
+    spec = importlib.util.spec_from_file_location(f'migrations.m{migration.version:04d}', migration.path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Operations:
+    """Schema helpers given to each migration's upgrade(op)
+
+    Work happens in db.session's transaction; op.commit() ends it. On
+    PostgreSQL each transaction gives up after MIGRATION_LOCK_TIMEOUT_MS
+    waiting for a table lock, instead of queueing the app's queries behind
+    it, and has no statement timeout.
+    """
+
+    def __init__(self, db, config):
+        self.db = db
+        self.dialect = db.engine.dialect.name
+        self.batch_size = config['MIGRATION_BATCH_SIZE']
+        self.pause = config['MIGRATION_BATCH_PAUSE_MS'] / 1000
+        self.lock_timeout = config['MIGRATION_LOCK_TIMEOUT_MS']
+
+    @property
+    def connection(self):
+        session = self.db.session()
+        begin = not session.in_transaction()
+        connection = session.connection()
+        if begin and self.dialect == 'postgresql':
+            connection.exec_driver_sql(f"SET LOCAL lock_timeout = {int(self.lock_timeout)}")
+            connection.exec_driver_sql("SET LOCAL statement_timeout = 0")
+        return connection
+
+    def execute(self, sql, params=None):
+        return self.connection.execute(text(sql), params or {})
+
+    def commit(self):
+        self.db.session.commit()
+
+    def has_table(self, table):
+        return inspect(self.connection).has_table(table)
+
+    def columns(self, table):
+        return [column['name'] for column in inspect(self.connection).get_columns(table)]
+
+    def unique_constraints(self, table):
+        return [constraint['name'] for constraint in inspect(self.connection).get_unique_constraints(table)]
+
+    def add_column(self, table, column, definition):
+        """ALTER TABLE ... ADD COLUMN when missing; returns whether it was added
+
+        Keep definitions cheap: nullable, or NOT NULL with a constant
+        default, which PostgreSQL adds without rewriting the table.
+        """
+        if column in self.columns(table):
+            return False
+        print(f"   - Adicionando coluna {table}.{column}")
+        self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+
+    def drop_column(self, table, column):
+        if column in self.columns(table):
+            print(f"   - Removendo coluna {table}.{column}")
+            self.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+    def create_index(self, name, table, columns, unique=False, where=None):
+        """Create an index when missing
+
+        PostgreSQL builds it CONCURRENTLY, without blocking writes; that
+        cannot run in a transaction, so the current one is committed first.
+        An index left invalid by an interrupted build is dropped and rebuilt.
+        """
+        sql = (f"CREATE {'UNIQUE ' if unique else ''}INDEX {{}}{name} ON {table} ({', '.join(columns)})"
+               f"{f' WHERE {where}' if where else ''}")
+        if self.dialect != 'postgresql':
+            self.execute(sql.format('IF NOT EXISTS '))
+            return
+
+        self.commit()
+        with self.db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            valid = connection.execute(text(
+                "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name"
+            ), {'name': name}).scalar()
+            if valid:
+                return
+            connection.exec_driver_sql("SET statement_timeout = 0")
+            try:
+                if valid is False:
+                    connection.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                print(f"   - Criando índice {name}")
+                connection.exec_driver_sql(sql.format('CONCURRENTLY '))
+            finally:
+                connection.exec_driver_sql("RESET statement_timeout")
+
+    def backfill(self, table, assignments, where, params=None):
+        """UPDATE table SET assignments WHERE where, one id range per transaction
+
+        Each batch is committed and followed by a pause, so row locks are
+        short and replicas keep up. Returns the number of rows updated.
+        """
+        self.commit()
+        high = self.execute(f"SELECT MAX(id) FROM {table}").scalar() or 0
+        updated = 0
+        for low in range(0, high, self.batch_size):
+            result = self.execute(
+                f"UPDATE {table} SET {assignments} WHERE id > :low AND id <= :high AND ({where})",
+                {**(params or {}), 'low': low, 'high': low + self.batch_size}
+            )
+            updated += result.rowcount
+            self._end_batch()
+        return updated
+
+    def update_rows(self, table, columns, convert, where=None, types=None):
+        """Rewrite rows computed in Python, batch by batch like backfill()
+
+        convert(row) gets the id and the given columns and returns the new
+        values as a dict, or None to leave the row alone.
+        """
+        self.commit()
+        query = text(
+            f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > :last_id"
+            f"{f' AND ({where})' if where else ''} ORDER BY id LIMIT :limit"
+        )
+        if types:
+            query = query.columns(**types)
+        last_id = 0
+        updated = 0
+        while True:
+            rows = self.connection.execute(query, {'last_id': last_id, 'limit': self.batch_size}).all()
+            if not rows:
+                break
+            params = [dict(values, id=row.id) for row in rows if (values := convert(row)) is not None]
+            if params:
+                assignments = ', '.join(f"{column} = :{column}" for column in params[0] if column != 'id')
+                self.execute(f"UPDATE {table} SET {assignments} WHERE id = :id", params)
+                updated += len(params)
+            last_id = rows[-1].id
+            self._end_batch()
+        return updated
+
+    def _end_batch(self):
+        self.commit()
+        if self.pause:
+            time.sleep(self.pause)
+
+    def set_not_null(self, table, column):
+        """Make a column NOT NULL once no row has it empty
+
+        PostgreSQL first adds the rule as a NOT VALID check and validates it
+        without blocking writes; SET NOT NULL then trusts the check instead
+        of scanning the table under an exclusive lock. SQLite cannot change
+        a column in place: the rows are only checked, and the constraint
+        comes with the next rebuild_table() of that table.
+        """
+        if self.dialect != 'postgresql':
+            empty = self.execute(f"SELECT COUNT(*) FROM {table} WHERE {column} IS NULL").scalar()
+            if empty:
+                raise RuntimeError(f"{table}.{column} tem {empty} linhas sem valor")
+            return
+
+        nullable = self.execute(
+            "SELECT is_nullable FROM information_schema.columns WHERE table_name = :table AND column_name = :column",
+            {'table': table, 'column': column}
+        ).scalar()
+        if nullable == 'NO':
+            return
+        check = f"{table}_{column}_not_null"
+        self.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check}")
+        self.execute(f"ALTER TABLE {table} ADD CONSTRAINT {check} CHECK ({column} IS NOT NULL) NOT VALID")
+        self.commit()
+        self.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}")
+        self.commit()
+        self.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+        self.execute(f"ALTER TABLE {table} DROP CONSTRAINT {check}")
+        self.commit()
+
+    def rebuild_table(self, table):
+        """Recreate a SQLite table from a Table definition, keeping the rows
+
+        For what SQLite cannot alter in place (constraints). Columns missing
+        from the old table get their defaults.
+        """
+        connection = self.connection
+        old_columns = self.columns(table.name)
+        shared = ', '.join(column for column in old_columns if column in table.c)
+
+        print(f"   - Recriando tabela {table.name}")
+        # Keeps the other tables' foreign keys pointing at the original name
+        connection.exec_driver_sql("PRAGMA legacy_alter_table = ON")
+        for index in inspect(connection).get_indexes(table.name):
+            connection.exec_driver_sql(f"DROP INDEX {index['name']}")
+        connection.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {table.name}_old")
+        table.create(connection)
+        connection.exec_driver_sql(f"INSERT INTO {table.name} ({shared}) SELECT {shared} FROM {table.name}_old")
+        connection.exec_driver_sql(f"DROP TABLE {table.name}_old")
+        connection.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+
+
+@contextmanager
+def _migration_lock(app, db):
+    """Only one process migrates at a time; the others wait and then find nothing to do"""
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text("SELECT pg_advisory_lock(:key)"), {'key': ADVISORY_LOCK_KEY})
+            try:
+                yield
+            finally:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': ADVISORY_LOCK_KEY})
+    else:
+        os.makedirs(app.instance_path, exist_ok=True)
+        with open(os.path.join(app.instance_path, 'migrate.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+
+def applied_versions(db):
+    if not inspect(db.engine).has_table('schema_migrations'):
+        return set()
+    with db.engine.connect() as connection:
+        return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending(db):
+    applied = applied_versions(db)
+    return [migration for migration in discover() if migration.version not in applied]
+
+
+def _record(connection, migration):
+    connection.execute(schema_migrations.insert().values(
+        version=migration.version, name=migration.name, applied_at=utcnow()
+    ))
+
+
+def upgrade(app):
+    """Apply the pending migrations in order; returns the ones applied"""
+    from app import db
+
+    with _migration_lock(app, db):
+        schema_migrations.create(db.engine, checkfirst=True)
+        applied = []
+        for migration in pending(db):
+            print(f"Aplicando migração {migration.version:04d}_{migration.name}...")
+            op = Operations(db, app.config)
+            try:
+                _load(migration).upgrade(op)
+                _record(op.connection, migration)
+                op.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            applied.append(migration)
+        return applied
+
+
+def stamp(app):
+    """Record every migration as applied without running it
+
+    For databases whose tables were just created from the models, such as
+    the targets of migrate_to_postgres.py and migrate_to_sqlite.py.
+    """
+    from app import db
+
+    with _migration_lock(app, db):
+        schema_migrations.create(db.engine, checkfirst=True)
+        with db.engine.begin() as connection:
+            for migration in pending(db):
+                _record(connection, migration)
+
+
+def check_schema(app):
+    """Run at startup: apply or verify the migrations, per MIGRATE_ON_BOOT
+
+    'verify' (the default; deploys run `migrate.py upgrade` first) refuses
+    to start with migrations pending, 'upgrade' applies them (set by the
+    development server in main.py), 'off' skips the check.
+    """
+    from app import db
+
+    mode = app.config['MIGRATE_ON_BOOT']
+    if mode == 'upgrade':
+        upgrade(app)
+    elif mode == 'verify':
+        missing = pending(db)
+        if missing:
+            names = ', '.join(f"{migration.version:04d}_{migration.name}" for migration in missing)
+            raise RuntimeError(
+                f"Banco de dados desatualizado, migrações pendentes: {names}. "
+                f"Execute 'python migrate.py upgrade'."
+            )
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("🗄️  Migrações do banco de dados")
+        print("\nComandos disponíveis:")
+        print("  upgrade  - Aplica as migrações pendentes")
+        print("  status   - Lista as migrações aplicadas e pendentes")
+        print("  verify   - Sai com erro se houver migrações pendentes")
+        print("  stamp    - Marca todas como aplicadas sem executá-las")
+        return
+
+    # The app's own startup check would stop on the very migrations this applies
+    os.environ['MIGRATE_ON_BOOT'] = 'off'
+    from app import app, db
+
+    command = sys.argv[1].lower()
+    with app.app_context():
+        if command == "upgrade":
+            applied = upgrade(app)
+            print(f"✅ {len(applied)} migrações aplicadas" if applied else "✅ Banco de dados atualizado")
+        elif command == "status":
+            applied = applied_versions(db)
+            for migration in discover():
+                mark = '✅' if migration.version in applied else '⏳'
+                print(f"  {mark} {migration.version:04d}_{migration.name}")
+        elif command == "verify":
+            missing = pending(db)
+            for migration in missing:
+                print(f"⏳ {migration.version:04d}_{migration.name}")
+            if missing:
+                sys.exit(1)
+            print("✅ Banco de dados atualizado")
+        elif command == "stamp":
+            stamp(app)
+            print("✅ Todas as migrações marcadas como aplicadas")
+        else:
+            print(f"❌ Comando desconhecido: {command}")
+
+
+if __name__ == "__main__":
+    main()
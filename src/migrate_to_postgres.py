@@ -1,6 +1,7 @@
 
 import os
 from app import app, db
+from migrate import stamp
 from models import User, Product, Allocation, StockMovement
 from sqlalchemy import create_engine, text
 
@@ -42,7 +43,9 @@ def migrate_sqlite_to_postgres():
         
         with temp_app.app_context():
             # Recriar tabelas no PostgreSQL
+            # Tabelas criadas já no esquema atual: nenhuma migração a aplicar
             db.create_all()
+            stamp(app)
             print("✅ Tabelas PostgreSQL criadas/atualizadas")
             
             # Migrar dados
@@ -2,6 +2,7 @@
 import os
 import sqlite3
 from app import app, db
+from migrate import stamp
 from models import User, Product, Allocation, StockMovement
 from sqlalchemy import create_engine, text
 from datetime import datetime
@@ -29,7 +30,9 @@ def migrate_postgres_to_sqlite():
                 print("🗑️  Banco SQLite anterior removido")
             
             # Criar tabelas no SQLite
+            # Tabelas criadas já no esquema atual: nenhuma migração a aplicar
             db.create_all()
+            stamp(app)
             print("✅ Tabelas SQLite criadas")
             
             # Migrar usuários
@@ -0,0 +1,249 @@
+"""Tables that are missing, as they stood at 0012_works
+
+Creates the whole schema and the default admin on a new database. Older
+databases only get the tables added since they were created; the
+migrations after this one bring their existing tables up to date.
+
+The tables are written out here rather than taken from the models, so
+this migration keeps creating the same schema as the models change;
+tables added later come with their own migration.
+"""
+from sqlalchemy import (MetaData, Table, Column, Index, ForeignKey, UniqueConstraint, Integer, String, Text,
+                        Boolean, Numeric, text)
+from werkzeug.security import generate_password_hash
+from timeutils import UTCDateTime, utcnow
+
+metadata = MetaData()
+
+ACTIVE = text('deleted_at IS NULL')
+
+users = Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(64), nullable=False),
+    Column('email', String(120), nullable=False),
+    Column('password_hash', String(256), nullable=False),
+    Column('role', String(20), nullable=False),
+    Column('is_admin', Boolean),
+    Column('is_active', Boolean),
+    Column('created_at', UTCDateTime),
+    Column('created_by', Integer, ForeignKey('users.id')),
+    Column('reset_token', String(120)),
+    Column('reset_token_expires', UTCDateTime),
+    Column('unread_notifications', Integer, nullable=False, server_default='0'),
+    Column('deleted_at', UTCDateTime),
+    Index('uq_users_username_active', 'username', unique=True, sqlite_where=ACTIVE, postgresql_where=ACTIVE),
+    Index('uq_users_email_active', 'email', unique=True, sqlite_where=ACTIVE, postgresql_where=ACTIVE),
+)
+
+Table(
+    'warehouses', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('code', String(20), unique=True, nullable=False),
+    Column('name', String(100), nullable=False),
+    Column('is_active', Boolean),
+    Column('created_at', UTCDateTime),
+)
+
+Table(
+    'products', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('code', String(50), nullable=False),
+    Column('name', String(200), nullable=False),
+    Column('supplier_reference', String(100)),
+    Column('location', String(100), nullable=False),
+    Column('location_path', String(100), index=True),
+    Column('quantity', Integer, nullable=False),
+    Column('stock_slots', Integer, nullable=False, server_default='1'),
+    Column('reserved_quantity', Integer, nullable=False, server_default='0'),
+    Column('unit_cost', Numeric(12, 4), nullable=False, server_default='0'),
+    Column('unit', String(20), nullable=False),
+    Column('photo_filename', String(255)),
+    Column('supplier_name', String(100), nullable=False),
+    Column('created_at', UTCDateTime),
+    Column('updated_at', UTCDateTime, index=True),
+    Column('created_by', Integer, ForeignKey('users.id'), nullable=False),
+    Column('deleted_at', UTCDateTime),
+    Index('uq_products_code_active', 'code', unique=True, sqlite_where=ACTIVE, postgresql_where=ACTIVE),
+)
+
+Table(
+    'works', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('number', String(50), unique=True, nullable=False),
+    Column('status', String(20), nullable=False, server_default='open'),
+    Column('created_at', UTCDateTime),
+    Column('closed_at', UTCDateTime),
+    Index('ix_works_number_pattern', 'number',
+          postgresql_ops={'number': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+)
+
+Table(
+    'allocations', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+    Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('work_id', Integer, ForeignKey('works.id')),
+    Column('work_number', String(50), nullable=False),
+    Column('quantity', Integer, nullable=False),
+    Column('allocated_at', UTCDateTime),
+    Column('notes', Text),
+    Column('status', String(20), nullable=False),
+    Column('approved_by_id', Integer, ForeignKey('users.id')),
+    Column('approved_at', UTCDateTime, index=True),
+    Column('approval_notes', Text),
+    Column('warehouse_id', Integer, ForeignKey('warehouses.id')),
+    Column('unit_cost', Numeric(12, 4)),
+    Column('total_cost', Numeric(14, 2)),
+    Index('ix_allocations_product_status', 'product_id', 'status'),
+    Index('ix_allocations_work_status', 'work_id', 'status'),
+)
+
+Table(
+    'stock_movements', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+    Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('movement_type', String(20), nullable=False),
+    Column('quantity', Integer, nullable=False),
+    Column('previous_quantity', Integer, nullable=False),
+    Column('new_quantity', Integer, nullable=False),
+    Column('notes', Text),
+    Column('created_at', UTCDateTime),
+    Column('warehouse_id', Integer, ForeignKey('warehouses.id')),
+)
+
+Table(
+    'stock_levels', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False, index=True),
+    Column('warehouse_id', Integer, ForeignKey('warehouses.id'), nullable=False),
+    Column('slot', Integer, nullable=False),
+    Column('quantity', Integer, nullable=False),
+    Column('reserved', Integer, nullable=False, server_default='0'),
+    UniqueConstraint('product_id', 'warehouse_id', 'slot', name='uq_stock_levels_product_warehouse_slot'),
+)
+
+Table(
+    'stock_holds', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('allocation_id', Integer, ForeignKey('allocations.id'), nullable=False, unique=True),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+    Column('warehouse_id', Integer, ForeignKey('warehouses.id'), nullable=False),
+    Column('stock_level_id', Integer, ForeignKey('stock_levels.id'), nullable=False),
+    Column('quantity', Integer, nullable=False),
+    Column('created_at', UTCDateTime),
+    Column('expires_at', UTCDateTime, nullable=False, index=True),
+)
+
+Table(
+    'cost_layers', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+    Column('unit_cost', Numeric(12, 4), nullable=False),
+    Column('quantity', Integer, nullable=False),
+    Column('remaining', Integer, nullable=False),
+    Column('created_at', UTCDateTime),
+    Index('ix_cost_layers_product_remaining', 'product_id', 'remaining'),
+)
+
+Table(
+    'work_cost_totals', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('work_number', String(50), nullable=False),
+    Column('month', String(7), nullable=False),
+    Column('total_cost', Numeric(14, 2), nullable=False),
+    Column('quantity', Integer, nullable=False),
+    Column('allocations', Integer, nullable=False),
+    UniqueConstraint('work_number', 'month', name='uq_work_cost_totals_work_month'),
+)
+
+Table(
+    'jobs', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(50), nullable=False),
+    Column('payload', Text),
+    Column('unique_key', String(100), unique=True),
+    Column('status', String(20), nullable=False),
+    Column('attempts', Integer, nullable=False),
+    Column('max_attempts', Integer, nullable=False),
+    Column('run_at', UTCDateTime, nullable=False),
+    Column('started_at', UTCDateTime),
+    Column('finished_at', UTCDateTime),
+    Column('worker', String(100)),
+    Column('last_error', Text),
+    Column('created_at', UTCDateTime),
+    Index('ix_jobs_status_run_at', 'status', 'run_at'),
+)
+
+Table(
+    'change_log', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('entity', String(30), nullable=False),
+    Column('entity_id', Integer, nullable=False),
+    Column('op', String(10), nullable=False),
+    Column('created_at', UTCDateTime),
+    sqlite_autoincrement=True,
+)
+
+Table(
+    'idempotency_keys', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('key', String(64), nullable=False),
+    Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('allocation_id', Integer, ForeignKey('allocations.id')),
+    Column('created_at', UTCDateTime),
+    UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+)
+
+Table(
+    'notification_subscriptions', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('kind', String(20), nullable=False),
+    Column('target', String(50), nullable=False),
+    Column('email', Boolean, nullable=False),
+    Column('created_at', UTCDateTime),
+    UniqueConstraint('user_id', 'kind', 'target', name='uq_notification_subscriptions'),
+)
+
+Table(
+    'notification_events', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('kind', String(20), nullable=False),
+    Column('product_id', Integer, nullable=False),
+    Column('allocation_id', Integer),
+    Column('requester_id', Integer),
+    Column('actor_id', Integer),
+    Column('work_number', String(50)),
+    Column('quantity', Integer, nullable=False),
+    Column('created_at', UTCDateTime),
+)
+
+Table(
+    'notifications', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('title', String(200), nullable=False),
+    Column('body', Text, nullable=False),
+    Column('created_at', UTCDateTime),
+    Column('read_at', UTCDateTime),
+    Index('ix_notifications_user_created', 'user_id', 'created_at'),
+)
+
+
+def upgrade(op):
+    new_database = not op.has_table('users')
+    metadata.create_all(op.connection)
+    if not new_database:
+        return
+
+    if op.dialect == 'sqlite':
+        # Already stores UTC, see 0005_timestamps_utc
+        op.execute("PRAGMA user_version = 1")
+    # Hashed with Werkzeug's default; logging in rehashes it under PASSWORD_HASH_METHOD
+    op.connection.execute(users.insert().values(
+        username='admin', email='admin@empresa.com', password_hash=generate_password_hash('admin123'),
+        role='almoxarifado', is_admin=True, is_active=True, created_at=utcnow()
+    ))
+    print("   - Usuário admin criado: admin/admin123")
@@ -0,0 +1,12 @@
+"""Free-text supplier name instead of the suppliers table"""
+
+
+def upgrade(op):
+    if 'supplier_id' in op.columns('products'):
+        if op.dialect == 'postgresql':
+            op.execute("ALTER TABLE products DROP CONSTRAINT IF EXISTS products_supplier_id_fkey")
+        op.drop_column('products', 'supplier_id')
+
+    if op.add_column('products', 'supplier_name', 'VARCHAR(100)'):
+        op.backfill('products', "supplier_name = 'Fornecedor não informado'", 'supplier_name IS NULL')
+        op.set_not_null('products', 'supplier_name')
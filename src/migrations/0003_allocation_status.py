@@ -0,0 +1,17 @@
+"""Approval workflow of allocations"""
+
+NEW_COLUMNS = [
+    ('status', 'VARCHAR(20)'),
+    ('approved_by_id', 'INTEGER REFERENCES users (id)'),
+    ('approved_at', 'TIMESTAMP'),
+    ('approval_notes', 'TEXT'),
+]
+
+
+def upgrade(op):
+    for column, definition in NEW_COLUMNS:
+        op.add_column('allocations', column, definition)
+
+    # Allocations made before the workflow already took their stock
+    op.backfill('allocations', "status = 'approved'", 'status IS NULL')
+    op.set_not_null('allocations', 'status')
@@ -0,0 +1,5 @@
+"""Index behind the catalog version (ETag/Last-Modified of the inventory)"""
+
+
+def upgrade(op):
+    op.create_index('ix_products_updated_at', 'products', ['updated_at'])
@@ -0,0 +1,57 @@
+"""Timestamps stored in UTC instead of naive Brasília local time
+
+PostgreSQL columns become timestamptz, which rewrites each table once.
+SQLite has no column types to tell converted databases apart, so
+PRAGMA user_version 1 marks them.
+"""
+from datetime import timezone
+from sqlalchemy import DateTime
+from timeutils import BRAZIL_TZ
+
+# Columns written as naive local time until this change
+TIMESTAMP_COLUMNS = {
+    'users': ['created_at', 'reset_token_expires'],
+    'products': ['created_at', 'updated_at'],
+    'allocations': ['allocated_at', 'approved_at'],
+    'stock_movements': ['created_at'],
+    'change_log': ['created_at'],
+    'idempotency_keys': ['created_at'],
+}
+
+SQLITE_UTC_VERSION = 1
+
+
+def local_to_utc(value):
+    """Interpret a naive Brazil local time and convert it to naive UTC"""
+    if value is None:
+        return None
+    return value.replace(tzinfo=BRAZIL_TZ).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def upgrade(op):
+    if op.dialect == 'postgresql':
+        for table, columns in TIMESTAMP_COLUMNS.items():
+            for column in columns:
+                data_type = op.execute(
+                    "SELECT data_type FROM information_schema.columns WHERE table_name = :table AND column_name = :column",
+                    {'table': table, 'column': column}
+                ).scalar()
+                if data_type == 'timestamp without time zone':
+                    print(f"   - Convertendo {table}.{column} para timestamptz")
+                    op.execute(
+                        f"ALTER TABLE {table} ALTER COLUMN {column} TYPE TIMESTAMP WITH TIME ZONE "
+                        f"USING {column} AT TIME ZONE 'America/Sao_Paulo'"
+                    )
+                    op.commit()
+        return
+
+    if op.execute("PRAGMA user_version").scalar() >= SQLITE_UTC_VERSION:
+        return
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        print(f"   - Convertendo {table} ({', '.join(columns)}) para UTC")
+        op.update_rows(
+            table, columns,
+            lambda row, columns=columns: {column: local_to_utc(getattr(row, column)) for column in columns},
+            types={column: DateTime for column in columns}
+        )
+    op.execute(f"PRAGMA user_version = {SQLITE_UTC_VERSION}")
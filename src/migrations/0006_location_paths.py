@@ -0,0 +1,13 @@
+"""Normalized, indexed product locations for the pick list"""
+from utils import normalize_location
+
+
+def upgrade(op):
+    op.add_column('products', 'location_path', 'VARCHAR(100)')
+    op.update_rows(
+        'products', ['location'],
+        lambda row: {'location_path': normalize_location(row.location)},
+        where='location_path IS NULL'
+    )
+    op.create_index('ix_products_location_path', 'products', ['location_path'])
+    op.create_index('ix_allocations_approved_at', 'allocations', ['approved_at'])
@@ -0,0 +1,36 @@
+"""Stock kept per warehouse; current stock goes to the PRINCIPAL site"""
+
+DEFAULT_WAREHOUSE_CODE = 'PRINCIPAL'
+
+NEW_COLUMNS = {
+    'products': [('stock_slots', 'INTEGER NOT NULL DEFAULT 1')],
+    'allocations': [('warehouse_id', 'INTEGER REFERENCES warehouses (id)')],
+    'stock_movements': [('warehouse_id', 'INTEGER REFERENCES warehouses (id)')],
+}
+
+
+def upgrade(op):
+    for table, columns in NEW_COLUMNS.items():
+        for column, definition in columns:
+            op.add_column(table, column, definition)
+
+    warehouse_id = op.execute("SELECT id FROM warehouses ORDER BY id LIMIT 1").scalar()
+    if warehouse_id is None:
+        print(f"   - Criando almoxarifado {DEFAULT_WAREHOUSE_CODE}")
+        op.execute(
+            "INSERT INTO warehouses (code, name, is_active, created_at) "
+            "VALUES (:code, :name, :active, CURRENT_TIMESTAMP)",
+            {'code': DEFAULT_WAREHOUSE_CODE, 'name': 'Almoxarifado Principal', 'active': True}
+        )
+        warehouse_id = op.execute(
+            "SELECT id FROM warehouses WHERE code = :code", {'code': DEFAULT_WAREHOUSE_CODE}
+        ).scalar()
+
+    op.execute(
+        "INSERT INTO stock_levels (product_id, warehouse_id, slot, quantity) "
+        "SELECT id, :warehouse_id, 0, quantity FROM products "
+        "WHERE id NOT IN (SELECT product_id FROM stock_levels)",
+        {'warehouse_id': warehouse_id}
+    )
+    for table in ('allocations', 'stock_movements'):
+        op.backfill(table, "warehouse_id = :warehouse_id", 'warehouse_id IS NULL', {'warehouse_id': warehouse_id})
@@ -0,0 +1,16 @@
+"""Stock held by pending requests
+
+Requests already pending get no hold; availability is checked again when
+they are approved.
+"""
+
+NEW_COLUMNS = {
+    'products': [('reserved_quantity', 'INTEGER NOT NULL DEFAULT 0')],
+    'stock_levels': [('reserved', 'INTEGER NOT NULL DEFAULT 0')],
+}
+
+
+def upgrade(op):
+    for table, columns in NEW_COLUMNS.items():
+        for column, definition in columns:
+            op.add_column(table, column, definition)
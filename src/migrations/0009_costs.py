@@ -0,0 +1,59 @@
+"""Unit costs, cost layers and monthly cost totals per work
+
+Current stock becomes a zero-cost opening layer, so the layers match the
+balance; average costs apply from the next receipts with a cost. Older
+allocations have no cost.
+"""
+from sqlalchemy import column, delete, func, insert, select, table
+
+NEW_COLUMNS = {
+    'products': [('unit_cost', 'NUMERIC(12, 4) NOT NULL DEFAULT 0')],
+    'allocations': [('unit_cost', 'NUMERIC(12, 4)'), ('total_cost', 'NUMERIC(14, 2)')],
+}
+
+allocations = table(
+    'allocations',
+    column('id'), column('work_number'), column('quantity'), column('status'), column('approved_at'),
+    column('total_cost'),
+)
+
+work_cost_totals = table(
+    'work_cost_totals',
+    column('work_number'), column('month'), column('total_cost'), column('quantity'), column('allocations'),
+)
+
+
+def rebuild_work_costs(op):
+    """Monthly work totals from the approved allocations, computed like costing.rebuild_work_costs at this version"""
+    if op.dialect == 'postgresql':
+        month = func.to_char(func.timezone('UTC', allocations.c.approved_at), 'YYYY-MM')
+    else:
+        month = func.strftime('%Y-%m', allocations.c.approved_at)
+    totals = select(
+        allocations.c.work_number,
+        month,
+        func.coalesce(func.sum(allocations.c.total_cost), 0),
+        func.sum(allocations.c.quantity),
+        func.count(allocations.c.id)
+    ).where(
+        allocations.c.status == 'approved',
+        allocations.c.approved_at.isnot(None)
+    ).group_by(allocations.c.work_number, month)
+
+    op.connection.execute(delete(work_cost_totals))
+    op.connection.execute(insert(work_cost_totals).from_select(
+        ['work_number', 'month', 'total_cost', 'quantity', 'allocations'], totals
+    ))
+
+
+def upgrade(op):
+    for table, columns in NEW_COLUMNS.items():
+        for column, definition in columns:
+            op.add_column(table, column, definition)
+
+    op.execute(
+        "INSERT INTO cost_layers (product_id, unit_cost, quantity, remaining, created_at) "
+        "SELECT id, unit_cost, quantity, quantity, CURRENT_TIMESTAMP FROM products "
+        "WHERE quantity > 0 AND NOT EXISTS (SELECT 1 FROM cost_layers WHERE cost_layers.product_id = products.id)"
+    )
+    rebuild_work_costs(op)
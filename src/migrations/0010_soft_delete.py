@@ -0,0 +1,77 @@
+"""Archived products and users
+
+Codes, usernames and emails become unique among active rows only, through
+partial unique indexes.
+"""
+from sqlalchemy import MetaData, Table, Column, Index, ForeignKey, Integer, String, Boolean, Numeric, text
+from timeutils import UTCDateTime
+
+ACTIVE_UNIQUE_INDEXES = {
+    'users': [('uq_users_username_active', 'username'), ('uq_users_email_active', 'email')],
+    'products': [('uq_products_code_active', 'code')],
+}
+
+# SQLite rebuilds the two tables as they are after this migration
+metadata = MetaData()
+
+ACTIVE = text('deleted_at IS NULL')
+
+users = Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(64), nullable=False),
+    Column('email', String(120), nullable=False),
+    Column('password_hash', String(256), nullable=False),
+    Column('role', String(20), nullable=False),
+    Column('is_admin', Boolean),
+    Column('is_active', Boolean),
+    Column('created_at', UTCDateTime),
+    Column('created_by', Integer, ForeignKey('users.id')),
+    Column('reset_token', String(120)),
+    Column('reset_token_expires', UTCDateTime),
+    Column('deleted_at', UTCDateTime),
+    Index('uq_users_username_active', 'username', unique=True, sqlite_where=ACTIVE),
+    Index('uq_users_email_active', 'email', unique=True, sqlite_where=ACTIVE),
+)
+
+products = Table(
+    'products', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('code', String(50), nullable=False),
+    Column('name', String(200), nullable=False),
+    Column('supplier_reference', String(100)),
+    Column('location', String(100), nullable=False),
+    Column('location_path', String(100), index=True),
+    Column('quantity', Integer, nullable=False),
+    Column('stock_slots', Integer, nullable=False, server_default='1'),
+    Column('reserved_quantity', Integer, nullable=False, server_default='0'),
+    Column('unit_cost', Numeric(12, 4), nullable=False, server_default='0'),
+    Column('unit', String(20), nullable=False),
+    Column('photo_filename', String(255)),
+    Column('supplier_name', String(100), nullable=False),
+    Column('created_at', UTCDateTime),
+    Column('updated_at', UTCDateTime, index=True),
+    Column('created_by', Integer, ForeignKey('users.id'), nullable=False),
+    Column('deleted_at', UTCDateTime),
+    Index('uq_products_code_active', 'code', unique=True, sqlite_where=ACTIVE),
+)
+
+
+def upgrade(op):
+    if op.dialect == 'postgresql':
+        for table, indexes in ACTIVE_UNIQUE_INDEXES.items():
+            op.add_column(table, 'deleted_at', 'TIMESTAMP WITH TIME ZONE')
+            # The new indexes are in place before the old constraints go
+            for name, column in indexes:
+                op.create_index(name, table, [column], unique=True, where='deleted_at IS NULL')
+            for constraint in op.unique_constraints(table):
+                print(f"   - Removendo restrição {constraint}")
+                op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {constraint}")
+    else:
+        # SQLite cannot drop UNIQUE constraints
+        for table in (users, products):
+            if 'deleted_at' not in op.columns(table.name):
+                op.rebuild_table(table)
+
+    # Behind the pending request check when deleting products
+    op.create_index('ix_allocations_product_status', 'allocations', ['product_id', 'status'])
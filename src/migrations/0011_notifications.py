@@ -0,0 +1,12 @@
+"""Notification digests; production users follow their own requests"""
+
+
+def upgrade(op):
+    op.add_column('users', 'unread_notifications', 'INTEGER NOT NULL DEFAULT 0')
+    op.execute(
+        "INSERT INTO notification_subscriptions (user_id, kind, target, email, created_at) "
+        "SELECT id, 'requests', '', :email, CURRENT_TIMESTAMP FROM users "
+        "WHERE role = 'producao' AND id NOT IN "
+        "(SELECT user_id FROM notification_subscriptions WHERE kind = 'requests')",
+        {'email': True}
+    )
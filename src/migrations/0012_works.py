@@ -0,0 +1,106 @@
+"""Work registry: allocations point at a work, open or closed
+
+Existing numbers are normalized, which merges spelling variants of a
+number into one work; the monthly cost totals are rebuilt under the
+merged numbers.
+"""
+from sqlalchemy import (MetaData, Table, Column, Index, Integer, String, column, delete, func, insert, select,
+                        table)
+from timeutils import UTCDateTime
+
+# For the odd number with nothing left after normalizing
+UNNAMED_WORK = 'SEM-NUMERO'
+
+metadata = MetaData()
+
+works = Table(
+    'works', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('number', String(50), unique=True, nullable=False),
+    Column('status', String(20), nullable=False, server_default='open'),
+    Column('created_at', UTCDateTime),
+    Column('closed_at', UTCDateTime),
+    Index('ix_works_number_pattern', 'number',
+          postgresql_ops={'number': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+)
+
+allocations = table(
+    'allocations',
+    column('id'), column('work_number'), column('quantity'), column('status'), column('approved_at'),
+    column('total_cost'),
+)
+
+work_cost_totals = table(
+    'work_cost_totals',
+    column('work_number'), column('month'), column('total_cost'), column('quantity'), column('allocations'),
+)
+
+
+def rebuild_work_costs(op):
+    """Monthly work totals from the approved allocations, computed like costing.rebuild_work_costs at this version"""
+    if op.dialect == 'postgresql':
+        month = func.to_char(func.timezone('UTC', allocations.c.approved_at), 'YYYY-MM')
+    else:
+        month = func.strftime('%Y-%m', allocations.c.approved_at)
+    totals = select(
+        allocations.c.work_number,
+        month,
+        func.coalesce(func.sum(allocations.c.total_cost), 0),
+        func.sum(allocations.c.quantity),
+        func.count(allocations.c.id)
+    ).where(
+        allocations.c.status == 'approved',
+        allocations.c.approved_at.isnot(None)
+    ).group_by(allocations.c.work_number, month)
+
+    op.connection.execute(delete(work_cost_totals))
+    op.connection.execute(insert(work_cost_totals).from_select(
+        ['work_number', 'month', 'total_cost', 'quantity', 'allocations'], totals
+    ))
+
+
+def upgrade(op):
+    from utils import normalize_work_number
+
+    def normalize(number):
+        return normalize_work_number(number) or UNNAMED_WORK
+
+    works.create(op.connection, checkfirst=True)
+    op.add_column('allocations', 'work_id', 'INTEGER REFERENCES works (id)')
+
+    numbers = {normalize(number) for (number,) in op.execute(
+        "SELECT DISTINCT work_number FROM allocations WHERE work_id IS NULL"
+    )}
+    existing = {number for (number,) in op.execute("SELECT number FROM works")}
+    missing = sorted(numbers - existing)
+    if missing:
+        print(f"   - Registrando {len(missing)} obras")
+        op.execute(
+            "INSERT INTO works (number, status, created_at) VALUES (:number, 'open', CURRENT_TIMESTAMP)",
+            [{'number': number} for number in missing]
+        )
+    work_ids = {number: work_id for work_id, number in op.execute("SELECT id, number FROM works")}
+
+    op.update_rows(
+        'allocations', ['work_number'],
+        lambda row: {'work_id': work_ids[normalize(row.work_number)], 'work_number': normalize(row.work_number)},
+        where='work_id IS NULL'
+    )
+    op.create_index('ix_allocations_work_status', 'allocations', ['work_id', 'status'])
+
+    # Subscriptions follow the normalized numbers; variants of one number collapse into one
+    subscriptions = op.execute(
+        "SELECT id, user_id, target FROM notification_subscriptions WHERE kind = 'work'"
+    ).all()
+    seen = set()
+    for subscription in sorted(subscriptions, key=lambda row: row.target != normalize(row.target)):
+        number = normalize(subscription.target)
+        if (subscription.user_id, number) in seen:
+            op.execute("DELETE FROM notification_subscriptions WHERE id = :id", {'id': subscription.id})
+            continue
+        seen.add((subscription.user_id, number))
+        if number != subscription.target:
+            op.execute("UPDATE notification_subscriptions SET target = :target WHERE id = :id",
+                       {'target': number, 'id': subscription.id})
+
+    rebuild_work_costs(op)
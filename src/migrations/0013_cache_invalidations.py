@@ -0,0 +1,17 @@
+"""Log of invalidated cache tags, shared by the per-process caches"""
+from sqlalchemy import MetaData, Table, Column, Integer, Text
+from timeutils import UTCDateTime
+
+metadata = MetaData()
+
+cache_invalidations = Table(
+    'cache_invalidations', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('tags', Text, nullable=False),
+    Column('created_at', UTCDateTime, index=True),
+    sqlite_autoincrement=True,
+)
+
+
+def upgrade(op):
+    cache_invalidations.create(op.connection, checkfirst=True)
@@ -1,92 +1,200 @@
-from datetime import datetime, timezone, timedelta
-from flask_sqlalchemy import SQLAlchemy
+from functools import lru_cache
+from flask import current_app
 from flask_login import UserMixin
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from concurrency import offload
+from timeutils import UTCDateTime, utcnow
 
-# Configurar timezone do Brasil (UTC-3)
-# BRAZIL_TZ = timezone(timedelta(hours=-3)) # This line is replaced by the new function logic
+@lru_cache(maxsize=8)
+def _hash_prefix(method):
+    """Parameters Werkzeug records for a hashing method, e.g. 'scrypt:32768:8:1'"""
+    return generate_password_hash('', method=method).split('$', 1)[0]
 
-def brazil_now():
-    """Get current time in Brazil timezone"""
-    from datetime import datetime
-    import pytz
-    utc = pytz.timezone('UTC')
-    brazil_tz = pytz.timezone('America/Sao_Paulo')
-    utc_time = datetime.now(utc)
-    return utc_time.astimezone(brazil_tz).replace(tzinfo=None)
+def _active_unique_index(name, *columns):
+    """Unique among rows not archived, so an archived code or username can be reused"""
+    where = text('deleted_at IS NULL')
+    return db.Index(name, *columns, unique=True, sqlite_where=where, postgresql_where=where)
 
-class User(UserMixin, db.Model):
+class SoftDeleteMixin:
+    """Rows archived instead of deleted, so the history pointing at them stays intact
+
+    Listings and lookups go through active(); relationships from history
+    rows (allocations, stock movements) still load archived rows.
+    """
+    deleted_at = db.Column(UTCDateTime, nullable=True)
+
+    @property
+    def is_deleted(self):
+        return self.deleted_at is not None
+
+    @classmethod
+    def active(cls):
+        return cls.query.filter(cls.deleted_at.is_(None))
+
+    @classmethod
+    def active_or_404(cls, id):
+        return cls.active().filter_by(id=id).first_or_404()
+
+class User(SoftDeleteMixin, UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        _active_unique_index('uq_users_username_active', 'username'),
+        _active_unique_index('uq_users_email_active', 'email'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(64), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    username = db.Column(db.String(64), nullable=False)
+    email = db.Column(db.String(120), nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     role = db.Column(db.String(20), nullable=False, default='producao')  # 'almoxarifado', 'producao'
     is_admin = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=brazil_now)
+    created_at = db.Column(UTCDateTime, default=utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     reset_token = db.Column(db.String(120), nullable=True)
-    reset_token_expires = db.Column(db.DateTime, nullable=True)
+    reset_token_expires = db.Column(UTCDateTime, nullable=True)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Kept by notifications.py
 
     # Relationships
     allocations = db.relationship('Allocation', foreign_keys='Allocation.user_id', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = offload(
+            generate_password_hash, password,
+            method=current_app.config['PASSWORD_HASH_METHOD'],
+            salt_length=current_app.config['PASSWORD_SALT_LENGTH']
+        )
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return offload(check_password_hash, self.password_hash, password)
+
+    def password_needs_rehash(self):
+        """True when the stored hash was made with a different hashing policy
+
+        Compares the method with its parameters ('scrypt:32768:8:1',
+        'pbkdf2:sha256:600000') and the salt length.
+        """
+        parts = self.password_hash.split('$')
+        if len(parts) != 3:
+            return True
+        method, salt, _ = parts
+        return (method != _hash_prefix(current_app.config['PASSWORD_HASH_METHOD'])
+                or len(salt) != current_app.config['PASSWORD_SALT_LENGTH'])
 
     def __repr__(self):
         return f'<User {self.username}>'
 
 # Supplier model removed - using text field instead
 
-class Product(db.Model):
+class Warehouse(db.Model):
+    __tablename__ = 'warehouses'
+
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(20), unique=True, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(UTCDateTime, default=utcnow)
+
+    def __repr__(self):
+        return f'<Warehouse {self.code}>'
+
+class Product(SoftDeleteMixin, db.Model):
     __tablename__ = 'products'
+    __table_args__ = (_active_unique_index('uq_products_code_active', 'code'),)
 
     id = db.Column(db.Integer, primary_key=True)
-    code = db.Column(db.String(50), unique=True, nullable=False)
+    code = db.Column(db.String(50), nullable=False)
     name = db.Column(db.String(200), nullable=False)
     supplier_reference = db.Column(db.String(100), nullable=True)
     location = db.Column(db.String(100), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False, default=0) # This line is not changed by the provided changes
+    location_path = db.Column(db.String(100), nullable=True, index=True)  # Normalized, see utils.normalize_location
+    quantity = db.Column(db.Integer, nullable=False, default=0)  # Total over all warehouses, see stock.py
+    stock_slots = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # >1 splits each site's stock over several rows
+    reserved_quantity = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Held by pending requests, all warehouses
+    unit_cost = db.Column(db.Numeric(12, 4), nullable=False, default=0, server_default='0')  # Moving average, see costing.py
     unit = db.Column(db.String(20), nullable=False)  # 'unidade', 'metros', 'pacote', 'cento'
     photo_filename = db.Column(db.String(255), nullable=True)
     supplier_name = db.Column(db.String(100), nullable=False)
-    created_at = db.Column(db.DateTime, default=brazil_now)
-    updated_at = db.Column(db.DateTime, default=brazil_now, onupdate=brazil_now)
+    created_at = db.Column(UTCDateTime, default=utcnow)
+    updated_at = db.Column(UTCDateTime, default=utcnow, onupdate=utcnow, index=True)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
     # Relationships
     allocations = db.relationship('Allocation', backref='product', lazy=True)
     stock_movements = db.relationship('StockMovement', backref='product', lazy=True)
+    stock_levels = db.relationship('StockLevel', backref='product', lazy=True)
+
+    @validates('location')
+    def _update_location_path(self, key, location):
+        from utils import normalize_location
+        self.location_path = normalize_location(location)
+        return location
+
+    @property
+    def available_quantity(self):
+        return max(0, self.quantity - self.reserved_quantity)
 
     def __repr__(self):
         return f'<Product {self.code} - {self.name}>'
 
+class Work(db.Model):
+    """A work (obra) that allocations are charged to; closed works take no new requests"""
+    __tablename__ = 'works'
+    # PostgreSQL only uses an index for LIKE 'prefix%' with pattern ops;
+    # SQLite uses the unique index for the GLOB of works.search
+    __table_args__ = (
+        db.Index('ix_works_number_pattern', 'number',
+                 postgresql_ops={'number': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    number = db.Column(db.String(50), unique=True, nullable=False)  # normalize_work_number
+    status = db.Column(db.String(20), nullable=False, default='open', server_default='open')  # 'open', 'closed'
+    created_at = db.Column(UTCDateTime, default=utcnow)
+    closed_at = db.Column(UTCDateTime, nullable=True)
+
+    @property
+    def is_open(self):
+        return self.status == 'open'
+
+    def __repr__(self):
+        return f'<Work {self.number} ({self.status})>'
+
 class Allocation(db.Model):
     __tablename__ = 'allocations'
+    __table_args__ = (
+        db.Index('ix_allocations_product_status', 'product_id', 'status'),
+        db.Index('ix_allocations_work_status', 'work_id', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    work_id = db.Column(db.Integer, db.ForeignKey('works.id'), nullable=True)
+    # Copy of the work's number, used for grouping and display
     work_number = db.Column(db.String(50), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
-    allocated_at = db.Column(db.DateTime, default=brazil_now)
+    allocated_at = db.Column(UTCDateTime, default=utcnow)
     notes = db.Column(db.Text, nullable=True)
 
     # Approval workflow fields
     status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'approved', 'rejected'
     approved_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    approved_at = db.Column(db.DateTime, nullable=True)
+    approved_at = db.Column(UTCDateTime, nullable=True, index=True)
     approval_notes = db.Column(db.Text, nullable=True)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=True)
+
+    # Valuation captured when the stock is consumed (approval)
+    unit_cost = db.Column(db.Numeric(12, 4), nullable=True)
+    total_cost = db.Column(db.Numeric(14, 2), nullable=True)
 
     # Relationships
     approved_by = db.relationship('User', foreign_keys=[approved_by_id], backref='approved_allocations')
+    warehouse = db.relationship('Warehouse')
+    work = db.relationship('Work')
 
     def __repr__(self):
         return f'<Allocation {self.product.code} -> Obra {self.work_number} ({self.status})>'
@@ -97,15 +205,234 @@ class StockMovement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    movement_type = db.Column(db.String(20), nullable=False)  # 'add', 'remove', 'allocation'
-    quantity = db.Column(db.Integer, nullable=False)
+    movement_type = db.Column(db.String(20), nullable=False)  # 'add', 'remove', 'allocation', 'count'
+    quantity = db.Column(db.Integer, nullable=False)  # Signed difference for 'count'
     previous_quantity = db.Column(db.Integer, nullable=False)
     new_quantity = db.Column(db.Integer, nullable=False)
     notes = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=brazil_now)
+    created_at = db.Column(UTCDateTime, default=utcnow)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=True)  # Quantities above are per site
 
     # Foreign key to user
     user = db.relationship('User', backref='stock_movements')
+    warehouse = db.relationship('Warehouse')
+
+    def __repr__(self):
+        return f'<StockMovement {self.product.code} {self.movement_type} {self.quantity}>'
+
+class StockLevel(db.Model):
+    __tablename__ = 'stock_levels'
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'warehouse_id', 'slot', name='uq_stock_levels_product_warehouse_slot'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=False)
+    slot = db.Column(db.Integer, nullable=False, default=0)  # 0 .. Product.stock_slots - 1
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Part of quantity held by pending requests
+
+    warehouse = db.relationship('Warehouse')
+
+    def __repr__(self):
+        return f'<StockLevel {self.product_id}@{self.warehouse_id}#{self.slot} {self.quantity}>'
+
+class StockHold(db.Model):
+    __tablename__ = 'stock_holds'
+
+    id = db.Column(db.Integer, primary_key=True)
+    allocation_id = db.Column(db.Integer, db.ForeignKey('allocations.id'), nullable=False, unique=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=False)
+    stock_level_id = db.Column(db.Integer, db.ForeignKey('stock_levels.id'), nullable=False)  # Row carrying the reservation
+    quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(UTCDateTime, default=utcnow)
+    expires_at = db.Column(UTCDateTime, nullable=False, index=True)
+
+    allocation = db.relationship('Allocation', backref=db.backref('hold', uselist=False))
+    product = db.relationship('Product')
+
+    def __repr__(self):
+        return f'<StockHold {self.allocation_id} {self.quantity} until {self.expires_at}>'
+
+class CostLayer(db.Model):
+    __tablename__ = 'cost_layers'
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    unit_cost = db.Column(db.Numeric(12, 4), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)  # Received
+    remaining = db.Column(db.Integer, nullable=False)  # Not consumed yet, oldest layers first
+    created_at = db.Column(UTCDateTime, default=utcnow)
+
+    __table_args__ = (db.Index('ix_cost_layers_product_remaining', 'product_id', 'remaining'),)
+
+    def __repr__(self):
+        return f'<CostLayer {self.product_id} {self.remaining}/{self.quantity} @ {self.unit_cost}>'
+
+class WorkCostTotal(db.Model):
+    __tablename__ = 'work_cost_totals'
+    __table_args__ = (db.UniqueConstraint('work_number', 'month', name='uq_work_cost_totals_work_month'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    work_number = db.Column(db.String(50), nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # 'YYYY-MM' of approval, UTC
+    total_cost = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    allocations = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<WorkCostTotal {self.work_number} {self.month} {self.total_cost}>'
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)  # Registered in jobs.py
+    payload = db.Column(db.Text, nullable=True)  # JSON keyword arguments
+    unique_key = db.Column(db.String(100), nullable=True, unique=True)  # Scheduled runs: '<name>:<slot>'
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(UTCDateTime, nullable=False, default=utcnow)
+    started_at = db.Column(UTCDateTime, nullable=True)
+    finished_at = db.Column(UTCDateTime, nullable=True)
+    worker = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(UTCDateTime, default=utcnow)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} ({self.status})>'
+
+class ChangeLogEntry(db.Model):
+    __tablename__ = 'change_log'
+    __table_args__ = {'sqlite_autoincrement': True}  # Tokens must never be reused
+
+    id = db.Column(db.Integer, primary_key=True)  # Used as the sync change token
+    entity = db.Column(db.String(30), nullable=False)  # 'product'
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # 'insert', 'update', 'delete'
+    created_at = db.Column(UTCDateTime, default=utcnow)
+
+    def __repr__(self):
+        return f'<ChangeLogEntry {self.id} {self.entity}:{self.entity_id} {self.op}>'
+
+class CacheInvalidation(db.Model):
+    """Cache tags invalidated by a commit, read by the other processes' local caches"""
+    __tablename__ = 'cache_invalidations'
+    __table_args__ = {'sqlite_autoincrement': True}  # Ids must never be reused
+
+    id = db.Column(db.Integer, primary_key=True)
+    tags = db.Column(db.Text, nullable=False)  # Space separated
+    created_at = db.Column(UTCDateTime, default=utcnow, index=True)
+
+    def __repr__(self):
+        return f'<CacheInvalidation {self.id} {self.tags}>'
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(64), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    allocation_id = db.Column(db.Integer, db.ForeignKey('allocations.id'), nullable=True)
+    created_at = db.Column(UTCDateTime, default=utcnow)
+
+    allocation = db.relationship('Allocation')
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key} -> {self.allocation_id}>'
+
+class NotificationSubscription(db.Model):
+    __tablename__ = 'notification_subscriptions'
+    __table_args__ = (db.UniqueConstraint('user_id', 'kind', 'target', name='uq_notification_subscriptions'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'requests' (own), 'work', 'low_stock'
+    target = db.Column(db.String(50), nullable=False, default='')  # Work number or product id; '' for 'requests'
+    email = db.Column(db.Boolean, nullable=False, default=True)  # Also send the digest by email
+    created_at = db.Column(UTCDateTime, default=utcnow)
+
+    def __repr__(self):
+        return f'<NotificationSubscription {self.user_id} {self.kind}:{self.target}>'
+
+class NotificationEvent(db.Model):
+    """Something subscribers may want to hear about, queued for the digest job"""
+    __tablename__ = 'notification_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'approved', 'rejected', 'stock_out'
+    product_id = db.Column(db.Integer, nullable=False)
+    allocation_id = db.Column(db.Integer, nullable=True)
+    requester_id = db.Column(db.Integer, nullable=True)
+    actor_id = db.Column(db.Integer, nullable=True)
+    work_number = db.Column(db.String(50), nullable=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(UTCDateTime, default=utcnow)
+
+class Notification(db.Model):
+    __tablename__ = 'notifications'
+    __table_args__ = (db.Index('ix_notifications_user_created', 'user_id', 'created_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)  # One line per coalesced event
+    created_at = db.Column(UTCDateTime, default=utcnow)
+    read_at = db.Column(UTCDateTime, nullable=True)
+
+    user = db.relationship('User')
+
+    @property
+    def lines(self):
+        return self.body.splitlines()
 
     def __repr__(self):
-        return f'<StockMovement {self.product.code} {self.movement_type} {self.quantity}>'
\ No newline at end of file
+        return f'<Notification {self.id} -> {self.user_id}>'
+
+# Record product changes in the same transaction for delta sync clients
+def _log_product_change(connection, product, op):
+    connection.execute(ChangeLogEntry.__table__.insert().values(
+        entity='product', entity_id=product.id, op=op, created_at=utcnow()
+    ))
+
+@event.listens_for(Product, 'after_insert')
+def _product_inserted(mapper, connection, product):
+    _log_product_change(connection, product, 'insert')
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, product):
+    _log_product_change(connection, product, 'update')
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, product):
+    _log_product_change(connection, product, 'delete')
+
+# Queue notification events in the same transaction as the change
+def _queue_notification(connection, **values):
+    # Nothing would consume them with the digest job disabled
+    if not current_app.config['NOTIFY_DIGEST_SECONDS']:
+        return
+    connection.execute(NotificationEvent.__table__.insert().values(created_at=utcnow(), **values))
+
+@event.listens_for(Allocation, 'after_update')
+def _allocation_processed(mapper, connection, allocation):
+    if allocation.status in ('approved', 'rejected') and inspect(allocation).attrs.status.history.has_changes():
+        _queue_notification(
+            connection, kind=allocation.status, product_id=allocation.product_id, allocation_id=allocation.id,
+            requester_id=allocation.user_id, actor_id=allocation.approved_by_id,
+            work_number=allocation.work_number, quantity=allocation.quantity
+        )
+
+@event.listens_for(StockMovement, 'after_insert')
+def _stock_taken(mapper, connection, movement):
+    # Only stock going down can make a product run low
+    if movement.new_quantity < movement.previous_quantity:
+        _queue_notification(
+            connection, kind='stock_out', product_id=movement.product_id, actor_id=movement.user_id,
+            quantity=movement.previous_quantity - movement.new_quantity
+        )
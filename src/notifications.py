@@ -0,0 +1,149 @@
+from collections import defaultdict
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import or_
+from app import db
+from models import User, Product, NotificationSubscription, NotificationEvent, Notification
+from timeutils import utcnow
+
+SUBSCRIPTION_KINDS = {
+    'requests': 'Minhas solicitações',
+    'work': 'Obra',
+    'low_stock': 'Estoque baixo',
+}
+
+# Events turned into digests per run; the rest wait for the next run
+DISPATCH_BATCH = 1000
+
+
+def subscribe(user_id, kind, target='', email=True):
+    """The user's subscription, added in the caller's transaction when missing"""
+    subscription = NotificationSubscription.query.filter_by(user_id=user_id, kind=kind, target=target).first()
+    if subscription is None:
+        subscription = NotificationSubscription(user_id=user_id, kind=kind, target=target, email=email)
+        db.session.add(subscription)
+    return subscription
+
+
+def _request_line(event, products):
+    code, name, unit = products.get(event.product_id, ('?', '', ''))
+    outcome = 'aprovada' if event.kind == 'approved' else 'rejeitada'
+    return f'Solicitação de {event.quantity} {unit} de {code} - {name} (obra {event.work_number}) foi {outcome}'
+
+
+def dispatch():
+    """Coalesce the queued events into one notification per subscriber
+
+    A request changed twice in the window is reported once, with its last
+    outcome; a product taken several times is reported once if it ended up
+    at or below LOW_STOCK_THRESHOLD. Nobody is told about their own
+    actions. Returns the notifications created; their emails are queued
+    as jobs.
+    """
+    from jobs import enqueue
+
+    events = NotificationEvent.query.order_by(NotificationEvent.id).limit(DISPATCH_BATCH).all()
+    if not events:
+        return []
+
+    processed = {}
+    taken = set()
+    for event in events:
+        if event.kind == 'stock_out':
+            taken.add(event.product_id)
+        else:
+            processed[event.allocation_id] = event
+    by_requester = defaultdict(list)
+    by_work = defaultdict(list)
+    for event in processed.values():
+        by_requester[event.requester_id].append(event)
+        by_work[event.work_number].append(event)
+
+    low = {}
+    if taken:
+        threshold = current_app.config['LOW_STOCK_THRESHOLD']
+        low = {
+            product.id: product
+            for product in Product.active().filter(Product.id.in_(taken), Product.quantity <= threshold)
+        }
+
+    conditions = []
+    if by_requester:
+        conditions.append((NotificationSubscription.kind == 'requests') &
+                          NotificationSubscription.user_id.in_(by_requester))
+    if by_work:
+        conditions.append((NotificationSubscription.kind == 'work') & NotificationSubscription.target.in_(by_work))
+    if low:
+        conditions.append((NotificationSubscription.kind == 'low_stock') &
+                          NotificationSubscription.target.in_([str(product_id) for product_id in low]))
+    subscriptions = []
+    if conditions:
+        subscriptions = NotificationSubscription.query.join(User).filter(
+            or_(*conditions), User.deleted_at.is_(None)
+        ).all()
+
+    product_ids = {event.product_id for event in processed.values()}
+    products = {}
+    if product_ids:
+        products = {
+            product_id: (code, name, unit)
+            for product_id, code, name, unit in db.session.query(
+                Product.id, Product.code, Product.name, Product.unit
+            ).filter(Product.id.in_(product_ids))
+        }
+
+    # Keyed lines, so a request matching two subscriptions is listed once
+    digests = defaultdict(dict)
+    by_email = set()
+    for subscription in subscriptions:
+        user_id = subscription.user_id
+        if subscription.kind == 'low_stock':
+            product = low[int(subscription.target)]
+            lines = {('low_stock', product.id):
+                     f'Estoque baixo: {product.code} - {product.name} ({product.quantity} {product.unit})'}
+        else:
+            matched = by_requester[user_id] if subscription.kind == 'requests' else by_work[subscription.target]
+            lines = {('request', event.allocation_id): _request_line(event, products)
+                     for event in matched if event.actor_id != user_id}
+        if lines:
+            digests[user_id].update(lines)
+            if subscription.email:
+                by_email.add(user_id)
+
+    created = []
+    for user_id, lines in digests.items():
+        notification = Notification(
+            user_id=user_id,
+            title='1 atualização' if len(lines) == 1 else f'{len(lines)} atualizações',
+            body='\n'.join(lines.values())
+        )
+        db.session.add(notification)
+        created.append(notification)
+        User.query.filter_by(id=user_id).update(
+            {User.unread_notifications: User.unread_notifications + 1}, synchronize_session=False
+        )
+
+    # Only the events read above; one with a lower id may have committed since
+    NotificationEvent.query.filter(NotificationEvent.id.in_([event.id for event in events])).delete(
+        synchronize_session=False
+    )
+    db.session.flush()
+    for notification in created:
+        if notification.user_id in by_email:
+            enqueue('send_notification_email', {'notification_id': notification.id})
+    return created
+
+
+def mark_all_read(user):
+    Notification.query.filter_by(user_id=user.id, read_at=None).update(
+        {Notification.read_at: utcnow()}, synchronize_session=False
+    )
+    user.unread_notifications = 0
+
+
+def prune_notifications(days=None):
+    """Delete read notifications older than NOTIFICATION_RETENTION_DAYS; returns how many"""
+    cutoff = utcnow() - timedelta(days=days or current_app.config['NOTIFICATION_RETENTION_DAYS'])
+    return Notification.query.filter(
+        Notification.read_at.isnot(None), Notification.created_at < cutoff
+    ).delete(synchronize_session=False)
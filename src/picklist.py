@@ -0,0 +1,75 @@
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from itertools import groupby
+from sqlalchemy import func
+from app import db
+from models import Product, Allocation
+from timeutils import BRAZIL_TZ, to_local, utcnow
+from utils import normalize_work_number
+
+PickLine = namedtuple('PickLine', 'product_id code name location location_path unit quantity allocations')
+PickGroup = namedtuple('PickGroup', 'work_number lines total_quantity')
+
+# Columns of each line in the compact JSON format, in row order
+PICK_LINE_FIELDS = PickLine._fields
+
+
+def local_day_range(day):
+    """UTC bounds of a Brazil local calendar day"""
+    start = datetime.combine(day, time.min, tzinfo=BRAZIL_TZ)
+    return start, start + timedelta(days=1)
+
+
+def build_pick_list(allocation_ids=None, work_number=None, day=None, warehouse_id=None):
+    """Approved allocations grouped by work number, in walking order of the warehouse
+
+    Lines for the same product within a work are consolidated in SQL, so
+    only one row per product and work is loaded regardless of how many
+    allocations were approved. Without explicit ids, the allocations
+    approved on ``day`` are used; the day defaults to today (local time)
+    unless a single work was requested.
+    """
+    query = db.session.query(
+        Allocation.work_number,
+        Product.id,
+        Product.code,
+        Product.name,
+        Product.location,
+        Product.location_path,
+        Product.unit,
+        func.sum(Allocation.quantity),
+        func.count(Allocation.id),
+    ).join(Product, Allocation.product_id == Product.id).filter(Allocation.status == 'approved')
+
+    if allocation_ids:
+        query = query.filter(Allocation.id.in_(allocation_ids))
+    elif day or not work_number:
+        start, end = local_day_range(day or to_local(utcnow()).date())
+        query = query.filter(Allocation.approved_at >= start, Allocation.approved_at < end)
+    if work_number:
+        query = query.filter(Allocation.work_number == work_number)
+    if warehouse_id:
+        query = query.filter(Allocation.warehouse_id == warehouse_id)
+
+    rows = query.group_by(
+        Allocation.work_number, Product.id, Product.code, Product.name,
+        Product.location, Product.location_path, Product.unit
+    ).order_by(Allocation.work_number, Product.location_path, Product.code).all()
+
+    groups = []
+    for work, work_rows in groupby(rows, key=lambda row: row[0]):
+        lines = [PickLine(*row[1:]) for row in work_rows]
+        groups.append(PickGroup(work, lines, sum(line.quantity for line in lines)))
+    return groups
+
+
+def pick_list_args(args):
+    """Read ids, work, date and warehouse from a query string; raises ValueError if malformed"""
+    allocation_ids = [int(value) for raw in args.getlist('ids') for value in raw.split(',') if value.strip()]
+    day = datetime.strptime(args['date'], '%Y-%m-%d').date() if args.get('date') else None
+    return {
+        'allocation_ids': allocation_ids or None,
+        'work_number': normalize_work_number(args.get('work')) or None,
+        'day': day,
+        'warehouse_id': int(args['warehouse']) if args.get('warehouse') else None,
+    }
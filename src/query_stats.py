@@ -0,0 +1,47 @@
+import os
+import logging
+from collections import Counter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Responses carry X-Query-Count; statements run more than once with the
+# same parameters in one request are logged as duplicates
+DUPLICATE_LOG_LIMIT = 5
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or 'query_stats' not in g:
+        return
+    g.query_stats[(statement, repr(parameters))] += 1
+
+
+def init_query_stats(app):
+    """Count the SQL statements of each request in debug mode (or with QUERY_STATS=1)"""
+    app.config.setdefault("QUERY_STATS", os.environ.get("QUERY_STATS") == "1")
+    event.listen(Engine, "before_cursor_execute", _count_query)
+
+    @app.before_request
+    def _start_counting():
+        # Checked per request: debug mode is usually switched on by app.run()
+        if app.debug or app.config["QUERY_STATS"]:
+            g.query_stats = Counter()
+
+    @app.after_request
+    def _report_queries(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        total = sum(stats.values())
+        response.headers["X-Query-Count"] = str(total)
+
+        duplicates = [(statement, count) for (statement, _), count in stats.most_common() if count > 1]
+        if duplicates:
+            logging.warning(
+                f"{request.method} {request.path}: {total} consultas, {len(duplicates)} repetidas\n"
+                + "\n".join(f"  {count}x {' '.join(statement.split())[:200]}"
+                            for statement, count in duplicates[:DUPLICATE_LOG_LIMIT])
+            )
+        else:
+            logging.debug(f"{request.method} {request.path}: {total} consultas")
+        return response
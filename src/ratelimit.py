@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+import logging
+
+
+class MemoryCounterStore:
+    """Per-process fixed-window counters"""
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                return 0
+            return entry[0]
+
+    def incr(self, key, window):
+        with self._lock:
+            now = time.monotonic()
+            count, expires_at = self._counters.get(key, (0, 0))
+            if expires_at < now:
+                count, expires_at = 0, now + window
+            self._counters[key] = (count + 1, expires_at)
+            if len(self._counters) > 10000:
+                self._purge(now)
+            return count + 1
+
+    def reset(self, key):
+        with self._lock:
+            self._counters.pop(key, None)
+
+    def _purge(self, now):
+        for key in [k for k, (_, expires_at) in self._counters.items() if expires_at < now]:
+            del self._counters[key]
+
+
+class RedisCounterStore:
+    """Counters shared between workers through Redis"""
+
+    def __init__(self, client, prefix='almox:ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def incr(self, key, window):
+        full_key = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.incr(full_key)
+        pipe.expire(full_key, window, nx=True)
+        count, _ = pipe.execute()
+        return count
+
+    def reset(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class LoginRateLimiter:
+    """Rejects login attempts with too many recent failures
+
+    The strict limit counts failures of one username from one IP, so an
+    attacker elsewhere cannot lock the account out. A much higher ceiling
+    per username caps guessing spread over many IPs.
+    """
+
+    def __init__(self, app=None):
+        self.store = MemoryCounterStore()
+        self.window = 900
+        self.max_per_user = 5
+        self.max_per_username = 100
+        self.max_per_ip = 50
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("LOGIN_RATE_LIMIT_BACKEND", os.environ.get("LOGIN_RATE_LIMIT_BACKEND", "memory"))
+        app.config.setdefault("LOGIN_RATE_LIMIT_REDIS_URL", os.environ.get("LOGIN_RATE_LIMIT_REDIS_URL", ""))
+        app.config.setdefault("LOGIN_RATE_LIMIT_WINDOW", int(os.environ.get("LOGIN_RATE_LIMIT_WINDOW", "900")))
+        app.config.setdefault("LOGIN_MAX_ATTEMPTS_PER_USER", int(os.environ.get("LOGIN_MAX_ATTEMPTS_PER_USER", "5")))
+        app.config.setdefault("LOGIN_MAX_ATTEMPTS_PER_USERNAME", int(os.environ.get("LOGIN_MAX_ATTEMPTS_PER_USERNAME", "100")))
+        app.config.setdefault("LOGIN_MAX_ATTEMPTS_PER_IP", int(os.environ.get("LOGIN_MAX_ATTEMPTS_PER_IP", "50")))
+
+        self.window = app.config["LOGIN_RATE_LIMIT_WINDOW"]
+        self.max_per_user = app.config["LOGIN_MAX_ATTEMPTS_PER_USER"]
+        self.max_per_username = app.config["LOGIN_MAX_ATTEMPTS_PER_USERNAME"]
+        self.max_per_ip = app.config["LOGIN_MAX_ATTEMPTS_PER_IP"]
+
+        if app.config["LOGIN_RATE_LIMIT_BACKEND"] == "redis":
+            try:
+                import redis
+            except ImportError:
+                logging.warning("LOGIN_RATE_LIMIT_BACKEND=redis mas o pacote redis não está instalado; usando memória local")
+            else:
+                self.store = RedisCounterStore(redis.Redis.from_url(app.config["LOGIN_RATE_LIMIT_REDIS_URL"]))
+        if isinstance(self.store, MemoryCounterStore) and int(os.environ.get("WEB_CONCURRENCY", "2")) > 1:
+            # Each worker counts on its own, so the limits are multiplied by the worker count
+            logging.warning("Limite de login em memória com WEB_CONCURRENCY > 1: cada worker conta as falhas "
+                            "separadamente; use LOGIN_RATE_LIMIT_BACKEND=redis")
+
+        app.extensions["login_rate_limiter"] = self
+
+    def _keys(self, username, ip):
+        username = (username or '').lower()
+        return f"user:{username}:ip:{ip}", f"user:{username}", f"ip:{ip}"
+
+    def is_blocked(self, username, ip):
+        user_ip_key, user_key, ip_key = self._keys(username, ip)
+        return self.store.get(user_ip_key) >= self.max_per_user or \
+               self.store.get(user_key) >= self.max_per_username or \
+               self.store.get(ip_key) >= self.max_per_ip
+
+    def register_failure(self, username, ip):
+        for key in self._keys(username, ip):
+            self.store.incr(key, self.window)
+
+    def register_success(self, username, ip):
+        # The username ceiling is left alone so guesses from other IPs keep counting
+        user_ip_key, _, _ = self._keys(username, ip)
+        self.store.reset(user_ip_key)
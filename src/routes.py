@@ -1,15 +1,76 @@
 import os
+from collections import namedtuple
 from datetime import datetime, timedelta
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory
-from models import brazil_now
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory, Response
+from timeutils import utcnow
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
-from app import app, db
-from models import User, Product, Allocation, StockMovement
+from app import app, db, cache, broker, login_limiter
+from cache import CachedPagination, product_tag, user_allocations_tag
+from http_cache import conditional_page, conditional_catalog_json, init_http_cache
+from picklist import build_pick_list, pick_list_args
+from search_index import product_index
+from serializers import requested_fields, compact_requested, shape_rows, project, product_rows, product_dict
+from sync_tokens import settled_token
+from models import (User, Product, Allocation, StockMovement, Warehouse, StockLevel, Job, Notification,
+                    NotificationSubscription, Work, ChangeLogEntry)
 from forms import (LoginForm, ForgotPasswordForm, ResetPasswordForm, EmployeeForm, 
                    EditEmployeeForm, ProductForm, AllocationForm, StockAdjustmentForm,
-                   ProductionRequestForm, ApprovalForm)
-from utils import save_uploaded_file, delete_uploaded_file, generate_reset_token, send_reset_email, log_stock_movement
+                   ProductionRequestForm, ApprovalForm, CycleCountForm, WarehouseForm, SubscriptionForm)
+from costing import work_cost_subquery, work_cost_months
+from stock import (resolve_warehouse, default_warehouse, site_quantity, site_available, site_quantities,
+                   place_hold, release_hold, warehouse_choices)
+from labels import MAX_LABELS, LABEL_KINDS, label_svg, qr_available
+from idempotency import claim_key, new_key
+from notifications import SUBSCRIPTION_KINDS, subscribe, mark_all_read
+from works import open_work, close_work, reopen_work, suggest, number_prefix
+from utils import (save_uploaded_file, delete_uploaded_file, generate_reset_token, log_stock_movement,
+                   normalize_work_number)
+
+init_http_cache(app)
+
+# Plain row types for cached query results
+ProductRow = namedtuple('ProductRow', [
+    'id', 'code', 'name', 'supplier_reference', 'location', 'quantity', 'reserved_quantity', 'unit',
+    'supplier_name', 'photo_filename', 'created_at', 'updated_at'
+])
+WorkSummary = namedtuple('WorkSummary', [
+    'id', 'work_number', 'status', 'total_allocations', 'unique_products', 'total_quantity', 'last_allocation',
+    'total_cost'
+])
+WORK_STATUS_FILTERS = {'open': 'Abertas', 'closed': 'Encerradas', 'all': 'Todas'}
+
+# Autocomplete answers; clients filter a shorter list locally as the query grows
+SEARCH_LIMIT = 10
+
+# Stock changes sent per poll of a page without live streaming
+LIVE_POLL_MAX_PRODUCTS = 200
+SEARCH_RESULT_FIELDS = (
+    'id', 'code', 'name', 'supplier_reference', 'location', 'quantity', 'available', 'sites', 'unit',
+    'supplier_name', 'photo_filename'
+)
+
+# Preselected product embedded in the request form
+REQUEST_PRODUCT_FIELDS = (
+    'id', 'code', 'name', 'supplier_reference', 'supplier_name', 'location', 'quantity', 'unit', 'photo_filename'
+)
+
+@app.template_filter('currency')
+def currency_filter(value):
+    """Format a value in reais, e.g. R$ 1.234,56"""
+    if value is None:
+        return '-'
+    return 'R$ ' + f'{value:,.2f}'.translate(str.maketrans(',.', '.,'))
+
+def _product_search_filter(query, search):
+    return query.filter(
+        Product.name.contains(search) | 
+        Product.code.contains(search) |
+        Product.supplier_reference.contains(search)
+    )
+
+def _product_tags(product_ids):
+    return ['catalog'] + [product_tag(product_id) for product_id in product_ids]
 
 # Authentication routes
 @app.route('/')
@@ -28,13 +89,24 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
+        # Reject abusive clients before spending CPU on password hashing
+        ip = request.remote_addr
+        if login_limiter.is_blocked(form.username.data, ip):
+            flash('Muitas tentativas de login. Aguarde alguns minutos e tente novamente.', 'danger')
+            return render_template('login.html', form=form), 429
+        
+        user = User.active().filter_by(username=form.username.data).first()
         if user and user.check_password(form.password.data) and user.is_active:
+            login_limiter.register_success(form.username.data, ip)
+            if user.password_needs_rehash():
+                user.set_password(form.password.data)
+                db.session.commit()
             login_user(user)
             next_page = request.args.get('next')
             flash(f'Bem-vindo, {user.username}!', 'success')
             return redirect(next_page) if next_page else redirect(url_for('index'))
         else:
+            login_limiter.register_failure(form.username.data, ip)
             flash('Usuário ou senha inválidos, ou conta desativada.', 'danger')
     
     return render_template('login.html', form=form)
@@ -50,17 +122,18 @@ def logout():
 def forgot_password():
     form = ForgotPasswordForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
+        user = User.active().filter_by(email=form.email.data).first()
         if user:
             token = generate_reset_token()
             user.reset_token = token
-            user.reset_token_expires = brazil_now() + timedelta(hours=1)
+            user.reset_token_expires = utcnow() + timedelta(hours=1)
+            
+            # SMTP can be slow: the job worker sends the email, with retries
+            from jobs import enqueue
+            enqueue('send_reset_email', {'user_id': user.id, 'token': token})
             db.session.commit()
             
-            if send_reset_email(user, token):
-                flash('Instruções para redefinir sua senha foram enviadas para seu email.', 'info')
-            else:
-                flash('Erro ao enviar email. Tente novamente mais tarde.', 'danger')
+            flash('Instruções para redefinir sua senha foram enviadas para seu email.', 'info')
         else:
             flash('Email não encontrado.', 'danger')
         
@@ -75,8 +148,8 @@ def reset_password():
         flash('Token inválido.', 'danger')
         return redirect(url_for('login'))
     
-    user = User.query.filter_by(reset_token=token).first()
-    if not user or not user.reset_token_expires or user.reset_token_expires < brazil_now():
+    user = User.active().filter_by(reset_token=token).first()
+    if not user or not user.reset_token_expires or user.reset_token_expires < utcnow():
         flash('Token inválido ou expirado.', 'danger')
         return redirect(url_for('login'))
     
@@ -100,35 +173,46 @@ def dashboard_almoxarifado():
         return redirect(url_for('dashboard_producao'))
     
     # Statistics
-    total_products = Product.query.count()
-    total_allocations = Allocation.query.count()
-    low_stock_products = Product.query.filter(Product.quantity <= 10).count()
-    pending_requests = Allocation.query.filter_by(status='pending').count()
+    stats = _almoxarifado_stats()
     recent_allocations = Allocation.query.order_by(Allocation.allocated_at.desc()).limit(5).all()
     
     return render_template('dashboard_almoxarifado.html', 
-                         total_products=total_products,
-                         total_allocations=total_allocations,
-                         low_stock_products=low_stock_products,
-                         pending_requests=pending_requests,
-                         recent_allocations=recent_allocations)
+                         recent_allocations=recent_allocations,
+                         **stats)
+
+def _almoxarifado_stats():
+    return cache.get_or_set('dashboard_almoxarifado', None, lambda: {
+        'total_products': Product.active().count(),
+        'total_allocations': Allocation.query.count(),
+        'low_stock_products': Product.active().filter(Product.quantity <= app.config['LOW_STOCK_THRESHOLD']).count(),
+        'pending_requests': Allocation.query.filter_by(status='pending').count(),
+    }, tags=['catalog', 'stock', 'allocations'])
 
 @app.route('/dashboard/producao')
 @login_required
 def dashboard_producao():
     # Statistics for production users
-    total_requests = Allocation.query.filter_by(user_id=current_user.id).count()
-    pending_requests = Allocation.query.filter_by(user_id=current_user.id, status='pending').count()
-    approved_requests = Allocation.query.filter_by(user_id=current_user.id, status='approved').count()
-    rejected_requests = Allocation.query.filter_by(user_id=current_user.id, status='rejected').count()
-    recent_user_allocations = Allocation.query.filter_by(user_id=current_user.id).order_by(Allocation.allocated_at.desc()).limit(10).all()
+    user_id = current_user.id
+    stats = cache.get_or_set('dashboard_producao', {'user_id': user_id}, lambda: _producao_stats(user_id),
+                             tags=[user_allocations_tag(user_id)])
+    recent_user_allocations = Allocation.query.filter_by(user_id=user_id).order_by(Allocation.allocated_at.desc()).limit(10).all()
     
     return render_template('dashboard_producao.html',
-                         total_requests=total_requests,
-                         pending_requests=pending_requests,
-                         approved_requests=approved_requests,
-                         rejected_requests=rejected_requests,
-                         recent_allocations=recent_user_allocations)
+                         recent_allocations=recent_user_allocations,
+                         **stats)
+
+def _producao_stats(user_id):
+    from sqlalchemy import func
+    # One grouped query instead of a count per status
+    counts = dict(db.session.query(Allocation.status, func.count(Allocation.id)).filter_by(
+        user_id=user_id
+    ).group_by(Allocation.status).all())
+    return {
+        'total_requests': sum(counts.values()),
+        'pending_requests': counts.get('pending', 0),
+        'approved_requests': counts.get('approved', 0),
+        'rejected_requests': counts.get('rejected', 0),
+    }
 
 # Product management routes
 @app.route('/products/add', methods=['GET', 'POST'])
@@ -165,7 +249,8 @@ def add_product():
             db.session.commit()
             
             # Log initial stock
-            log_stock_movement(product, current_user, 'add', form.quantity.data, 'Produto cadastrado')
+            log_stock_movement(product, current_user, 'add', form.quantity.data, 'Produto cadastrado',
+                               warehouse=resolve_warehouse(form.warehouse_id.data), unit_cost=form.unit_cost.data)
             db.session.commit()
             
             flash('Produto adicionado com sucesso!', 'success')
@@ -181,6 +266,7 @@ def add_product():
 
 @app.route('/products/manage')
 @login_required
+@conditional_page
 def manage_products():
     if current_user.role != 'almoxarifado':
         flash('Acesso negado.', 'danger')
@@ -189,7 +275,7 @@ def manage_products():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '', type=str)
     
-    query = Product.query
+    query = Product.active()
     if search:
         query = query.filter(
             Product.name.contains(search) | 
@@ -213,9 +299,9 @@ def edit_product(product_id):
         flash('Acesso negado.', 'danger')
         return redirect(url_for('dashboard_producao'))
     
-    product = Product.query.get_or_404(product_id)
+    product = Product.active_or_404(product_id)
     form = ProductForm(obj=product)
-    form.product_id = product.id  # For validation
+    form.product = product  # For validation
     
     if form.validate_on_submit():
         # Handle photo update
@@ -232,7 +318,7 @@ def edit_product(product_id):
         product.location = form.location.data
         product.unit = form.unit.data
         product.supplier_name = form.supplier_name.data
-        product.updated_at = brazil_now()
+        product.updated_at = utcnow()
         
         db.session.commit()
         flash('Produto atualizado com sucesso!', 'success')
@@ -247,18 +333,15 @@ def delete_product(product_id):
         flash('Acesso negado.', 'danger')
         return redirect(url_for('manage_products'))
     
-    product = Product.query.get_or_404(product_id)
+    product = Product.active_or_404(product_id)
     
-    # Check if product has allocations
-    if product.allocations:
-        flash('Não é possível excluir produto com alocações associadas.', 'danger')
+    # Pending requests hold its stock; approved ones and the movements stay as history
+    if db.session.query(Allocation.query.filter_by(product_id=product.id, status='pending').exists()).scalar():
+        flash('Não é possível excluir produto com solicitações pendentes.', 'danger')
         return redirect(url_for('manage_products'))
     
-    # Delete photo file
-    if product.photo_filename:
-        delete_uploaded_file(product.photo_filename)
-    
-    db.session.delete(product)
+    # Archived rather than deleted; the photo stays for the history pages
+    product.deleted_at = utcnow()
     db.session.commit()
     
     flash('Produto excluído com sucesso!', 'success')
@@ -271,7 +354,7 @@ def adjust_stock(product_id):
         flash('Acesso negado.', 'danger')
         return redirect(url_for('manage_products'))
     
-    product = Product.query.get_or_404(product_id)
+    product = Product.active_or_404(product_id)
     form = StockAdjustmentForm()
     
     if form.validate_on_submit():
@@ -280,7 +363,9 @@ def adjust_stock(product_id):
             current_user, 
             form.adjustment_type.data, 
             form.quantity.data, 
-            form.notes.data or ""
+            form.notes.data or "",
+            warehouse=resolve_warehouse(form.warehouse_id.data),
+            unit_cost=form.unit_cost.data
         )
         db.session.commit()
         
@@ -292,63 +377,313 @@ def adjust_stock(product_id):
     
     return redirect(url_for('manage_products'))
 
+@app.route('/products/cycle_count', methods=['GET', 'POST'])
+@login_required
+def cycle_count():
+    if current_user.role != 'almoxarifado':
+        flash('Acesso negado.', 'danger')
+        return redirect(url_for('dashboard_producao'))
+    
+    form = CycleCountForm()
+    location = request.values.get('location', '', type=str)
+    warehouse = resolve_warehouse(request.values.get('warehouse_id', 0, type=int)) or default_warehouse()
+    locations = [row[0] for row in db.session.query(Product.location).filter(Product.deleted_at.is_(None))
+                 .distinct().order_by(Product.location)]
+    conflicts = {}
+    counted = {}
+    
+    if form.validate_on_submit():
+        # Counted quantities arrive as counted-<id>, with the stock shown to the
+        # counter in expected-<id>; blank fields were not counted
+        errors = []
+        for field, value in request.form.items():
+            if not field.startswith('counted-') or value.strip() == '':
+                continue
+            product_id = field[len('counted-'):]
+            try:
+                counted[int(product_id)] = (int(value), int(request.form.get(f'expected-{product_id}', '')))
+            except ValueError:
+                errors.append(product_id)
+        
+        if errors or any(quantity < 0 for quantity, _ in counted.values()):
+            flash('Informe quantidades inteiras e não negativas.', 'danger')
+        elif not counted:
+            flash('Nenhuma quantidade informada.', 'warning')
+        else:
+            # Lock the counted rows and make sure nobody moved stock during the count
+            products = Product.active().filter(
+                Product.id.in_(counted.keys()), Product.location == form.location.data
+            ).with_for_update().all()
+            site_stock = {product.id: site_quantity(product.id, warehouse.id) for product in products}
+            conflicts = {
+                product.id: site_stock[product.id]
+                for product in products
+                if site_stock[product.id] != counted[product.id][1]
+            }
+            
+            if len(products) != len(counted):
+                # Archived, moved to another location or never part of this one
+                db.session.rollback()
+                flash('Alguns produtos contados não estão mais neste local. Confira a lista e envie novamente.', 'warning')
+            elif conflicts:
+                db.session.rollback()
+                flash('O estoque de alguns produtos mudou durante a contagem. Confira as linhas destacadas e envie novamente.', 'warning')
+            else:
+                notes = form.notes.data or f'Contagem física - local {form.location.data}'
+                adjusted = 0
+                for product in products:
+                    if counted[product.id][0] != site_stock[product.id]:
+                        log_stock_movement(product, current_user, 'count', counted[product.id][0], notes,
+                                           warehouse=warehouse)
+                        adjusted += 1
+                db.session.commit()
+                
+                flash(f'Contagem registrada: {len(products)} produto(s) conferido(s), {adjusted} ajustado(s).', 'success')
+                return redirect(url_for('cycle_count', location=form.location.data, warehouse_id=warehouse.id))
+    
+    products = []
+    site_stock = {}
+    if location:
+        products = Product.active().filter_by(location=location).order_by(Product.code).all()
+        stock = site_quantities([product.id for product in products])
+        site_stock = {product.id: stock.get(product.id, {}).get(warehouse.id, 0) for product in products}
+        form.location.data = location
+    form.warehouse_id.data = warehouse.id
+    
+    return render_template('cycle_count.html', form=form, locations=locations, location=location,
+                           products=products, site_stock=site_stock, conflicts=conflicts, counted=counted)
+
+@app.route('/products/labels')
+@login_required
+def product_labels():
+    """Printable sheet of barcode or QR labels for a location, a search or chosen products"""
+    if current_user.role != 'almoxarifado':
+        flash('Acesso negado.', 'danger')
+        return redirect(url_for('dashboard_producao'))
+    
+    kind = request.args.get('kind', 'barcode', type=str)
+    if kind not in LABEL_KINDS:
+        kind = 'barcode'
+    if kind == 'qr' and not qr_available():
+        flash('Etiquetas QR requerem o pacote segno; usando código de barras.', 'warning')
+        kind = 'barcode'
+    search = request.args.get('search', '', type=str)
+    location = request.args.get('location', '', type=str)
+    ids = request.args.getlist('ids', type=int)
+    locations = [row[0] for row in db.session.query(Product.location).filter(Product.deleted_at.is_(None))
+                 .distinct().order_by(Product.location)]
+    
+    labels = []
+    truncated = False
+    if search or location or ids:
+        query = Product.active()
+        if ids:
+            query = query.filter(Product.id.in_(ids))
+        if location:
+            query = query.filter_by(location=location)
+        if search:
+            query = query.filter(
+                Product.name.contains(search) |
+                Product.code.contains(search) |
+                Product.supplier_reference.contains(search)
+            )
+        rows = product_rows(('code', 'name', 'location'),
+                            query=query.order_by(Product.location, Product.code).limit(MAX_LABELS + 1))
+        truncated = len(rows) > MAX_LABELS
+        for code, name, product_location in rows[:MAX_LABELS]:
+            try:
+                svg = label_svg(code, kind)
+            except ValueError:
+                # Codes outside printable ASCII have no barcode; the label shows the text only
+                svg = None
+            labels.append((code, name, product_location, svg))
+    
+    return render_template('labels.html', labels=labels, kind=kind, kinds=LABEL_KINDS, search=search,
+                           location=location, locations=locations, truncated=truncated, max_labels=MAX_LABELS)
+
+@app.route('/scan')
+@login_required
+def scan_page():
+    """Counter page driven by a barcode scanner: lookup, allocation, adjustment and count"""
+    if current_user.role != 'almoxarifado':
+        flash('Acesso negado.', 'danger')
+        return redirect(url_for('dashboard_producao'))
+    
+    return render_template('scan.html', warehouses=warehouse_choices())
+
+@app.route('/warehouses', methods=['GET', 'POST'])
+@login_required
+def manage_warehouses():
+    if current_user.role != 'almoxarifado':
+        flash('Acesso negado.', 'danger')
+        return redirect(url_for('dashboard_producao'))
+    
+    form = WarehouseForm()
+    if form.validate_on_submit():
+        if not current_user.is_admin:
+            flash('Apenas administradores podem cadastrar almoxarifados.', 'danger')
+            return redirect(url_for('manage_warehouses'))
+        
+        db.session.add(Warehouse(code=form.code.data, name=form.name.data))
+        db.session.commit()
+        flash('Almoxarifado cadastrado com sucesso!', 'success')
+        return redirect(url_for('manage_warehouses'))
+    
+    from sqlalchemy import func
+    
+    # Products in stock and units per warehouse
+    totals = {
+        warehouse_id: (products, quantity)
+        for warehouse_id, products, quantity in db.session.query(
+            StockLevel.warehouse_id,
+            func.count(func.distinct(StockLevel.product_id)),
+            func.sum(StockLevel.quantity)
+        ).filter(StockLevel.quantity > 0).group_by(StockLevel.warehouse_id)
+    }
+    warehouses = Warehouse.query.order_by(Warehouse.id).all()
+    
+    return render_template('manage_warehouses.html', form=form, warehouses=warehouses, totals=totals)
+
+@app.route('/jobs')
+@login_required
+def job_status_page():
+    if current_user.role != 'almoxarifado' or not current_user.is_admin:
+        flash('Acesso negado.', 'danger')
+        return redirect(url_for('index'))
+    
+    from jobs import JOBS, schedule, job_status, queue_health
+    
+    counts, last_runs, recent = job_status()
+    return render_template('jobs.html', counts=counts, last_runs=last_runs, recent=recent,
+                           job_names=sorted(JOBS), intervals=schedule(), problems=queue_health())
+
+@app.route('/health')
+def health():
+    """Liveness of the app and its job worker, for monitoring; 503 when jobs go stale"""
+    from jobs import queue_health
+    
+    problems = queue_health()
+    if problems:
+        for problem in problems:
+            app.logger.warning(problem)
+        return jsonify({'status': 'degraded', 'problems': problems}), 503
+    return jsonify({'status': 'ok'})
+
+@app.route('/jobs/run/<name>', methods=['POST'])
+@login_required
+def run_job_now(name):
+    if current_user.role != 'almoxarifado' or not current_user.is_admin:
+        flash('Acesso negado.', 'danger')
+        return redirect(url_for('index'))
+    
+    from jobs import enqueue
+    
+    try:
+        enqueue(name)
+    except ValueError:
+        flash('Tarefa desconhecida.', 'danger')
+        return redirect(url_for('job_status_page'))
+    db.session.commit()
+    flash(f'Tarefa {name} colocada na fila.', 'success')
+    return redirect(url_for('job_status_page'))
+
+@app.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def retry_job(job_id):
+    if current_user.role != 'almoxarifado' or not current_user.is_admin:
+        flash('Acesso negado.', 'danger')
+        return redirect(url_for('index'))
+    
+    from jobs import retry
+    
+    failed = db.get_or_404(Job, job_id)
+    if failed.status != 'failed':
+        flash('Apenas tarefas com falha podem ser reexecutadas.', 'warning')
+    else:
+        retry(failed)
+        db.session.commit()
+        flash('Tarefa colocada novamente na fila.', 'success')
+    return redirect(url_for('job_status_page'))
+
 # Work management routes
 @app.route('/works/manage')
 @login_required
 def manage_works():
     # Allow both almoxarifado and producao users to view works
-    pass
+    search = request.args.get('search', '', type=str)
+    status = request.args.get('status', 'open', type=str)
+    if status not in WORK_STATUS_FILTERS:
+        status = 'open'
+    works_query = _work_list(search, status)
     
-    # Get all allocations grouped by work_number
+    return render_template('manage_works.html', works=works_query, search=search, status=status,
+                           status_filters=WORK_STATUS_FILTERS)
+
+def _work_list(search, status='open'):
+    return cache.get_or_set('manage_works', {'search': search, 'status': status},
+                            lambda: _work_summaries(search, status), tags=['works'])
+
+def warm_cache():
+    """Fill the shared cache for the busiest pages; run by the job worker"""
+    _almoxarifado_stats()
+    _work_list('')
+
+def _work_summaries(search, status):
+    """Registered works with the totals of their approved allocations, most recent first
+
+    Closed works are left out unless asked for; the search matches the
+    start of the normalized number through its index.
+    """
     from sqlalchemy import func
     
-    # Get work numbers with statistics
-    works_query = db.session.query(
-        Allocation.work_number,
+    # Costs come from the incrementally maintained totals, one row per work and month
+    costs = work_cost_subquery()
+    last_allocation = func.max(Allocation.allocated_at)
+    query = db.session.query(
+        Work.id,
+        Work.number,
+        Work.status,
         func.count(Allocation.id).label('total_allocations'),
         func.count(func.distinct(Allocation.product_id)).label('unique_products'),
-        func.sum(Allocation.quantity).label('total_quantity'),
-        func.max(Allocation.allocated_at).label('last_allocation')
-    ).filter(
-        Allocation.status == 'approved'
-    ).group_by(Allocation.work_number).order_by(
-        func.max(Allocation.allocated_at).desc()
-    ).all()
-    
-    # Get search parameter
-    search = request.args.get('search', '', type=str)
+        func.coalesce(func.sum(Allocation.quantity), 0).label('total_quantity'),
+        last_allocation.label('last_allocation'),
+        func.max(costs.c.total_cost).label('total_cost')
+    ).outerjoin(
+        Allocation, (Allocation.work_id == Work.id) & (Allocation.status == 'approved')
+    ).outerjoin(
+        costs, costs.c.work_number == Work.number
+    )
+    if status != 'all':
+        query = query.filter(Work.status == status)
+    search = normalize_work_number(search)
     if search:
-        works_query = db.session.query(
-            Allocation.work_number,
-            func.count(Allocation.id).label('total_allocations'),
-            func.count(func.distinct(Allocation.product_id)).label('unique_products'),
-            func.sum(Allocation.quantity).label('total_quantity'),
-            func.max(Allocation.allocated_at).label('last_allocation')
-        ).filter(
-            Allocation.status == 'approved',
-            Allocation.work_number.contains(search)
-        ).group_by(Allocation.work_number).order_by(
-            func.max(Allocation.allocated_at).desc()
-        ).all()
-    
-    return render_template('manage_works.html', works=works_query, search=search)
+        query = query.filter(number_prefix(search))
+    
+    rows = query.group_by(Work.id, Work.number, Work.status).order_by(
+        func.coalesce(last_allocation, Work.created_at).desc()
+    ).all()
+    return [WorkSummary(*row) for row in rows]
+
+@app.route('/api/works/search')
+@login_required
+def search_works():
+    """Numbers of the open works starting with q, for the work number fields"""
+    return jsonify(suggest(request.args.get('q', '')))
 
 @app.route('/works/<work_number>/details')
 @login_required
 def work_details(work_number):
     # Allow both almoxarifado and producao users to view work details
-    pass
+    work = Work.query.filter_by(number=normalize_work_number(work_number)).first()
+    if work is None:
+        flash('Obra não encontrada.', 'danger')
+        return redirect(url_for('manage_works'))
     
-    # Get all allocations for this work
     allocations = Allocation.query.filter_by(
-        work_number=work_number, 
+        work_id=work.id,
         status='approved'
     ).order_by(Allocation.allocated_at.desc()).all()
     
-    if not allocations:
-        flash('Obra não encontrada.', 'danger')
-        return redirect(url_for('manage_works'))
-    
     # Calculate totals
     from sqlalchemy import func
     stats = db.session.query(
@@ -357,12 +692,32 @@ def work_details(work_number):
         func.sum(Allocation.quantity).label('total_quantity'),
         func.min(Allocation.allocated_at).label('first_allocation'),
         func.max(Allocation.allocated_at).label('last_allocation')
-    ).filter_by(work_number=work_number, status='approved').first()
+    ).filter_by(work_id=work.id, status='approved').first()
     
     return render_template('work_details.html', 
-                         work_number=work_number, 
+                         work=work,
+                         work_number=work.number, 
                          allocations=allocations, 
-                         stats=stats)
+                         stats=stats,
+                         cost_months=work_cost_months(work.number))
+
+@app.route('/works/<int:work_id>/status', methods=['POST'])
+@login_required
+def set_work_status(work_id):
+    """Close a work to new allocations and requests, or open it again"""
+    if current_user.role != 'almoxarifado':
+        flash('Acesso negado.', 'danger')
+        return redirect(url_for('manage_works'))
+    
+    work = db.get_or_404(Work, work_id)
+    if request.form.get('status') == 'closed':
+        close_work(work)
+        flash(f'Obra {work.number} encerrada.', 'success')
+    else:
+        reopen_work(work)
+        flash(f'Obra {work.number} reaberta.', 'success')
+    db.session.commit()
+    return redirect(url_for('work_details', work_number=work.number))
 
 # Employee management routes
 @app.route('/employees/manage')
@@ -372,7 +727,7 @@ def manage_employees():
         flash('Acesso negado.', 'danger')
         return redirect(url_for('index'))
     
-    employees = User.query.all()
+    employees = User.active().all()
     return render_template('manage_employees.html', employees=employees)
 
 @app.route('/employees/add', methods=['GET', 'POST'])
@@ -385,11 +740,11 @@ def add_employee():
     form = EmployeeForm()
     if form.validate_on_submit():
         # Check if username or email already exists
-        if User.query.filter_by(username=form.username.data).first():
+        if User.active().filter_by(username=form.username.data).first():
             flash('Nome de usuário já existe.', 'danger')
             return render_template('add_employee.html', form=form)
         
-        if User.query.filter_by(email=form.email.data).first():
+        if User.active().filter_by(email=form.email.data).first():
             flash('Email já cadastrado.', 'danger')
             return render_template('add_employee.html', form=form)
         
@@ -403,6 +758,10 @@ def add_employee():
         user.set_password(form.password.data)
         
         db.session.add(user)
+        if user.role == 'producao':
+            # Told when their requests are processed, until they opt out
+            db.session.flush()
+            subscribe(user.id, 'requests')
         db.session.commit()
         
         flash('Funcionário adicionado com sucesso!', 'success')
@@ -417,17 +776,17 @@ def edit_employee(user_id):
         flash('Acesso negado.', 'danger')
         return redirect(url_for('index'))
     
-    user = User.query.get_or_404(user_id)
+    user = User.active_or_404(user_id)
     form = EditEmployeeForm(obj=user)
     
     if form.validate_on_submit():
         # Check if username or email already exists (excluding current user)
-        existing_user = User.query.filter_by(username=form.username.data).first()
+        existing_user = User.active().filter_by(username=form.username.data).first()
         if existing_user and existing_user.id != user.id:
             flash('Nome de usuário já existe.', 'danger')
             return render_template('edit_employee.html', form=form, user=user)
         
-        existing_email = User.query.filter_by(email=form.email.data).first()
+        existing_email = User.active().filter_by(email=form.email.data).first()
         if existing_email and existing_email.id != user.id:
             flash('Email já cadastrado.', 'danger')
             return render_template('edit_employee.html', form=form, user=user)
@@ -458,14 +817,10 @@ def delete_employee(user_id):
         flash('Você não pode excluir sua própria conta.', 'danger')
         return redirect(url_for('manage_employees'))
     
-    user = User.query.get_or_404(user_id)
-    
-    # Check if user has allocations
-    if user.allocations:
-        flash('Não é possível excluir usuário com alocações associadas.', 'danger')
-        return redirect(url_for('manage_employees'))
+    user = User.active_or_404(user_id)
     
-    db.session.delete(user)
+    # Archived rather than deleted, so their requests and movements keep their author
+    user.deleted_at = utcnow()
     db.session.commit()
     
     flash('Funcionário excluído com sucesso!', 'success')
@@ -492,7 +847,7 @@ def allocate_product():
     selected_product = None
     
     if product_id:
-        selected_product = Product.query.get(product_id)
+        selected_product = Product.active().filter_by(id=product_id).first()
         if selected_product:
             form.product_search.data = f"{selected_product.code} - {selected_product.name}"
             form.product_id.data = str(selected_product.id)
@@ -501,24 +856,38 @@ def allocate_product():
         form.work_number.data = work_number
     
     if form.validate_on_submit():
-        product = Product.query.get_or_404(form.product_id.data)
+        product = Product.active_or_404(form.product_id.data)
+        warehouse = resolve_warehouse(form.warehouse_id.data)
         
-        if product.quantity < form.quantity.data:
-            flash('Quantidade insuficiente em estoque.', 'danger')
+        # Claimed before the stock check: a repeat of an allocation that
+        # took the last units is still the same allocation
+        key, replay = claim_key(current_user.id, form.idempotency_key.data or new_key())
+        if replay:
+            flash('Esta alocação já foi registrada.', 'info')
+            return redirect(url_for('allocation_history'))
+        
+        # Stock held by pending requests is not available for direct allocation
+        if site_available(product.id, warehouse.id) < form.quantity.data:
+            db.session.rollback()
+            flash(f'Quantidade insuficiente em estoque no almoxarifado {warehouse.code}.', 'danger')
             return render_template('allocate_product.html', form=form, selected_product=selected_product)
         
+        work = open_work(form.work_number.data)
         allocation = Allocation(
             product_id=product.id,
             user_id=current_user.id,
-            work_number=form.work_number.data,
+            work=work,
+            work_number=work.number,
             quantity=form.quantity.data,
             notes=form.notes.data,
             status='approved',  # Direct allocation for warehouse staff
             approved_by_id=current_user.id,
-            approved_at=brazil_now()
+            approved_at=utcnow(),
+            warehouse_id=warehouse.id
         )
         
         db.session.add(allocation)
+        key.allocation = allocation
         
         # Update stock
         log_stock_movement(
@@ -526,7 +895,9 @@ def allocate_product():
             current_user, 
             'allocation', 
             form.quantity.data, 
-            f'Alocado para obra {form.work_number.data}'
+            f'Alocado para obra {form.work_number.data}',
+            warehouse=warehouse,
+            allocation=allocation
         )
         
         db.session.commit()
@@ -550,40 +921,37 @@ def request_product():
     product_id = request.args.get('product_id', type=int)
     selected_product = None
     if product_id:
-        product = Product.query.get(product_id)
-        if product:
-            form.product_search.data = f"{product.code} - {product.name}"
-            form.product_id.data = str(product.id)
-            # Convert to dictionary for JSON serialization
-            selected_product = {
-                'id': product.id,
-                'code': product.code,
-                'name': product.name,
-                'supplier_reference': product.supplier_reference,
-                'supplier_name': product.supplier_name,
-                'location': product.location,
-                'quantity': product.quantity,
-                'unit': product.unit,
-                'photo_filename': product.photo_filename
-            }
+        selected_product = product_dict(product_id, REQUEST_PRODUCT_FIELDS)
+        if selected_product:
+            form.product_search.data = f"{selected_product['code']} - {selected_product['name']}"
+            form.product_id.data = str(selected_product['id'])
     
     if form.validate_on_submit():
-        product = Product.query.get_or_404(form.product_id.data)
+        product = Product.active_or_404(form.product_id.data)
+        warehouse = resolve_warehouse(form.warehouse_id.data)
         
-        if product.quantity < form.quantity.data:
-            flash('Quantidade insuficiente em estoque. Sua solicitação será enviada mesmo assim.', 'warning')
+        key, replay = claim_key(current_user.id, form.idempotency_key.data or new_key())
+        if replay:
+            flash('Esta solicitação já foi enviada.', 'info')
+            return redirect(url_for('my_requests'))
         
         # Create pending allocation request
+        work = open_work(form.work_number.data)
         allocation = Allocation(
             product_id=product.id,
             user_id=current_user.id,
-            work_number=form.work_number.data,
+            work=work,
+            work_number=work.number,
             quantity=form.quantity.data,
             notes=form.notes.data,
-            status='pending'  # Pending approval
+            status='pending',  # Pending approval
+            warehouse_id=warehouse.id
         )
         
         db.session.add(allocation)
+        key.allocation = allocation
+        if place_hold(allocation, product, warehouse) is None:
+            flash('Quantidade insuficiente em estoque. Sua solicitação será enviada mesmo assim, sem reserva.', 'warning')
         db.session.commit()
         
         flash('Solicitação enviada com sucesso! Aguarde aprovação do almoxarifado.', 'success')
@@ -594,21 +962,23 @@ def request_product():
 # Inventory route
 @app.route('/inventory')
 @login_required
+@conditional_page
 def inventory():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '', type=str)
     
-    query = Product.query
-    if search:
-        query = query.filter(
-            Product.name.contains(search) | 
-            Product.code.contains(search) |
-            Product.supplier_reference.contains(search)
+    def load_page():
+        query = db.session.query(*[getattr(Product, column) for column in ProductRow._fields]).filter(
+            Product.deleted_at.is_(None)
         )
+        if search:
+            query = _product_search_filter(query, search)
+        result = query.order_by(Product.id).paginate(page=page, per_page=20, error_out=False)
+        return {'items': [ProductRow(*row) for row in result.items], 'total': result.total}
     
-    products = query.paginate(
-        page=page, per_page=20, error_out=False
-    )
+    data = cache.get_or_set('inventory', {'search': search, 'page': page}, load_page,
+                            tags=lambda data: _product_tags(row.id for row in data['items']))
+    products = CachedPagination(page=page, per_page=20, error_out=False, **data)
     
     # Create form for CSRF token
     form = AllocationForm()
@@ -634,6 +1004,58 @@ def allocation_history():
     
     return render_template('allocation_history.html', allocations=allocations)
 
+@app.route('/pick_list')
+@login_required
+def pick_list():
+    if current_user.role != 'almoxarifado':
+        flash('Acesso negado.', 'danger')
+        return redirect(url_for('index'))
+
+    try:
+        params = pick_list_args(request.args)
+    except ValueError:
+        flash('Parâmetros da lista de separação inválidos.', 'danger')
+        return redirect(url_for('allocation_history'))
+
+    groups = build_pick_list(**params)
+    return render_template('pick_list.html', groups=groups, params=params, generated_at=utcnow())
+
+# Column headers of the consumption report
+CONSUMPTION_KEY_LABELS = {
+    'month': 'Mês',
+    'product_code': 'Produto',
+    'work_number': 'Obra',
+    'warehouse_id': 'Almoxarifado',
+}
+
+@app.route('/reports/consumption')
+@login_required
+def consumption_report():
+    if current_user.role != 'almoxarifado':
+        flash('Acesso negado.', 'danger')
+        return redirect(url_for('index'))
+
+    import analytics
+
+    keys = [key for key in request.args.get('by', 'month,product_code').split(',') if key in analytics.CONSUMPTION_KEYS]
+    start = request.args.get('from', '').strip() or None
+    end = request.args.get('to', '').strip() or None
+    try:
+        exported_at = analytics.last_export_time()
+        # Export files only change when an export runs, so its time is part of the key
+        rows = cache.get_or_set(
+            'consumption_report',
+            {'by': keys, 'from': start, 'to': end, 'export': exported_at.isoformat() if exported_at else None},
+            lambda: analytics.consumption(tuple(keys or ['month']), start, end)
+        )
+    except RuntimeError as e:
+        flash(str(e), 'warning')
+        exported_at, rows = None, []
+
+    return render_template('consumption_report.html', rows=rows, keys=keys or ['month'],
+                           start=start, end=end, exported_at=exported_at,
+                           key_labels=CONSUMPTION_KEY_LABELS)
+
 # Production user routes
 @app.route('/my_requests')
 @login_required
@@ -651,6 +1073,59 @@ def my_requests():
     
     return render_template('my_requests.html', allocations=allocations)
 
+# Notification routes
+NOTIFICATIONS_SHOWN = 50
+
+@app.route('/notifications')
+@login_required
+def notifications_page():
+    notifications = Notification.query.filter_by(user_id=current_user.id).order_by(
+        Notification.id.desc()
+    ).limit(NOTIFICATIONS_SHOWN).all()
+    subscriptions = NotificationSubscription.query.filter_by(user_id=current_user.id).order_by(
+        NotificationSubscription.kind, NotificationSubscription.target
+    ).all()
+    
+    # Low stock subscriptions store the product id
+    product_ids = [int(s.target) for s in subscriptions if s.kind == 'low_stock']
+    products = {}
+    if product_ids:
+        products = {product_id: f'{code} - {name}' for product_id, code, name in db.session.query(
+            Product.id, Product.code, Product.name
+        ).filter(Product.id.in_(product_ids))}
+    
+    return render_template('notifications.html', notifications=notifications, subscriptions=subscriptions,
+                           products=products, kinds=SUBSCRIPTION_KINDS, form=SubscriptionForm())
+
+@app.route('/notifications/read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    mark_all_read(current_user)
+    db.session.commit()
+    return redirect(url_for('notifications_page'))
+
+@app.route('/notifications/subscriptions', methods=['POST'])
+@login_required
+def add_subscription():
+    form = SubscriptionForm()
+    if form.validate_on_submit():
+        subscription = subscribe(current_user.id, form.kind.data, form.target.data, email=form.email.data)
+        subscription.email = form.email.data
+        db.session.commit()
+        flash('Acompanhamento salvo.', 'success')
+    else:
+        for errors in form.errors.values():
+            flash(errors[0], 'danger')
+    return redirect(url_for('notifications_page'))
+
+@app.route('/notifications/subscriptions/<int:subscription_id>/delete', methods=['POST'])
+@login_required
+def delete_subscription(subscription_id):
+    NotificationSubscription.query.filter_by(id=subscription_id, user_id=current_user.id).delete()
+    db.session.commit()
+    flash('Acompanhamento removido.', 'success')
+    return redirect(url_for('notifications_page'))
+
 # Approval workflow routes for warehouse staff
 @app.route('/pending_requests')
 @login_required
@@ -660,7 +1135,9 @@ def pending_requests():
         return redirect(url_for('index'))
     
     page = request.args.get('page', 1, type=int)
-    pending_allocations = Allocation.query.filter_by(status='pending').order_by(
+    pending_allocations = Allocation.query.filter_by(status='pending').options(
+        db.joinedload(Allocation.hold)
+    ).order_by(
         Allocation.allocated_at.desc()
     ).paginate(
         page=page, per_page=20, error_out=False
@@ -675,78 +1152,176 @@ def approve_request(allocation_id):
         flash('Acesso negado.', 'danger')
         return redirect(url_for('index'))
     
-    allocation = Allocation.query.get_or_404(allocation_id)
+    # Everything the page shows, in one query
+    allocation = Allocation.query.options(
+        db.joinedload(Allocation.product), db.joinedload(Allocation.user), db.joinedload(Allocation.hold)
+    ).filter_by(id=allocation_id).first_or_404()
     
     if allocation.status != 'pending':
         flash('Esta solicitação já foi processada.', 'warning')
         return redirect(url_for('pending_requests'))
     
     form = ApprovalForm()
+    recent_requests = Allocation.query.options(db.joinedload(Allocation.product)).filter(
+        Allocation.user_id == allocation.user_id, Allocation.id != allocation.id
+    ).order_by(Allocation.id.desc()).limit(4).all()
     
     if form.validate_on_submit():
+        # Lock the request so two people cannot process it at the same time
+        allocation = Allocation.query.filter_by(id=allocation_id).with_for_update().populate_existing().one()
+        if allocation.status != 'pending':
+            db.session.rollback()
+            flash('Esta solicitação já foi processada.', 'warning')
+            return redirect(url_for('pending_requests'))
+        
         allocation.status = form.action.data
         allocation.approved_by_id = current_user.id
-        allocation.approved_at = brazil_now()
+        allocation.approved_at = utcnow()
         allocation.approval_notes = form.approval_notes.data
         
         if form.action.data == 'approved':
-            # Check if there's enough stock
-            if allocation.product.quantity < allocation.quantity:
+            # Requests without a hold (not enough stock when submitted, or
+            # expired) must reserve now, against stock nobody else holds
+            warehouse = allocation.warehouse or default_warehouse()
+            hold = allocation.hold or place_hold(allocation, allocation.product, warehouse)
+            if hold is not None and not release_hold(hold):
+                # The hold expired after the request was loaded and its stock
+                # went back to the shelf; reserve again against what is free now
+                db.session.expunge(hold)
+                hold = place_hold(allocation, allocation.product, warehouse)
+                if hold is not None:
+                    release_hold(hold)
+            if hold is None:
+                db.session.rollback()
                 flash('Quantidade insuficiente em estoque para aprovação.', 'danger')
-                return render_template('approve_request.html', allocation=allocation, form=form)
+                return render_template('approve_request.html', allocation=allocation, form=form,
+                                       recent_requests=recent_requests)
             
             # Update stock
+            allocation.warehouse_id = warehouse.id
             log_stock_movement(
                 allocation.product, 
                 current_user, 
                 'allocation', 
                 allocation.quantity, 
-                f'Solicitação aprovada - Obra {allocation.work_number}'
+                f'Solicitação aprovada - Obra {allocation.work_number}',
+                warehouse=warehouse,
+                allocation=allocation
             )
             
             flash(f'Solicitação aprovada com sucesso!', 'success')
         else:
+            if allocation.hold:
+                release_hold(allocation.hold)
             flash(f'Solicitação rejeitada.', 'info')
         
         db.session.commit()
         return redirect(url_for('pending_requests'))
     
-    return render_template('approve_request.html', allocation=allocation, form=form)
+    return render_template('approve_request.html', allocation=allocation, form=form,
+                           recent_requests=recent_requests)
 
 # API routes for autocomplete
 @app.route('/api/products/search')
 @login_required
+@conditional_catalog_json
 def search_products():
     query = request.args.get('q', '')
+    warehouse_id = request.args.get('warehouse', 0, type=int)
+    try:
+        fields = requested_fields(SEARCH_RESULT_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    compact = compact_requested()
     if len(query) < 2:
-        return jsonify([])
-    
-    products = Product.query.filter(
-        Product.name.contains(query) | 
-        Product.code.contains(query) |
-        Product.supplier_reference.contains(query)
-    ).limit(10).all()
-    
-    result = []
-    for product in products:
-        result.append({
-            'id': product.id,
-            'code': product.code,
-            'name': product.name,
-            'supplier_reference': product.supplier_reference,
-            'location': product.location,
-            'quantity': product.quantity,
-            'unit': product.unit,
-            'supplier_name': product.supplier_name,
-            'photo_filename': product.photo_filename
-        })
-    
+        return jsonify(shape_rows(fields, [], compact))
+    
+    def load_results():
+        # The in-memory index finds the matches; only those rows are read
+        candidates = product_index.search(query, limit=None if warehouse_id else SEARCH_LIMIT)
+        if warehouse_id and candidates:
+            # Only products stocked at the chosen warehouse
+            stocked = {product_id for (product_id,) in db.session.query(StockLevel.product_id).filter(
+                StockLevel.warehouse_id == warehouse_id, StockLevel.quantity > 0,
+                StockLevel.product_id.in_(candidates)
+            )}
+            candidates = [product_id for product_id in candidates if product_id in stocked]
+        candidates = candidates[:SEARCH_LIMIT]
+        columns = [field for field in SEARCH_RESULT_FIELDS if field != 'sites']
+        stock = site_quantities(candidates)
+        
+        result = []
+        for row in product_rows(columns, ids=candidates):
+            item = dict(zip(columns, row))
+            sites = stock.get(item['id'], {})
+            if warehouse_id:
+                item['quantity'] = sites.get(warehouse_id, 0)
+            item['sites'] = [{'warehouse_id': site, 'quantity': quantity} for site, quantity in sorted(sites.items())]
+            result.append(tuple(item[field] for field in SEARCH_RESULT_FIELDS))
+        return result
+    
+    # Rows are cached with every field and cut down to the requested ones
+    rows = cache.get_or_set('search_products', {'q': query, 'warehouse': warehouse_id}, load_results,
+                            tags=lambda rows: _product_tags(row[0] for row in rows) + (['stock'] if warehouse_id else []))
+    return jsonify(shape_rows(fields, project(rows, SEARCH_RESULT_FIELDS, fields), compact))
+
+@app.route('/api/cache/stats')
+@login_required
+def cache_stats():
+    if current_user.role != 'almoxarifado':
+        return jsonify({'error': 'Acesso negado.'}), 403
+    return jsonify(dict(cache.metrics(), search_index={'products': product_index.size()}))
+
+# Live updates (Server-Sent Events)
+@app.route('/events/stream')
+@login_required
+def event_stream():
+    if broker.live_mode() != 'stream':
+        # Pages loaded before a switch to polling: 204 stops EventSource reconnecting
+        return Response(status=204)
+    subscription = broker.subscribe(role=current_user.role, user_id=current_user.id)
+    
+    # Release the database connection before the long-lived stream starts
+    db.session.remove()
+    
+    return Response(subscription.stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/events/poll')
+@login_required
+def event_poll():
+    """Counters and stock changes since a change token, for pages that poll instead of streaming"""
+    since = request.args.get('since', type=int)
+    # Held back past transactions still in flight (see sync_tokens), so
+    # recent changes are reported again on the next poll
+    token = settled_token(db.session.connection())
+    result = {'token': token, 'unread': current_user.unread_notifications}
+    if current_user.role == 'almoxarifado':
+        result['pending'] = Allocation.query.filter_by(status='pending').count()
+    else:
+        result['decided'] = Allocation.query.filter(
+            Allocation.user_id == current_user.id, Allocation.status != 'pending'
+        ).count()
+    
+    stock = []
+    if since is not None:
+        changed = db.session.query(ChangeLogEntry.entity_id).filter(
+            ChangeLogEntry.id > since, ChangeLogEntry.entity == 'product'
+        ).distinct().limit(LIVE_POLL_MAX_PRODUCTS)
+        stock = [{'id': product_id, 'code': code, 'quantity': quantity}
+                 for product_id, code, quantity in product_rows(('id', 'code', 'quantity'), ids=[row[0] for row in changed])]
+    result['stock'] = stock
     return jsonify(result)
 
 # Static file serving
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # Upload names are unique, so a file never changes once stored
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=app.config['UPLOAD_MAX_AGE'])
+    response.cache_control.immutable = True
+    return response
 
 # Error handlers
 @app.errorhandler(404)
@@ -757,24 +1332,3 @@ def not_found_error(error):
 def internal_error(error):
     db.session.rollback()
     return render_template('errors/500.html'), 500
-
-# Create default admin user
-with app.app_context():
-    admin = User.query.filter_by(username='admin').first()
-    if not admin:
-        admin = User(
-            username='admin',
-            email='admin@empresa.com',
-            role='almoxarifado',
-            is_admin=True
-        )
-        admin.set_password('admin123')
-        db.session.add(admin)
-        
-        # No need to create default supplier - using text field
-        db.session.commit()
-        
-        print("Admin user created: admin/admin123")
-
-
-
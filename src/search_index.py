@@ -0,0 +1,186 @@
+import re
+import time
+import heapq
+import bisect
+import threading
+import unicodedata
+from datetime import timedelta
+from sqlalchemy import func
+from app import db
+from cache import SEARCH_FIELDS
+from changes import on_commit
+from models import Product
+
+# Seconds between checks for products changed by other processes; this
+# process's own commits are seen on its next search
+CHECK_SECONDS = 5
+
+# Products updated this long before the last sync are read again, so a
+# transaction that committed late is not missed
+SYNC_OVERLAP = timedelta(seconds=60)
+
+# Answers kept per index version; broad prefixes such as 'pa' are typed by
+# everyone and cost the most to collect
+RESULT_MEMO_SIZE = 1024
+
+_WORD = re.compile(r'\w+')
+_PART = re.compile(r'[^\W\d_]+|\d+')
+
+
+def normalize(text):
+    """Lowercase without accents, so 'Válvula' matches 'valv'"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def query_terms(query):
+    return _WORD.findall(normalize(query))
+
+
+def product_terms(code, name, supplier_reference):
+    """Words of the searchable fields, plus the letter and digit runs inside them
+
+    'ABC-123' yields 'abc' and '123', and 'ABC123' yields 'abc123', 'abc'
+    and '123', so codes match on any of their parts.
+    """
+    terms = set()
+    for text in (code, name, supplier_reference):
+        for word in _WORD.findall(normalize(text)):
+            terms.add(word)
+            terms.update(_PART.findall(word))
+    return tuple(sorted(terms))
+
+
+class ProductSearchIndex:
+    """Sorted (term, product id) list of this worker's catalog for prefix search
+
+    Built on first use and kept in sync from product updated_at; a search
+    only touches memory, bisecting the list for the terms that start with
+    the query.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._terms = {}
+        self._codes = {}
+        self._results = {}
+        self._synced_at = None
+        self._checked = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def search(self, query, limit=10):
+        """Ids of the products matching every word of the query, best first"""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        self.refresh()
+        memo_key = (query.strip().casefold(), limit)
+        results = self._results
+        if memo_key in results:
+            return results[memo_key]
+
+        # Scan the longest term's range, which is usually the narrowest
+        terms.sort(key=len, reverse=True)
+        first, others = terms[0], terms[1:]
+        entries = self._entries
+        start = bisect.bisect_left(entries, (first,))
+        matches = set()
+        for index in range(start, len(entries)):
+            term, product_id = entries[index]
+            if not term.startswith(first):
+                break
+            matches.add(product_id)
+
+        if others:
+            matches = {
+                product_id for product_id in matches
+                if all(any(term.startswith(other) for term in self._terms.get(product_id, ())) for other in others)
+            }
+
+        # Codes starting with the query first, then by code
+        prefix = normalize(query.strip())
+        codes = self._codes
+        key = lambda product_id: (not codes.get(product_id, '').startswith(prefix), codes.get(product_id, ''))
+        ranked = heapq.nsmallest(limit, matches, key=key) if limit else sorted(matches, key=key)
+        if len(results) >= RESULT_MEMO_SIZE:
+            results.clear()
+        results[memo_key] = ranked
+        return ranked
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not (force or self._stale or now - self._checked >= CHECK_SECONDS):
+            return
+        with self._lock:
+            if not (force or self._stale or now - self._checked >= CHECK_SECONDS):
+                return
+            # Cleared first: a commit landing while this runs marks it again
+            self._stale = False
+            self._checked = now
+            try:
+                last_update, count = db.session.query(
+                    func.max(Product.updated_at), func.count(Product.id).filter(Product.deleted_at.is_(None))
+                ).one()
+                if force or self._synced_at is None or count != len(self._terms):
+                    self._rebuild()
+                elif last_update and last_update > self._synced_at:
+                    self._sync(self._synced_at - SYNC_OVERLAP)
+            except Exception:
+                self._stale = True
+                raise
+            self._synced_at = last_update or self._synced_at
+
+    def _rebuild(self):
+        rows = db.session.query(Product.id, Product.code, Product.name, Product.supplier_reference).filter(
+            Product.deleted_at.is_(None)
+        ).all()
+        terms = {}
+        codes = {}
+        entries = []
+        for product_id, code, name, supplier_reference in rows:
+            terms[product_id] = product_terms(code, name, supplier_reference)
+            codes[product_id] = normalize(code)
+            entries.extend((term, product_id) for term in terms[product_id])
+        entries.sort()
+        # Swapped in whole, so concurrent searches see either version
+        self._entries, self._terms, self._codes, self._results = entries, terms, codes, {}
+
+    def _sync(self, since):
+        rows = db.session.query(
+            Product.id, Product.code, Product.name, Product.supplier_reference, Product.deleted_at
+        ).filter(Product.updated_at >= since).all()
+        entries = list(self._entries)
+        terms = dict(self._terms)
+        codes = dict(self._codes)
+        for product_id, code, name, supplier_reference, deleted_at in rows:
+            # Archived products leave the index
+            new_terms = product_terms(code, name, supplier_reference) if deleted_at is None else ()
+            if deleted_at is None and terms.get(product_id) == new_terms:
+                codes[product_id] = normalize(code)
+                continue
+            for term in terms.get(product_id, ()):
+                index = bisect.bisect_left(entries, (term, product_id))
+                if index < len(entries) and entries[index] == (term, product_id):
+                    del entries[index]
+            for term in new_terms:
+                bisect.insort(entries, (term, product_id))
+            if deleted_at is None:
+                terms[product_id] = new_terms
+                codes[product_id] = normalize(code)
+            else:
+                terms.pop(product_id, None)
+                codes.pop(product_id, None)
+        self._entries, self._terms, self._codes, self._results = entries, terms, codes, {}
+
+    def _invalidate_changes(self, changes):
+        if any(change.model == 'Product' and (change.op != 'update' or change.changed & SEARCH_FIELDS)
+               for change in changes):
+            self._stale = True
+
+    def size(self):
+        return len(self._terms)
+
+
+product_index = ProductSearchIndex()
+on_commit(product_index._invalidate_changes)
@@ -0,0 +1,142 @@
+import functools
+from flask import request
+from flask.json.provider import DefaultJSONProvider, _default
+from sqlalchemy import case
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Product fields served by the JSON endpoints, see product_rows()
+PRODUCT_FIELDS = (
+    'id', 'code', 'name', 'supplier_reference', 'location', 'quantity', 'available', 'unit',
+    'supplier_name', 'photo_filename', 'updated_at'
+)
+
+
+@functools.cache
+def _product_columns():
+    # Imported here: the app installs the JSON provider before models exist
+    from models import Product
+    columns = {name: getattr(Product, name) for name in PRODUCT_FIELDS if name != 'available'}
+    # Stock not held by pending requests, as Product.available_quantity
+    columns['available'] = case(
+        (Product.quantity > Product.reserved_quantity, Product.quantity - Product.reserved_quantity), else_=0
+    )
+    return columns
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider encoding with orjson when it is installed
+
+    Every ``jsonify`` call and the ``tojson`` filter go through it. Values
+    orjson does not handle natively (dates, Decimal) are converted exactly
+    as Flask does and keys are sorted as Flask sorts them, so the output
+    only differs in whitespace and in non-ASCII text being left unescaped.
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = self._orjson_option(kwargs)
+        if option is None:
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, default=_default, option=option).decode()
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits; the stdlib encoder decides
+            return super().dumps(obj, **kwargs)
+
+    def _orjson_option(self, kwargs):
+        """orjson options matching the stdlib arguments, None when one has no equivalent
+
+        ``jsonify`` always passes ``separators`` (compact) or ``indent=2``
+        (debug); a custom encoder class or ``default`` keeps the stdlib.
+        """
+        if orjson is None:
+            return None
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        for name, value in kwargs.items():
+            if name == 'indent':
+                if value == 2:
+                    option |= orjson.OPT_INDENT_2
+                elif value is not None:
+                    return None
+            elif name == 'separators':
+                # orjson output is compact, or indented by OPT_INDENT_2
+                if value is not None and tuple(part.strip() for part in value) != (',', ':'):
+                    return None
+            elif name == 'sort_keys':
+                pass
+            elif name != 'ensure_ascii':
+                return None
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def requested_fields(allowed, default=None):
+    """Fields named by ``?fields=a,b``, in the given order; all allowed ones by default
+
+    Raises ValueError for unknown names, for the endpoint to answer 400.
+    """
+    value = request.args.get('fields', '')
+    if not value:
+        return tuple(default or allowed)
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown or not fields:
+        raise ValueError(f"campos inválidos: {', '.join(unknown)}")
+    return fields
+
+
+def compact_requested():
+    return request.args.get('format') == 'compact'
+
+
+def shape_rows(fields, rows, compact=False):
+    """Rows (sequences in ``fields`` order) as a list of objects, or as
+    {'fields', 'rows'} arrays with ``compact``, which skips repeating the keys
+    """
+    if compact:
+        return {'fields': list(fields), 'rows': [list(row) for row in rows]}
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def project(rows, fields, wanted):
+    """Keep only the ``wanted`` columns of rows laid out in ``fields`` order"""
+    if tuple(wanted) == tuple(fields):
+        return rows
+    indexes = [fields.index(name) for name in wanted]
+    return [tuple(row[index] for index in indexes) for row in rows]
+
+
+def product_rows(fields, ids=None, query=None):
+    """Plain row tuples of the given product fields, without loading ORM instances
+
+    With ``ids`` the rows come back in the order of the ids, archived
+    products left out; otherwise ``query`` (a select filtered and ordered by
+    the caller) is used as is.
+    """
+    from app import db
+    from models import Product
+
+    columns = [_product_columns()[name].label(name) for name in fields]
+    if ids is not None:
+        if not ids:
+            return []
+        rows = db.session.query(*columns, Product.id.label('_id')).filter(
+            Product.id.in_(ids), Product.deleted_at.is_(None)
+        ).all()
+        by_id = {row[-1]: tuple(row[:-1]) for row in rows}
+        return [by_id[product_id] for product_id in ids if product_id in by_id]
+    return [tuple(row) for row in query.with_entities(*columns).all()]
+
+
+def product_dict(product_id, fields):
+    rows = product_rows(fields, ids=[product_id])
+    return dict(zip(fields, rows[0])) if rows else None
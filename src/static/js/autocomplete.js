@@ -3,6 +3,99 @@
  * Sistema de Controle de Estoque
  */
 
+/**
+ * Search client shared by every product search box on the page.
+ * A result list shorter than the server limit holds every match of its
+ * query, so longer queries starting with it are answered by filtering that
+ * list locally instead of asking the server again.
+ */
+class ProductSearchClient {
+    constructor(options = {}) {
+        this.options = {
+            apiEndpoint: '/api/products/search',
+            limit: 10,        // SEARCH_LIMIT in routes.py
+            maxAge: 10000,    // SEARCH_MAX_AGE, in milliseconds
+            ...options
+        };
+        this.entries = new Map();
+    }
+    
+    static normalize(text) {
+        return (text || '').normalize('NFKD').replace(/[\u0300-\u036f]/g, '').toLowerCase();
+    }
+    
+    // Same words as search_index.product_terms
+    static terms(product) {
+        const terms = [];
+        [product.code, product.name, product.supplier_reference].forEach(text => {
+            (ProductSearchClient.normalize(text).match(/[\p{L}\p{N}_]+/gu) || []).forEach(word => {
+                terms.push(word);
+                terms.push(...(word.match(/[\p{L}]+|[\p{N}]+/gu) || []));
+            });
+        });
+        return terms;
+    }
+    
+    static matches(product, query) {
+        const words = ProductSearchClient.normalize(query).match(/[\p{L}\p{N}_]+/gu) || [];
+        const terms = ProductSearchClient.terms(product);
+        return words.every(word => terms.some(term => term.startsWith(word)));
+    }
+    
+    key(query, params) {
+        return JSON.stringify([ProductSearchClient.normalize(query.trim()), params]);
+    }
+    
+    // Results available without a request, or null
+    cached(query, params = {}) {
+        const now = Date.now();
+        const exact = this.entries.get(this.key(query, params));
+        if (exact && now - exact.time < this.options.maxAge) {
+            return exact.products;
+        }
+        const paramsKey = JSON.stringify(params);
+        const normalized = ProductSearchClient.normalize(query.trim());
+        for (const entry of this.entries.values()) {
+            if (entry.paramsKey === paramsKey && now - entry.time < this.options.maxAge &&
+                entry.products.length < this.options.limit && normalized.startsWith(entry.query)) {
+                return entry.products.filter(product => ProductSearchClient.matches(product, query));
+            }
+        }
+        return null;
+    }
+    
+    async search(query, params = {}) {
+        const local = this.cached(query, params);
+        if (local) {
+            return local;
+        }
+        const url = new URL(this.options.apiEndpoint, window.location.origin);
+        url.searchParams.set('q', query);
+        Object.entries(params).forEach(([name, value]) => url.searchParams.set(name, value));
+        
+        const response = await fetch(url);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const products = await response.json();
+        const now = Date.now();
+        for (const [key, entry] of this.entries) {
+            if (now - entry.time >= this.options.maxAge) {
+                this.entries.delete(key);
+            }
+        }
+        this.entries.set(this.key(query, params), {
+            query: ProductSearchClient.normalize(query.trim()),
+            paramsKey: JSON.stringify(params),
+            products,
+            time: now
+        });
+        return products;
+    }
+}
+
+window.productSearch = new ProductSearchClient();
+
 class ProductAutocomplete {
     constructor(inputElement, resultsContainer, options = {}) {
         this.input = inputElement;
@@ -15,6 +108,9 @@ class ProductAutocomplete {
             ...options
         };
         
+        this.client = this.options.apiEndpoint === window.productSearch.options.apiEndpoint
+            ? window.productSearch
+            : new ProductSearchClient({ apiEndpoint: this.options.apiEndpoint });
         this.searchTimeout = null;
         this.selectedIndex = -1;
         this.currentResults = [];
@@ -46,6 +142,13 @@ class ProductAutocomplete {
             return;
         }
         
+        // Answered from earlier results: no need to wait for the user to pause
+        const local = this.client.cached(query);
+        if (local) {
+            this.showProducts(local);
+            return;
+        }
+        
         this.searchTimeout = setTimeout(() => {
             this.search(query);
         }, this.options.delay);
@@ -85,21 +188,18 @@ class ProductAutocomplete {
     
     async search(query) {
         try {
-            const response = await fetch(`${this.options.apiEndpoint}?q=${encodeURIComponent(query)}`);
-            
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            
-            const products = await response.json();
-            this.currentResults = products.slice(0, this.options.maxResults);
-            this.displayResults(this.currentResults);
+            this.showProducts(await this.client.search(query));
         } catch (error) {
             console.error('Search error:', error);
             this.displayError('Erro ao buscar produtos. Tente novamente.');
         }
     }
     
+    showProducts(products) {
+        this.currentResults = products.slice(0, this.options.maxResults);
+        this.displayResults(this.currentResults);
+    }
+    
     displayResults(products) {
         if (products.length === 0) {
             this.displayEmpty();
@@ -0,0 +1,98 @@
+/**
+ * Inventory smart search: picking a product filters the table to its row
+ */
+
+document.addEventListener('DOMContentLoaded', function() {
+    const smartSearchInput = document.getElementById('smartSearchInput');
+    if (!smartSearchInput) {
+        return;
+    }
+
+    const autocompleteResults = smartSearchInput.nextElementSibling;
+
+    // Initialize autocomplete
+    const autocomplete = new ProductAutocomplete(smartSearchInput, autocompleteResults, {
+        minLength: 2,
+        delay: 300,
+        maxResults: 10
+    });
+
+    // Handle product selection
+    smartSearchInput.addEventListener('productSelected', function(e) {
+        const product = e.detail.product;
+
+        // Filter table to show only selected product
+        const productRows = document.querySelectorAll('tbody tr');
+        productRows.forEach(row => {
+            const productCode = row.querySelector('td:nth-child(2) strong').textContent;
+            if (productCode === product.code) {
+                row.style.display = '';
+                row.scrollIntoView({ behavior: 'smooth', block: 'center' });
+                row.style.backgroundColor = 'var(--bs-primary-bg-subtle)';
+                setTimeout(() => {
+                    row.style.backgroundColor = '';
+                }, 3000);
+            } else {
+                row.style.display = 'none';
+            }
+        });
+
+        // Update search input with product info
+        smartSearchInput.value = `${product.code} - ${product.name}`;
+        
+        // Show clear filter button
+        showClearFilterButton();
+    });
+
+    // Clear highlighting when search is cleared
+    smartSearchInput.addEventListener('productCleared', function() {
+        const productRows = document.querySelectorAll('tbody tr');
+        productRows.forEach(row => {
+            row.style.backgroundColor = '';
+            row.style.display = '';
+        });
+        hideClearFilterButton();
+    });
+
+    // Function to show clear filter button
+    function showClearFilterButton() {
+        let clearBtn = document.getElementById('clearFilterBtn');
+        if (!clearBtn) {
+            clearBtn = document.createElement('button');
+            clearBtn.id = 'clearFilterBtn';
+            clearBtn.type = 'button';
+            clearBtn.className = 'btn btn-outline-warning ms-2';
+            clearBtn.innerHTML = '<i class="fas fa-filter"></i> Mostrar Todos';
+            clearBtn.title = 'Mostrar todos os produtos';
+            clearBtn.onclick = clearProductFilter;
+            
+            const searchForm = smartSearchInput.closest('form');
+            searchForm.appendChild(clearBtn);
+        }
+        clearBtn.style.display = 'inline-block';
+    }
+
+    // Function to hide clear filter button
+    function hideClearFilterButton() {
+        const clearBtn = document.getElementById('clearFilterBtn');
+        if (clearBtn) {
+            clearBtn.style.display = 'none';
+        }
+    }
+
+    // Function to clear product filter
+    function clearProductFilter() {
+        const productRows = document.querySelectorAll('tbody tr');
+        productRows.forEach(row => {
+            row.style.display = '';
+            row.style.backgroundColor = '';
+        });
+        
+        smartSearchInput.value = '';
+        hideClearFilterButton();
+        smartSearchInput.focus();
+    }
+
+    // Focus search input on page load
+    smartSearchInput.focus();
+});
@@ -0,0 +1,154 @@
+/**
+ * Live updates via Server-Sent Events, or polling where the server does not stream
+ * Pushes new production requests, approvals, stock changes and notifications to open pages
+ *
+ * body[data-live-updates] is "stream" (EventSource on data-live-url) or "poll"
+ * (data-live-url every data-live-interval seconds).
+ */
+
+class LiveUpdates {
+    constructor(url) {
+        this.url = url;
+        this.source = null;
+        this.toastContainer = null;
+        this.last = null;
+    }
+
+    connect() {
+        if (!window.EventSource) {
+            return;
+        }
+
+        this.source = new EventSource(this.url);
+        this.source.addEventListener('request.created', (e) => this.onRequestCreated(JSON.parse(e.data)));
+        this.source.addEventListener('request.updated', (e) => this.onRequestUpdated(JSON.parse(e.data)));
+        this.source.addEventListener('stock.changed', (e) => this.onStockChanged(JSON.parse(e.data)));
+        this.source.addEventListener('notification.created', (e) => this.onNotificationCreated(JSON.parse(e.data)));
+    }
+
+    poll(seconds) {
+        const tick = () => {
+            if (document.hidden) {
+                return;
+            }
+            const since = this.last ? `?since=${this.last.token}` : '';
+            fetch(this.url + since)
+                .then(response => response.ok ? response.json() : null)
+                .then(state => state && this.onPoll(state))
+                .catch(error => console.error('Erro ao buscar atualizações:', error));
+        };
+        tick();
+        setInterval(tick, seconds * 1000);
+        document.addEventListener('visibilitychange', tick);
+    }
+
+    onPoll(state) {
+        const last = this.last;
+        this.last = state;
+        if (!last) {
+            return;
+        }
+        state.stock.forEach(product => this.onStockChanged(product));
+        if (state.pending !== undefined && state.pending !== last.pending) {
+            this.adjustPendingCount(state.pending - last.pending);
+            if (state.pending > last.pending) {
+                this.showToast('Novas solicitações de produção', 'warning');
+            }
+            this.showRefreshBanner('pending');
+        }
+        if (state.decided !== undefined && state.decided > last.decided) {
+            this.showToast('Suas solicitações foram atualizadas', 'info');
+            this.showRefreshBanner('requests');
+        }
+        if (state.unread > last.unread) {
+            document.querySelectorAll('[data-live="notification-count"]').forEach(element => {
+                element.textContent = state.unread;
+                element.classList.remove('d-none');
+            });
+            this.showToast('Você tem novas notificações', 'info');
+            this.showRefreshBanner('notifications');
+        }
+    }
+
+    onRequestCreated(request) {
+        this.adjustPendingCount(1);
+        this.showToast(`Nova solicitação para a obra ${request.work_number}`, 'warning');
+        this.showRefreshBanner('pending');
+    }
+
+    onRequestUpdated(request) {
+        if (request.status !== 'pending') {
+            this.adjustPendingCount(-1);
+        }
+
+        if (document.body.dataset.userRole === 'producao') {
+            const label = request.status === 'approved' ? 'aprovada' : 'rejeitada';
+            const category = request.status === 'approved' ? 'success' : 'danger';
+            this.showToast(`Sua solicitação para a obra ${request.work_number} foi ${label}`, category);
+            this.showRefreshBanner('requests');
+        } else {
+            this.showRefreshBanner('pending');
+        }
+    }
+
+    onStockChanged(product) {
+        document.querySelectorAll(`[data-stock-product="${product.id}"]`).forEach(element => {
+            element.textContent = `${product.quantity} ${element.dataset.unit || ''}`.trim();
+        });
+    }
+
+    onNotificationCreated(notification) {
+        document.querySelectorAll('[data-live="notification-count"]').forEach(element => {
+            element.textContent = (parseInt(element.textContent, 10) || 0) + 1;
+            element.classList.remove('d-none');
+        });
+        this.showToast(`Notificações: ${notification.title}`, 'info');
+        this.showRefreshBanner('notifications');
+    }
+
+    adjustPendingCount(delta) {
+        document.querySelectorAll('[data-live="pending-count"]').forEach(element => {
+            const current = parseInt(element.textContent, 10) || 0;
+            element.textContent = Math.max(0, current + delta);
+        });
+    }
+
+    showRefreshBanner(name) {
+        const banner = document.querySelector(`[data-live-refresh="${name}"]`);
+        if (banner) {
+            banner.classList.remove('d-none');
+        }
+    }
+
+    showToast(message, category) {
+        if (!this.toastContainer) {
+            this.toastContainer = document.createElement('div');
+            this.toastContainer.className = 'toast-container position-fixed bottom-0 end-0 p-3';
+            document.body.appendChild(this.toastContainer);
+        }
+
+        const toast = document.createElement('div');
+        toast.className = `toast align-items-center text-bg-${category} border-0`;
+        toast.setAttribute('role', 'status');
+        toast.innerHTML = `
+            <div class="d-flex">
+                <div class="toast-body"></div>
+                <button type="button" class="btn-close btn-close-white me-2 m-auto" data-bs-dismiss="toast"></button>
+            </div>
+        `;
+        toast.querySelector('.toast-body').textContent = message;
+        this.toastContainer.appendChild(toast);
+
+        toast.addEventListener('hidden.bs.toast', () => toast.remove());
+        new bootstrap.Toast(toast, { delay: 6000 }).show();
+    }
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    const mode = document.body.dataset.liveUpdates;
+    if (mode === 'stream') {
+        new LiveUpdates(document.body.dataset.liveUrl).connect();
+    } else if (mode === 'poll') {
+        new LiveUpdates(document.body.dataset.liveUrl).poll(parseInt(document.body.dataset.liveInterval, 10) || 30);
+    }
+});
@@ -0,0 +1,16 @@
+/**
+ * Product photo modal shared by all pages
+ */
+
+function showProductPhoto(filename, code, name) {
+    const modal = document.getElementById('globalPhotoModal');
+    const modalTitle = document.getElementById('globalPhotoModalTitle');
+    const modalImage = document.getElementById('globalPhotoModalImage');
+    
+    modalTitle.textContent = `${code} - ${name}`;
+    modalImage.src = `/static/uploads/${filename}`;
+    modalImage.alt = `Foto do produto ${name}`;
+    
+    const photoModal = new bootstrap.Modal(modal);
+    photoModal.show();
+}
@@ -0,0 +1,223 @@
+/**
+ * Product picker of the allocation and request forms
+ * Search box with results, selected product card and stock check of the quantity
+ *
+ * Markup: a form with data-product-picker whose elements carry
+ * data-picker="search|results|product-id|info|details|quantity|stock-info|submit",
+ * plus the optional "work-number" and "clear".
+ * data-strict blocks quantities above the stock and requires a work number;
+ * data-selected holds a preselected product as JSON.
+ */
+
+class ProductPicker {
+    constructor(form) {
+        this.form = form;
+        this.strict = form.hasAttribute('data-strict');
+        this.selected = null;
+        this.products = [];
+        this.searchTimeout = null;
+
+        const part = name => form.querySelector(`[data-picker="${name}"]`);
+        this.search = part('search');
+        this.results = part('results');
+        this.productId = part('product-id');
+        this.info = part('info');
+        this.details = part('details');
+        this.quantity = part('quantity');
+        this.stockInfo = part('stock-info');
+        this.submit = part('submit');
+        this.workNumber = part('work-number');
+
+        this.search.addEventListener('input', () => this.onInput());
+        this.quantity.addEventListener('input', () => {
+            this.updateStockInfo();
+            this.updateSubmitButton();
+        });
+        if (this.workNumber) {
+            this.workNumber.addEventListener('input', () => this.updateSubmitButton());
+        }
+        const clear = part('clear');
+        if (clear) {
+            clear.addEventListener('click', () => {
+                this.search.value = '';
+                this.hideResults();
+                this.clearSelection();
+                this.search.focus();
+            });
+        }
+        this.results.addEventListener('click', e => {
+            const item = e.target.closest('.search-result-item');
+            if (item) {
+                this.select(this.products[item.dataset.index]);
+            }
+        });
+        document.addEventListener('click', e => {
+            if (!this.search.contains(e.target) && !this.results.contains(e.target)) {
+                this.hideResults();
+            }
+        });
+
+        if (form.dataset.selected) {
+            this.selected = JSON.parse(form.dataset.selected);
+            this.updateStockInfo();
+        }
+        this.updateSubmitButton();
+    }
+
+    onInput() {
+        const query = this.search.value.trim();
+        clearTimeout(this.searchTimeout);
+
+        if (query.length < 2) {
+            this.hideResults();
+            this.clearSelection();
+            return;
+        }
+
+        const local = productSearch.cached(query);
+        if (local) {
+            this.showResults(local);
+            return;
+        }
+        this.searchTimeout = setTimeout(() => {
+            productSearch.search(query)
+                .then(products => this.showResults(products))
+                .catch(error => {
+                    console.error('Erro na busca:', error);
+                    this.hideResults();
+                });
+        }, 300);
+    }
+
+    showResults(products) {
+        this.products = products;
+        if (products.length === 0) {
+            this.results.innerHTML = '<div class="p-2 text-muted">Nenhum produto encontrado</div>';
+        } else {
+            this.results.innerHTML = products.map((product, index) => this.resultItem(product, index)).join('');
+        }
+        this.results.style.display = 'block';
+    }
+
+    hideResults() {
+        this.results.style.display = 'none';
+    }
+
+    photo(product, size, stopPropagation) {
+        const click = `${stopPropagation ? 'event.stopPropagation(); ' : ''}showProductPhoto(this.dataset.photo, this.dataset.code, this.dataset.name)`;
+        return `<div class="me-3">
+            <img src="/uploads/${encodeURIComponent(product.photo_filename)}"
+                 alt="Foto do produto"
+                 class="img-thumbnail product-photo"
+                 style="width: ${size}px; height: ${size}px; object-fit: cover; cursor: pointer;"
+                 data-photo="${escapeHtml(product.photo_filename)}" data-code="${escapeHtml(product.code)}" data-name="${escapeHtml(product.name)}"
+                 onclick="${click}"
+                 title="Clique para ampliar">
+        </div>`;
+    }
+
+    resultItem(product, index) {
+        const placeholder = `<div class="me-3">
+            <div class="d-flex align-items-center justify-content-center bg-secondary text-white rounded"
+                 style="width: 50px; height: 50px; font-size: 20px;">
+                <i class="fas fa-box"></i>
+            </div>
+        </div>`;
+        return `
+        <div class="search-result-item p-2 border-bottom" style="cursor: pointer; background-color: var(--bs-body-bg); border-color: var(--custom-border-color);" data-index="${index}">
+            <div class="d-flex align-items-center justify-content-between">
+                <div class="d-flex align-items-center">
+                    ${product.photo_filename ? this.photo(product, 50, true) : placeholder}
+                    <div>
+                        <strong style="color: var(--bs-primary);">${escapeHtml(product.code)}</strong> - <span style="color: var(--bs-body-color);">${escapeHtml(product.name)}</span>
+                        <br><small class="text-muted">
+                            ${product.supplier_reference ? escapeHtml(product.supplier_reference) + ' - ' : ''}
+                            ${escapeHtml(product.supplier_name)} | Local: ${escapeHtml(product.location)}
+                        </small>
+                    </div>
+                </div>
+                <div class="text-end">
+                    <span class="badge bg-${product.quantity > 0 ? 'success' : 'danger'}">
+                        ${product.quantity} ${escapeHtml(product.unit)}
+                    </span>
+                </div>
+            </div>
+        </div>`;
+    }
+
+    select(product) {
+        this.selected = product;
+        this.search.value = `${product.code} - ${product.name}`;
+        this.productId.value = product.id;
+
+        this.details.innerHTML = `
+            <div class="d-flex align-items-start">
+                ${product.photo_filename ? this.photo(product, 80, false) : ''}
+                <div class="flex-grow-1">
+                    <strong>${escapeHtml(product.code)}</strong> - ${escapeHtml(product.name)}<br>
+                    <small>Fornecedor: ${escapeHtml(product.supplier_name)} | Local: ${escapeHtml(product.location)}</small><br>
+                    <span class="badge bg-${product.quantity > 0 ? 'success' : 'danger'}">
+                        Estoque: ${product.quantity} ${escapeHtml(product.unit)}
+                    </span>
+                </div>
+            </div>
+        `;
+        this.info.style.display = 'block';
+        this.hideResults();
+
+        this.updateStockInfo();
+        this.updateSubmitButton();
+    }
+
+    clearSelection() {
+        this.selected = null;
+        this.productId.value = '';
+        this.info.style.display = 'none';
+        this.stockInfo.textContent = '';
+        this.updateSubmitButton();
+    }
+
+    updateStockInfo() {
+        if (!this.selected) return;
+
+        const quantity = parseFloat(this.quantity.value) || 0;
+        const available = this.selected.quantity;
+        const unit = this.selected.unit;
+
+        if (quantity > available) {
+            this.stockInfo.textContent = this.strict
+                ? `⚠️ Quantidade indisponível! Estoque: ${available} ${unit}`
+                : `⚠️ Quantidade solicitada excede estoque disponível! Estoque: ${available} ${unit}`;
+            this.stockInfo.className = this.strict ? 'form-text text-danger' : 'form-text text-warning';
+        } else if (quantity > 0) {
+            this.stockInfo.textContent = `✓ Quantidade disponível. Estoque atual: ${available} ${unit}`;
+            this.stockInfo.className = 'form-text text-success';
+        } else {
+            this.stockInfo.textContent = `Estoque disponível: ${available} ${unit}`;
+            this.stockInfo.className = 'form-text text-muted';
+        }
+    }
+
+    updateSubmitButton() {
+        let ready = Boolean(this.selected && this.productId.value);
+        if (this.strict) {
+            const quantity = parseFloat(this.quantity.value) || 0;
+            ready = ready && this.workNumber.value.trim().length > 0 &&
+                quantity > 0 && quantity <= this.selected.quantity;
+        }
+        this.submit.disabled = !ready;
+    }
+}
+
+// Also escapes quotes: values end up in attributes too
+function escapeHtml(text) {
+    return String(text == null ? '' : text).replace(/[&<>"']/g, char => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[char]);
+}
+
+window.ProductPicker = ProductPicker;
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('[data-product-picker]').forEach(form => new ProductPicker(form));
+});
@@ -0,0 +1,234 @@
+/**
+ * Scanner station
+ * A barcode or QR reader types the product code and Enter into the code
+ * field; each read is one request to /api/v1/scan: a lookup, or the
+ * allocation, adjustment or count of the chosen mode. Counts wait for
+ * the counted quantity, sent with Enter in its own field.
+ *
+ * Markup: an element with data-scan-station (data-warehouses holds the
+ * [id, label] pairs); fields shown per mode carry data-scan-modes.
+ */
+
+const SCAN_ENDPOINTS = {
+    allocate: '/api/v1/scan/allocate',
+    adjust: '/api/v1/scan/adjust',
+    count: '/api/v1/scan/count',
+};
+
+const SCAN_DONE = {
+    created: 'Alocado',
+    duplicate: 'Alocação já registrada',
+    adjusted: 'Estoque ajustado',
+    counted: 'Contagem registrada',
+};
+
+class ScanStation {
+    constructor(root) {
+        this.root = root;
+        this.warehouses = new Map(JSON.parse(root.dataset.warehouses || '[]'));
+        this.busy = false;
+        this.pendingKey = null;
+        this.countCode = null;
+
+        const field = id => root.querySelector(`#scan-${id}`);
+        this.code = field('code');
+        this.counted = field('counted');
+        this.warehouse = field('warehouse');
+        this.work = field('work');
+        this.adjustment = field('adjustment');
+        this.quantity = field('quantity');
+        this.notes = field('notes');
+        this.message = field('message');
+        this.result = field('result');
+        this.sites = field('sites');
+        this.history = field('history');
+
+        root.querySelectorAll('input[name="scan-mode"]').forEach(radio => {
+            radio.addEventListener('change', () => this.showMode());
+        });
+        this.code.addEventListener('keydown', e => {
+            if (e.key === 'Enter') {
+                e.preventDefault();
+                this.onScan();
+            }
+        });
+        this.counted.addEventListener('keydown', e => {
+            if (e.key === 'Enter') {
+                e.preventDefault();
+                this.sendCount();
+            }
+        });
+        this.showMode();
+    }
+
+    get mode() {
+        return this.root.querySelector('input[name="scan-mode"]:checked').value;
+    }
+
+    showMode() {
+        this.root.querySelectorAll('[data-scan-modes]').forEach(element => {
+            element.classList.toggle('d-none', !element.dataset.scanModes.split(' ').includes(this.mode));
+        });
+        this.countCode = null;
+        this.code.focus();
+    }
+
+    warehouseId() {
+        return this.warehouse ? parseInt(this.warehouse.value, 10) : null;
+    }
+
+    onScan() {
+        const code = this.code.value.trim();
+        if (!code || this.busy) {
+            return;
+        }
+        this.code.value = '';
+        if (this.mode === 'lookup') {
+            this.request(code, `/api/v1/scan/${encodeURIComponent(code)}`);
+        } else if (this.mode === 'count') {
+            // The count goes out with the quantity; the code waits for it
+            this.countCode = code;
+            this.showMessage(`Código ${code}: informe a quantidade contada.`, 'info');
+            this.counted.value = '';
+            this.counted.focus();
+        } else {
+            this.send(code, this.mode === 'allocate' ? {
+                work_number: this.work.value,
+                quantity: this.quantity.value,
+                idempotency_key: this.keyFor(code),
+            } : {
+                adjustment_type: this.adjustment.value,
+                quantity: this.quantity.value,
+                notes: this.notes.value,
+            });
+        }
+    }
+
+    keyFor(code) {
+        // Kept until an answer arrives, so reading the same code again after
+        // a lost answer does not allocate twice
+        if (!this.pendingKey || this.pendingKey.code !== code) {
+            this.pendingKey = {code: code, key: ScanStation.newKey()};
+        }
+        return this.pendingKey.key;
+    }
+
+    sendCount() {
+        if (!this.countCode || this.counted.value === '' || this.busy) {
+            return;
+        }
+        const code = this.countCode;
+        this.countCode = null;
+        this.send(code, {counted: this.counted.value, notes: this.notes.value});
+        this.code.focus();
+    }
+
+    send(code, fields) {
+        const body = Object.assign({code: code, warehouse_id: this.warehouseId()}, fields);
+        this.request(code, SCAN_ENDPOINTS[this.mode], {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(body),
+        });
+    }
+
+    request(code, url, options) {
+        this.busy = true;
+        fetch(url, options)
+            .then(response => response.json().then(data => ({ok: response.ok, data: data})))
+            .then(({ok, data}) => {
+                this.pendingKey = null;
+                if (data.product) {
+                    this.showProduct(data.product);
+                } else if (ok) {
+                    this.showProduct(data);
+                }
+                if (!ok) {
+                    this.fail(code, data.error || ScanStation.formErrors(data.errors));
+                } else if (data.status) {
+                    this.done(code, SCAN_DONE[data.status] + (data.allocation_id ? ` (#${data.allocation_id})` : ''));
+                } else {
+                    this.hideMessage();
+                }
+            })
+            .catch(error => {
+                console.error('Erro na leitura:', error);
+                this.fail(code, 'Falha de comunicação. Leia o código novamente.');
+            })
+            .finally(() => {
+                this.busy = false;
+                if (this.mode !== 'count' || !this.countCode) {
+                    this.code.focus();
+                }
+            });
+    }
+
+    showProduct(product) {
+        this.result.classList.remove('d-none');
+        this.result.querySelectorAll('[data-scan-field]').forEach(element => {
+            element.textContent = product[element.dataset.scanField] || '';
+        });
+        this.sites.replaceChildren(...product.sites.map(site => {
+            const row = document.createElement('tr');
+            [this.warehouses.get(site.warehouse_id) || `#${site.warehouse_id}`,
+             `${site.quantity} ${product.unit}`, `${site.available} ${product.unit}`].forEach((text, index) => {
+                const cell = document.createElement('td');
+                cell.textContent = text;
+                if (index) {
+                    cell.className = 'text-end';
+                }
+                row.appendChild(cell);
+            });
+            return row;
+        }));
+    }
+
+    done(code, text) {
+        this.showMessage(`${code}: ${text}`, 'success');
+        this.log(code, text, 'success');
+    }
+
+    fail(code, text) {
+        this.showMessage(`${code}: ${text}`, 'danger');
+        this.log(code, text, 'danger');
+    }
+
+    showMessage(text, category) {
+        this.message.className = `alert alert-${category}`;
+        this.message.textContent = text;
+    }
+
+    hideMessage() {
+        this.message.className = 'alert d-none';
+    }
+
+    log(code, text, category) {
+        const item = document.createElement('li');
+        item.className = `list-group-item list-group-item-${category}`;
+        item.textContent = `${new Date().toLocaleTimeString('pt-BR')} · ${code} · ${text}`;
+        this.history.prepend(item);
+        while (this.history.children.length > 20) {
+            this.history.lastChild.remove();
+        }
+    }
+
+    static formErrors(errors) {
+        return Object.values(errors || {}).flat().join(' ') || 'Erro na operação.';
+    }
+
+    static newKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID().replace(/-/g, '');
+        }
+        return Date.now().toString(16) + Math.random().toString(16).slice(2);
+    }
+}
+
+window.ScanStation = ScanStation;
+
+document.addEventListener('DOMContentLoaded', function() {
+    const root = document.querySelector('[data-scan-station]');
+    if (root) {
+        new ScanStation(root);
+    }
+});
@@ -0,0 +1,56 @@
+/**
+ * Work number suggestions
+ * Inputs with data-work-autocomplete get a datalist of the open works
+ * starting with what was typed (/api/works/search).
+ */
+
+class WorkAutocomplete {
+    constructor(input) {
+        this.input = input;
+        this.answers = new Map();
+        this.timeout = null;
+
+        this.list = document.createElement('datalist');
+        this.list.id = `${input.id || input.name}-works`;
+        input.after(this.list);
+        input.setAttribute('list', this.list.id);
+        input.setAttribute('autocomplete', 'off');
+        input.addEventListener('input', () => this.onInput());
+    }
+
+    onInput() {
+        const query = this.input.value.trim().toUpperCase();
+        clearTimeout(this.timeout);
+        if (!query) {
+            this.show([]);
+            return;
+        }
+        if (this.answers.has(query)) {
+            this.show(this.answers.get(query));
+            return;
+        }
+        this.timeout = setTimeout(() => {
+            fetch(`/api/works/search?q=${encodeURIComponent(query)}`)
+                .then(response => response.ok ? response.json() : [])
+                .then(numbers => {
+                    this.answers.set(query, numbers);
+                    this.show(numbers);
+                })
+                .catch(error => console.error('Erro na busca de obras:', error));
+        }, 200);
+    }
+
+    show(numbers) {
+        this.list.replaceChildren(...numbers.map(number => {
+            const option = document.createElement('option');
+            option.value = number;
+            return option;
+        }));
+    }
+}
+
+window.WorkAutocomplete = WorkAutocomplete;
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('[data-work-autocomplete]').forEach(input => new WorkAutocomplete(input));
+});
@@ -0,0 +1,317 @@
+import random
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from cache import request_cached
+from changes import Change, on_commit, publish
+from models import Product, Warehouse, StockLevel, StockHold, ChangeLogEntry
+from timeutils import utcnow
+
+# Upper bound for split counters of a single product at one site
+MAX_STOCK_SLOTS = 16
+
+
+@request_cached
+def active_warehouses():
+    return Warehouse.query.filter_by(is_active=True).order_by(Warehouse.id).all()
+
+
+def default_warehouse():
+    """First active warehouse, used when a movement or request names no site"""
+    warehouses = active_warehouses()
+    return warehouses[0] if warehouses else None
+
+
+def warehouse_choices():
+    return [(warehouse.id, f'{warehouse.code} - {warehouse.name}') for warehouse in active_warehouses()]
+
+
+def resolve_warehouse(warehouse_id):
+    """Active warehouse for a submitted id, falling back to the default site"""
+    if warehouse_id:
+        return next((w for w in active_warehouses() if w.id == warehouse_id), None)
+    return default_warehouse()
+
+
+def site_quantity(product_id, warehouse_id):
+    return db.session.query(func.coalesce(func.sum(StockLevel.quantity), 0)).filter(
+        StockLevel.product_id == product_id,
+        StockLevel.warehouse_id == warehouse_id
+    ).scalar()
+
+
+def site_available(product_id, warehouse_id):
+    """Stock at a site not held by pending requests"""
+    return db.session.query(func.coalesce(func.sum(StockLevel.quantity - StockLevel.reserved), 0)).filter(
+        StockLevel.product_id == product_id,
+        StockLevel.warehouse_id == warehouse_id
+    ).scalar()
+
+
+def site_quantities(product_ids):
+    """{product_id: {warehouse_id: quantity}} for a set of products, in one query"""
+    result = {}
+    if not product_ids:
+        return result
+    rows = db.session.query(
+        StockLevel.product_id, StockLevel.warehouse_id, func.sum(StockLevel.quantity)
+    ).filter(StockLevel.product_id.in_(product_ids)).group_by(
+        StockLevel.product_id, StockLevel.warehouse_id
+    ).all()
+    for product_id, warehouse_id, quantity in rows:
+        result.setdefault(product_id, {})[warehouse_id] = quantity
+    return result
+
+
+def site_stock(product_id):
+    """{warehouse_id: (quantity, available)} of one product, in one query"""
+    rows = db.session.query(
+        StockLevel.warehouse_id, func.sum(StockLevel.quantity), func.sum(StockLevel.quantity - StockLevel.reserved)
+    ).filter(StockLevel.product_id == product_id).group_by(StockLevel.warehouse_id).all()
+    return {warehouse_id: (quantity, max(available, 0)) for warehouse_id, quantity, available in rows}
+
+
+def _new_quantity(previous, movement_type, quantity):
+    if movement_type == 'add':
+        return previous + quantity
+    if movement_type in ('remove', 'allocation'):
+        return max(0, previous - quantity)
+    if movement_type == 'count':
+        # Physical count: quantity is the counted stock
+        return max(0, quantity)
+    return previous
+
+
+def _site_levels(product, warehouse, lock=False):
+    """Slot rows of a product at one site, created on first use"""
+    query = StockLevel.query.filter_by(product_id=product.id, warehouse_id=warehouse.id).order_by(StockLevel.slot)
+    if lock:
+        query = query.with_for_update().populate_existing()
+    levels = query.all()
+
+    missing = set(range(product.stock_slots)) - {level.slot for level in levels}
+    if missing:
+        try:
+            with db.session.begin_nested():
+                for slot in sorted(missing):
+                    db.session.add(StockLevel(product_id=product.id, warehouse_id=warehouse.id, slot=slot, quantity=0))
+        except IntegrityError:
+            # Another request created the rows first
+            pass
+        levels = query.all()
+    return levels
+
+
+def move_stock(product, warehouse, movement_type, quantity):
+    """Apply a stock movement at one site and keep the catalog total in step
+
+    Returns the site quantity before and after the movement. Ordinary
+    products lock the product row and then their single site row, so the
+    total is updated in the same transaction. Products with split counters
+    lock only one of their slot rows; their total is refreshed right after
+    the commit (see refresh_stock_totals).
+    """
+    if product.stock_slots > 1:
+        return _move_split(product, warehouse, movement_type, quantity)
+
+    total = db.session.query(Product.quantity).filter_by(id=product.id).with_for_update().scalar()
+    level = _site_levels(product, warehouse, lock=True)[0]
+    previous = level.quantity
+    new = _new_quantity(previous, movement_type, quantity)
+    level.quantity = new
+    product.quantity = (product.quantity if total is None else total) + new - previous
+    return previous, new
+
+
+def _move_split(product, warehouse, movement_type, quantity):
+    levels = _site_levels(product, warehouse)
+    previous = sum(level.quantity for level in levels)
+    delta = _new_quantity(previous, movement_type, quantity) - previous
+
+    if movement_type == 'count':
+        delta = _rebalance(product, warehouse, previous + delta) - previous
+    elif delta > 0:
+        level = _lock_level(random.choice(levels).id)
+        level.quantity += delta
+    elif delta < 0:
+        delta = -_take(product, warehouse, -delta)
+    return previous, previous + delta
+
+
+def _lock_level(level_id):
+    return StockLevel.query.filter_by(id=level_id).with_for_update().populate_existing().one()
+
+
+def _free_slot(product, warehouse, amount):
+    # Any slot with enough unreserved stock will do; skipping rows other
+    # requests hold is what spreads concurrent allocations over the slots
+    return StockLevel.query.filter(
+        StockLevel.product_id == product.id,
+        StockLevel.warehouse_id == warehouse.id,
+        StockLevel.quantity - StockLevel.reserved >= amount
+    ).order_by(func.random()).limit(1).with_for_update(skip_locked=True).populate_existing().first()
+
+
+def _take(product, warehouse, amount):
+    level = _free_slot(product, warehouse, amount)
+    if level:
+        level.quantity -= amount
+        return amount
+
+    # Spread over the slots, leaving the units held by pending requests
+    taken = 0
+    for level in _site_levels(product, warehouse, lock=True):
+        part = min(max(level.quantity - level.reserved, 0), amount - taken)
+        level.quantity -= part
+        taken += part
+        if taken == amount:
+            break
+    return taken
+
+
+def _rebalance(product, warehouse, total):
+    """Spread a site quantity evenly over the product's slots; returns the new site total"""
+    levels = _site_levels(product, warehouse, lock=True)
+    base, extra = divmod(total, product.stock_slots)
+    for level in levels:
+        if level.slot >= product.stock_slots:
+            level.quantity = 0
+        else:
+            level.quantity = base + (1 if level.slot < extra else 0)
+    return total
+
+
+def set_stock_slots(product, slots):
+    """Change the number of split counters of a product, rebalancing every site"""
+    if not 1 <= slots <= MAX_STOCK_SLOTS:
+        raise ValueError(f'slots must be between 1 and {MAX_STOCK_SLOTS}')
+
+    warehouse_ids = {level.warehouse_id for level in product.stock_levels}
+    product.stock_slots = slots
+    for warehouse in Warehouse.query.filter(Warehouse.id.in_(warehouse_ids)).all():
+        levels = _site_levels(product, warehouse, lock=True)
+        _rebalance(product, warehouse, sum(level.quantity for level in levels))
+        first = levels[0]
+        for level in levels:
+            if level.slot >= slots:
+                # Holds on removed slots move to the first one
+                StockHold.query.filter_by(stock_level_id=level.id).update({'stock_level_id': first.id})
+                first.reserved += level.reserved
+                db.session.delete(level)
+
+
+def place_hold(allocation, product, warehouse):
+    """Reserve stock at a site for a pending request
+
+    Returns the hold, or None when the site does not have enough stock
+    free of other holds. Runs in the caller's transaction, so the hold is
+    committed together with the request.
+    """
+    amount = allocation.quantity
+    if product.stock_slots > 1:
+        level = _free_slot(product, warehouse, amount)
+        if level is None:
+            levels = _site_levels(product, warehouse, lock=True)
+            if sum(level.quantity - level.reserved for level in levels) < amount:
+                return None
+            level = max(levels, key=lambda level: level.quantity - level.reserved)
+    else:
+        reserved = db.session.query(Product.reserved_quantity).filter_by(id=product.id).with_for_update().scalar()
+        level = _site_levels(product, warehouse, lock=True)[0]
+        if level.quantity - level.reserved < amount:
+            return None
+        product.reserved_quantity = reserved + amount
+
+    level.reserved += amount
+    hold = StockHold(
+        allocation=allocation,
+        product_id=product.id,
+        warehouse_id=warehouse.id,
+        stock_level_id=level.id,
+        quantity=amount,
+        expires_at=utcnow() + timedelta(hours=current_app.config['RESERVATION_TTL_HOURS'])
+    )
+    db.session.add(hold)
+    return hold
+
+
+def release_hold(hold):
+    """Give the held stock back; returns False if the hold was already released"""
+    product = db.session.get(Product, hold.product_id)
+    if product.stock_slots == 1:
+        reserved = db.session.query(Product.reserved_quantity).filter_by(id=product.id).with_for_update().scalar()
+    # Same lock order as place_hold and approvals: product, stock row, hold
+    level = _lock_level(hold.stock_level_id)
+    if StockHold.query.filter_by(id=hold.id).with_for_update().first() is None:
+        return False
+
+    level.reserved = max(0, level.reserved - hold.quantity)
+    if product.stock_slots == 1:
+        product.reserved_quantity = max(0, reserved - hold.quantity)
+    db.session.delete(hold)
+    return True
+
+
+def expire_holds(batch_size=500):
+    """Release holds past their expiry date; returns how many were released"""
+    released = 0
+    while True:
+        holds = StockHold.query.filter(StockHold.expires_at < utcnow()).order_by(StockHold.id).limit(batch_size).all()
+        if not holds:
+            return released
+        for hold in holds:
+            if release_hold(hold):
+                released += 1
+        db.session.commit()
+        if len(holds) < batch_size:
+            return released
+
+
+def refresh_stock_totals(product_ids):
+    """Recompute catalog totals from the per-site stock of the given products"""
+    products = Product.__table__
+    levels = StockLevel.__table__
+    changes = []
+
+    with db.engine.begin() as connection:
+        for product_id in sorted(product_ids):
+            # Lock the product first so the sum below sees every committed slot
+            code = connection.execute(
+                select(products.c.code).where(products.c.id == product_id).with_for_update()
+            ).scalar()
+            if code is None:
+                continue
+            total, reserved = connection.execute(
+                select(func.coalesce(func.sum(levels.c.quantity), 0), func.coalesce(func.sum(levels.c.reserved), 0))
+                .where(levels.c.product_id == product_id)
+            ).one()
+            result = connection.execute(
+                update(products)
+                .where(products.c.id == product_id,
+                       (products.c.quantity != total) | (products.c.reserved_quantity != reserved))
+                .values(quantity=total, reserved_quantity=reserved, updated_at=utcnow())
+            )
+            if result.rowcount:
+                connection.execute(ChangeLogEntry.__table__.insert().values(
+                    entity='product', entity_id=product_id, op='update', created_at=utcnow()
+                ))
+                changes.append(Change('Product', product_id, 'update', {'code': code, 'quantity': total},
+                                      frozenset({'quantity', 'reserved_quantity', 'updated_at'})))
+
+    if changes:
+        publish(changes)
+    return changes
+
+
+@on_commit
+def _refresh_split_totals(changes):
+    # Ordinary products had their totals updated in the committed transaction
+    updated = {
+        change.id for change in changes
+        if change.model == 'Product' and change.changed & {'quantity', 'reserved_quantity'}
+    }
+    stale = {change.attrs['product_id'] for change in changes if change.model == 'StockLevel'} - updated
+    if stale:
+        refresh_stock_totals(stale)
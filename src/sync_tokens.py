@@ -0,0 +1,48 @@
+"""Change tokens handed to sync clients
+
+A token is a change_log id: the client has seen every change up to it.
+Ids are assigned when a row is inserted, not when its transaction
+commits, so a slow transaction can commit id N after a reader already
+saw N + 1. Tokens therefore stop at the newest change older than
+SYNC_SAFETY_LAG; changes newer than that are still sent, and sent again
+on the next call, which is harmless because clients apply them by id.
+"""
+from datetime import timedelta
+from sqlalchemy import column, func, select, table
+from timeutils import UTCDateTime, utcnow
+
+# A transaction still open after this long could commit behind a token
+SYNC_SAFETY_LAG = timedelta(minutes=2)
+
+change_log = table(
+    'change_log',
+    column('id'), column('entity'), column('entity_id'), column('created_at', UTCDateTime),
+)
+
+
+def settled_token(connection, now=None):
+    """Newest change id no transaction still in flight can commit behind"""
+    cutoff = (now or utcnow()) - SYNC_SAFETY_LAG
+    return connection.execute(
+        select(func.max(change_log.c.id)).where(change_log.c.created_at < cutoff)
+    ).scalar() or 0
+
+
+def read_changes(connection, since, limit, entity='product', now=None):
+    """Changes after a token: ([(id, entity_id)], next token, more)
+
+    At most limit entries; more is only set when the client can ask again
+    right away, i.e. the token moved past every entry returned.
+    """
+    entries = connection.execute(
+        select(change_log.c.id, change_log.c.entity_id)
+        .where(change_log.c.id > since, change_log.c.entity == entity)
+        .order_by(change_log.c.id).limit(limit + 1)
+    ).all()
+    more = len(entries) > limit
+    entries = entries[:limit]
+    if not entries:
+        return entries, since, False
+
+    token = max(since, min(entries[-1][0], settled_token(connection, now)))
+    return entries, token, more and token == entries[-1][0]
@@ -0,0 +1,89 @@
+"""Sync tokens when transactions commit out of id order
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String
+from sync_tokens import SYNC_SAFETY_LAG, read_changes, settled_token
+from timeutils import UTCDateTime, utcnow
+
+metadata = MetaData()
+
+change_log = Table(
+    'change_log', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('entity', String(30), nullable=False),
+    Column('entity_id', Integer, nullable=False),
+    Column('op', String(10), nullable=False),
+    Column('created_at', UTCDateTime),
+)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    return engine
+
+
+def commit_change(engine, change_id, product_id, created_at):
+    with engine.begin() as connection:
+        connection.execute(change_log.insert().values(
+            id=change_id, entity='product', entity_id=product_id, op='update', created_at=created_at
+        ))
+
+
+def sync(engine, since, now):
+    with engine.connect() as connection:
+        entries, token, more = read_changes(connection, since, 100, now=now)
+    return [product_id for _, product_id in entries], token
+
+
+def test_change_committed_behind_a_newer_id_is_not_skipped(engine):
+    start = utcnow()
+    commit_change(engine, 1, 10, start - 2 * SYNC_SAFETY_LAG)
+    # Transaction A takes id 2 and is still open; B takes id 3 and commits first
+    a_inserted = start
+    commit_change(engine, 3, 30, a_inserted + timedelta(seconds=1))
+
+    now = a_inserted + timedelta(seconds=5)
+    changed, token = sync(engine, 0, now)
+    assert changed == [10, 30]
+    assert token == 1
+
+    # A commits; the client asks again from the token it was given
+    commit_change(engine, 2, 20, a_inserted)
+    changed, token = sync(engine, token, now + timedelta(seconds=1))
+    assert changed == [20, 30]
+    assert token == 1
+
+    changed, token = sync(engine, token, now + SYNC_SAFETY_LAG)
+    assert changed == [20, 30]
+    assert token == 3
+    assert sync(engine, token, now + SYNC_SAFETY_LAG) == ([], 3)
+
+
+def test_snapshot_token_stops_before_recent_changes(engine):
+    start = utcnow()
+    commit_change(engine, 1, 10, start)
+    commit_change(engine, 3, 30, start + timedelta(seconds=30))
+    with engine.connect() as connection:
+        assert settled_token(connection, now=start + timedelta(seconds=31)) == 0
+        assert settled_token(connection, now=start + SYNC_SAFETY_LAG + timedelta(seconds=1)) == 1
+        assert settled_token(connection, now=start + SYNC_SAFETY_LAG + timedelta(seconds=31)) == 3
+
+
+def test_more_only_when_the_token_covers_the_page(engine):
+    old = utcnow() - 2 * SYNC_SAFETY_LAG
+    for change_id in range(1, 4):
+        commit_change(engine, change_id, change_id, old)
+    commit_change(engine, 4, 4, utcnow())
+    with engine.connect() as connection:
+        assert read_changes(connection, 0, 2)[1:] == (2, True)
+        assert read_changes(connection, 2, 2)[1:] == (3, False)
@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from sqlalchemy.types import TypeDecorator, DateTime
+
+# Loaded once; timestamps are stored in UTC and only converted for display
+BRAZIL_TZ = ZoneInfo('America/Sao_Paulo')
+
+
+def utcnow():
+    """Current time as a timezone-aware UTC datetime"""
+    return datetime.now(timezone.utc)
+
+
+def to_local(value):
+    """Convert a stored UTC datetime to Brazil local time"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(BRAZIL_TZ)
+
+
+def localtime_filter(value, fmt=None):
+    """Jinja filter: render a UTC datetime in Brazil local time"""
+    local = to_local(value)
+    if local is None:
+        return ''
+    return local.strftime(fmt) if fmt else local
+
+
+class UTCDateTime(TypeDecorator):
+    """DateTime column that always stores and returns timezone-aware UTC
+
+    PostgreSQL uses ``timestamp with time zone``; SQLite has no timezone
+    support, so values are stored there as naive UTC.
+    """
+
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            raise ValueError('UTCDateTime requires timezone-aware datetimes')
+        value = value.astimezone(timezone.utc)
+        if dialect.name == 'sqlite':
+            value = value.replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
@@ -1,4 +1,6 @@
 import os
+import re
+import unicodedata
 import uuid
 from werkzeug.utils import secure_filename
 from flask import current_app
@@ -6,6 +8,7 @@ import secrets
 from datetime import datetime, timedelta
 from flask_mail import Message
 from app import mail
+from concurrency import offload
 
 def allowed_file(filename):
     """Check if the file extension is allowed"""
@@ -34,7 +37,7 @@ def save_uploaded_file(file):
 
             # Save file
             filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(filepath)
+            offload(file.save, filepath)
 
             # Verify file was saved
             if os.path.exists(filepath):
@@ -52,7 +55,7 @@ def delete_uploaded_file(filename):
     if filename:
         file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
         if os.path.exists(file_path):
-            os.remove(file_path)
+            offload(os.remove, file_path)
 
 def generate_reset_token():
     """Generate a secure reset token"""
@@ -90,6 +93,35 @@ Equipe do Sistema de Estoque
         current_app.logger.error(f"Erro ao enviar email de redefinição: {e}")
         return False
 
+def send_notification_email(user, notification):
+    """Send a notification digest by email"""
+    try:
+        msg = Message(
+            f'{notification.title} - Sistema de Estoque',
+            recipients=[user.email]
+        )
+
+        notifications_url = f"{current_app.config.get('BASE_URL', 'http://localhost:5000')}/notifications"
+        lines = '\n'.join(f'- {line}' for line in notification.lines)
+
+        msg.body = f'''
+Olá {user.username},
+
+{lines}
+
+Para ver suas notificações e gerenciar o que você acompanha, acesse:
+{notifications_url}
+
+Atenciosamente,
+Equipe do Sistema de Estoque
+        '''
+
+        mail.send(msg)
+        return True
+    except Exception as e:
+        current_app.logger.error(f"Erro ao enviar email de notificação: {e}")
+        return False
+
 def format_quantity(quantity, unit):
     """Format quantity with unit for display"""
     quantity_str = str(int(quantity))  # Convert to integer string
@@ -101,21 +133,57 @@ def format_quantity(quantity, unit):
     }
     return f"{quantity_str} {unit_display.get(unit, unit)}"
 
-def log_stock_movement(product, user, movement_type, quantity, notes=""):
-    """Log stock movement for audit trail"""
+def normalize_location(location):
+    """Turn a free-text location into a sortable path, e.g. 'a-3-12' -> 'A/0003/0012'
+
+    Numeric segments are zero-padded so that plain string ordering of the
+    path follows the physical layout of aisles, shelves and bins.
+    """
+    segments = re.findall(r'[A-Za-z]+|\d+', location or '')
+    return '/'.join(
+        segment.zfill(4) if segment.isdigit() else segment.upper()
+        for segment in segments
+    )[:100]
+
+def normalize_work_number(number):
+    """Canonical form of a work number, e.g. ' ob 12.a ' -> 'OB-12-A'
+
+    Upper case without accents; runs of spaces, dots, underscores and
+    dashes become one dash and other punctuation except '/' is dropped, so
+    spelling variants of a number land on the same work.
+    """
+    decomposed = unicodedata.normalize('NFKD', number or '')
+    text = ''.join(char for char in decomposed if not unicodedata.combining(char)).upper()
+    text = re.sub(r'[^A-Z0-9/]+', lambda match: '-' if re.search(r'[\s._-]', match[0]) else '', text)
+    return text.strip('-')[:50]
+
+def log_stock_movement(product, user, movement_type, quantity, notes="", warehouse=None, unit_cost=None,
+                       allocation=None):
+    """Log stock movement for audit trail
+
+    Quantities recorded on the movement are those of the given warehouse
+    (the default site when omitted). Units added are valued at ``unit_cost``
+    (the current average when omitted); the cost of units taken out is
+    charged to ``allocation`` when given.
+    """
     from models import StockMovement
     from app import db
+    from stock import default_warehouse, move_stock
+    from costing import receive, consume, charge_allocation
+
+    warehouse = warehouse or default_warehouse()
+    previous_quantity, new_quantity = move_stock(product, warehouse, movement_type, quantity)
 
-    previous_quantity = product.quantity
+    if new_quantity > previous_quantity:
+        receive(product, new_quantity - previous_quantity, unit_cost)
+    elif new_quantity < previous_quantity:
+        cost = consume(product, previous_quantity - new_quantity)
+        if allocation is not None:
+            charge_allocation(allocation, cost)
 
-    if movement_type == 'add':
-        new_quantity = previous_quantity + quantity
-    elif movement_type == 'remove':
-        new_quantity = max(0, previous_quantity - quantity)
-    elif movement_type == 'allocation':
-        new_quantity = max(0, previous_quantity - quantity)
-    else:
-        new_quantity = previous_quantity
+    if movement_type == 'count':
+        # Physical count: quantity is the counted stock; record the difference
+        quantity = new_quantity - previous_quantity
 
     movement = StockMovement(
         product_id=product.id,
@@ -124,10 +192,10 @@ def log_stock_movement(product, user, movement_type, quantity, notes=""):
         quantity=quantity,
         previous_quantity=previous_quantity,
         new_quantity=new_quantity,
-        notes=notes
+        notes=notes,
+        warehouse_id=warehouse.id
     )
 
     db.session.add(movement)
-    product.quantity = new_quantity
 
-    return movement
\ No newline at end of file
+    return movement
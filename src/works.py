@@ -0,0 +1,63 @@
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import Work
+from timeutils import utcnow
+from utils import normalize_work_number
+
+# Suggestions returned by the autocomplete
+SUGGEST_LIMIT = 10
+
+
+def find_work(number):
+    return Work.query.filter_by(number=normalize_work_number(number)).first()
+
+
+def open_work(number):
+    """The work with this number, registered as open when new
+
+    Runs in the caller's transaction; two requests naming the same new
+    number at once end up with the same work.
+    """
+    number = normalize_work_number(number)
+    work = Work.query.filter_by(number=number).first()
+    if work is not None:
+        return work
+    try:
+        with db.session.begin_nested():
+            work = Work(number=number)
+            db.session.add(work)
+    except IntegrityError:
+        work = Work.query.filter_by(number=number).first()
+    return work
+
+
+def close_work(work):
+    work.status = 'closed'
+    work.closed_at = utcnow()
+
+
+def reopen_work(work):
+    work.status = 'open'
+    work.closed_at = None
+
+
+def number_prefix(prefix):
+    """Filter on the works whose number starts with a normalized prefix, using the index
+
+    Normalized numbers hold no LIKE or GLOB wildcards, so the prefix needs
+    no escaping.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return Work.number.like(f'{prefix}%')
+    # SQLite's LIKE ignores case and skips the index; GLOB does not
+    return Work.number.op('GLOB')(f'{prefix}*')
+
+
+def suggest(query, limit=SUGGEST_LIMIT):
+    """Numbers of the open works starting with the query"""
+    prefix = normalize_work_number(query)
+    if not prefix:
+        return []
+    return [number for (number,) in db.session.query(Work.number).filter(
+        number_prefix(prefix), Work.status == 'open'
+    ).order_by(Work.number).limit(limit)]